@@ -0,0 +1,235 @@
+"""对 Main 的各个指令做离线压测。
+
+所有上游（一言、EPIC、mcsrvstat、SauceNAO、moe 图床、mc 服务器）都由本地替身服务器回放
+`payloads/` 中录制的响应，可以注入延迟和错误。需要在安装了 AstrBot 的环境中运行::
+
+    python benchmarks/bench_commands.py -n 500 -c 16 --latency-ms 80 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import datetime
+import importlib
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import (  # noqa: E402
+    Faults,
+    FakeContext,
+    FakeEvent,
+    FakeJavaServer,
+    Recorder,
+    StandIn,
+    call_handler,
+    load_payload,
+    load_plugin,
+    run_load,
+)
+
+COMMANDS = [
+    "一言",
+    "一言 动画",
+    "喜加一",
+    "mcs",
+    "mcs 批量",
+    "moe",
+    "今天吃什么",
+    "早安晚安",
+    "喜报",
+    "搜番",
+    "睡眠统计",
+]
+
+
+def epic_payload() -> dict:
+    """把录制数据中的促销时间平移到当前时间附近"""
+    data = load_payload("epic.json")
+    now = datetime.datetime.now(datetime.timezone.utc)
+    fmt = "%Y-%m-%dT%H:%M:%S.000Z"
+    for game in data["data"]["Catalog"]["searchStore"]["elements"]:
+        promotions = game.get("promotions") or {}
+        for key, offset in (("promotionalOffers", -1), ("upcomingPromotionalOffers", 6)):
+            for group in promotions.get(key, []):
+                for offer in group["promotionalOffers"]:
+                    offer["startDate"] = (now + datetime.timedelta(days=offset)).strftime(fmt)
+                    offer["endDate"] = (now + datetime.timedelta(days=offset + 7)).strftime(fmt)
+    return data
+
+
+def make_images(count: int) -> list:
+    """生成互不相近的测试图片，避免搜番全部命中感知哈希缓存"""
+    from PIL import Image as PILImage
+
+    images = []
+    for i in range(count):
+        rng = random.Random(i)
+        img = PILImage.new("RGB", (32, 24))
+        img.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(32 * 24)])
+        buf = io.BytesIO()
+        img.resize((640, 480)).save(buf, format="JPEG", quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+async def start_stand_ins(args) -> tuple:
+    faults = Faults(args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate)
+    api = StandIn(faults)
+    hitokoto = load_payload("hitokoto.json")
+    saucenao = load_payload("saucenao.json")
+    # 压测的是插件本身，不模拟 SauceNAO 的配额
+    saucenao["header"].update(
+        short_limit="100000", short_remaining="100000", long_remaining="100000"
+    )
+    mcsrvstat = load_payload("mcsrvstat.json")
+    images = make_images(args.images)
+    counter = iter(range(1 << 62))
+
+    api.json(
+        "/hitokoto",
+        lambda r: {
+            **hitokoto,
+            "hitokoto": f"{hitokoto['hitokoto']} #{next(counter)}",
+            "type": r.query.get("c", hitokoto["type"]),
+        },
+    )
+    api.json("/epic", epic_payload())
+    api.json("/mcsrvstat/{address}", mcsrvstat)
+    api.json("/saucenao", saucenao, method="POST")
+    api.bytes("/moe/{n}", lambda r: images[int(r.match_info["n"]) % len(images)], "image/jpeg")
+    api.bytes(
+        "/image/{n}.jpg", lambda r: images[int(r.match_info["n"]) % len(images)], "image/jpeg"
+    )
+    await api.start()
+
+    servers = [FakeJavaServer(load_payload("mc_status.json"), faults) for _ in range(4)]
+    for server in servers:
+        await server.start()
+    return api, servers
+
+
+def redirect_upstreams(plugin, main, api: StandIn, concurrency: int) -> None:
+    """把 Main 的上游地址全部指向替身服务器"""
+    main.hitokoto_pool.url = api.url("/hitokoto")
+    main.epic.url = api.url("/epic")
+    main.mc_status.api_url = api.url("/mcsrvstat/")
+    main.saucenao_api_url = api.url("/saucenao")
+    mirrors = importlib.import_module(f"{plugin}.mirrors")
+    main.moe_mirrors = mirrors.MirrorSelector([api.url(f"/moe/{i}") for i in range(4)])
+    scheduler = main.saucenao_scheduler
+    scheduler.max_queue = scheduler.max_per_user = max(scheduler.max_queue, concurrency * 4)
+    for state in scheduler.keys:
+        state.capacity = state.tokens = 100000
+
+
+def build_calls(main, api: StandIn, servers: list, args, Image) -> dict:
+    users = args.users
+
+    def event(text: str, i: int, **kwargs) -> FakeEvent:
+        return FakeEvent(text, user_id=str(10000 + i % users), **kwargs)
+
+    async def search_anime(i: int):
+        # 每次使用不同的用户，先发指令再发图
+        user = f"sf{i}"
+        await call_handler(main.get_search_anime, FakeEvent("搜番", user_id=user))
+        image = Image.fromURL(api.url(f"/image/{i % args.images}.jpg"))
+        await main.handle_search_anime(FakeEvent("", user_id=user, components=[image]))
+
+    async def good_morning(i: int):
+        text = "晚安" if (i // users) % 2 == 0 else "早安"
+        await main.good_morning(event(text, i))
+
+    batch = " ".join(s.address for s in servers)
+    return {
+        "一言": lambda i: main.hitokoto(event("一言", i)),
+        "一言 动画": lambda i: main.hitokoto(event("一言 动画", i)),
+        "喜加一": lambda i: main.epic_free_game(event("喜加一", i)),
+        "mcs": lambda i: main.mcs(event(f"mcs {servers[0].address}", i)),
+        "mcs 批量": lambda i: main.mcs(event(f"mcs {batch}", i)),
+        "moe": lambda i: main.get_moe(event("moe", i)),
+        "今天吃什么": lambda i: main.what_to_eat(event("今天吃什么", i)),
+        "早安晚安": good_morning,
+        "喜报": lambda i: main.congrats(event(f"喜报 压测第 {i % 50} 条喜报", i)),
+        "搜番": search_anime,
+        "睡眠统计": lambda i: main.sleep_stats(event("睡眠统计", i)),
+    }
+
+
+async def run(args) -> None:
+    plugin = load_plugin()
+    # 以下导入需要 AstrBot 环境
+    main_module = importlib.import_module(f"{plugin}.main")
+    from astrbot.api.all import Image
+
+    api, servers = await start_stand_ins(args)
+    workdir = tempfile.TemporaryDirectory(prefix="essential-bench-")
+    cwd = os.getcwd()
+    # 插件的数据文件写在相对路径 data/ 下
+    os.chdir(workdir.name)
+    recorder = Recorder()
+    try:
+        config = {
+            "SAUCENAO_API_KEY": "bench",
+            "GOOD_MORNING_STORAGE": args.storage,
+            "MCS_RENDER_CARD": not args.text_mcs,
+            "THROTTLE_ENABLED": args.throttle,
+        }
+        main = main_module.Main(FakeContext(), config)
+        redirect_upstreams(plugin, main, api, args.concurrency)
+        calls = build_calls(main, api, servers, args, Image)
+        for name in args.commands:
+            if name == "睡眠统计" and args.storage != "sqlite":
+                continue
+            await run_load(recorder, name, calls[name], args.requests, args.concurrency)
+        await main.terminate()
+    finally:
+        os.chdir(cwd)
+        workdir.cleanup()
+        await api.close()
+        for server in servers:
+            await server.close()
+
+    print(recorder.report())
+    print()
+    print("上游请求数:", dict(api.requests))
+    print("mc 服务器 ping 次数:", sum(s.pings for s in servers))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-n", "--requests", type=int, default=200, help="每个指令的调用次数")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="并发数")
+    parser.add_argument("--latency-ms", type=float, default=0, help="上游注入延迟")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="延迟抖动")
+    parser.add_argument("--error-rate", type=float, default=0, help="上游错误概率")
+    parser.add_argument("--users", type=int, default=500, help="模拟的群成员数")
+    parser.add_argument("--images", type=int, default=64, help="搜番测试图片数")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--text-mcs", action="store_true", help="mcs 使用文字结果")
+    parser.add_argument(
+        "--throttle", action="store_true", help="启用指令限流和请求合并（默认关闭，否则大部分请求会被限流）"
+    )
+    parser.add_argument(
+        "--commands",
+        type=lambda s: s.split(","),
+        default=COMMANDS,
+        help=f"逗号分隔，可选: {','.join(COMMANDS)}",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出插件日志")
+    args = parser.parse_args()
+    unknown = set(args.commands) - set(COMMANDS)
+    if unknown:
+        parser.error(f"未知的指令: {','.join(unknown)}")
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    logging.getLogger("astrbot").setLevel(logging.INFO if args.verbose else logging.ERROR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""早晚安数据结构和存储在大群下的微基准。
+
+    python benchmarks/bench_good_morning.py --sizes 1000,10000,100000
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import Recorder, load_plugin  # noqa: E402
+
+
+def make_group(gm, size: int, now: int) -> dict:
+    rng = random.Random(size)
+    group = {}
+    for i in range(size):
+        night = now - rng.randrange(3 * 86400)
+        morning = night + rng.randrange(4 * 3600, 10 * 3600) if rng.random() < 0.6 else 0
+        group[str(100000 + i)] = gm.SleepRecord(night, min(morning, now))
+    return group
+
+
+async def timed(recorder: Recorder, name: str, coro_func, repeat: int) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        t = time.perf_counter()
+        await coro_func()
+        recorder.record(name, time.perf_counter() - t)
+    recorder.wall[name] = time.perf_counter() - start
+
+
+async def bench_size(gm, gms, recorder: Recorder, size: int, repeat: int, workdir: str) -> None:
+    now = int(time.time())
+    day = gm.day_of(now)
+    group = make_group(gm, size, now)
+    umo = "aiocqhttp:GroupMessage:1"
+    users = list(group)
+
+    def ensure_cold():
+        index = gm.SleepingIndex()
+        index.ensure(umo, group, day)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        t = time.perf_counter()
+        ensure_cold()
+        recorder.record(f"索引重建 {size}", time.perf_counter() - t)
+    recorder.wall[f"索引重建 {size}"] = time.perf_counter() - start
+
+    index = gm.SleepingIndex()
+    index.ensure(umo, group, day)
+    start = time.perf_counter()
+    for i in range(repeat * 100):
+        t = time.perf_counter()
+        record = group[users[i % size]]
+        index.ensure(umo, group, day)
+        was = gm.is_sleeping_on(record, day)
+        record.night, record.morning = now, 0
+        index.update(umo, was, True)
+        index.count(umo)
+        recorder.record(f"晚安计数 {size}", time.perf_counter() - t)
+    recorder.wall[f"晚安计数 {size}"] = time.perf_counter() - start
+
+    # JSON：一个大群加 50 个小群，每次只有一个用户变化
+    store = gm.GoodMorningStore(os.path.join(workdir, f"gm_{size}.json"))
+    store.groups = {umo: group}
+    for g in range(50):
+        store.groups[f"aiocqhttp:GroupMessage:{g + 2}"] = make_group(gm, 50, now)
+    store.mark_dirty(umo)
+    await store.flush()
+
+    async def json_flush():
+        store.mark_dirty(umo, users[0])
+        await store.flush()
+
+    await timed(recorder, f"JSON 写盘 {size}", json_flush, repeat)
+    await store.close()
+
+    # SQLite：只写变化的用户和睡眠记录
+    sqlite_store = gms.SqliteGoodMorningStore(os.path.join(workdir, f"gm_{size}.db"))
+    await sqlite_store.ensure_loaded()
+    sqlite_store.groups = {umo: group}
+    sqlite_store.mark_dirty(umo)
+    for uid in users:
+        sqlite_store.record_sleep(umo, uid, uid, now - 8 * 3600, now)
+    await sqlite_store.flush()
+
+    async def sqlite_flush():
+        sqlite_store.mark_dirty(umo, users[0])
+        sqlite_store.record_sleep(umo, users[0], users[0], now - 7 * 3600, now)
+        await sqlite_store.flush()
+
+    async def sqlite_load():
+        sqlite_store.groups.pop(umo, None)
+        await sqlite_store.load_group(umo)
+
+    async def leaderboard():
+        await sqlite_store.leaderboard(umo, 7, now)
+
+    await timed(recorder, f"SQLite 写盘 {size}", sqlite_flush, repeat)
+    await timed(recorder, f"SQLite 载入群 {size}", sqlite_load, max(1, repeat // 5))
+    await timed(recorder, f"SQLite 排行 {size}", leaderboard, max(1, repeat // 5))
+    await sqlite_store.close()
+
+
+async def run(args) -> None:
+    plugin = load_plugin()
+    gm = importlib.import_module(f"{plugin}.good_morning")
+    gms = importlib.import_module(f"{plugin}.good_morning_sqlite")
+    recorder = Recorder()
+    with tempfile.TemporaryDirectory(prefix="essential-bench-") as workdir:
+        for size in args.sizes:
+            await bench_size(gm, gms, recorder, size, args.repeat, workdir)
+    print(recorder.report())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=lambda s: [int(x) for x in s.split(",")],
+        default=[100, 1000, 10000, 100000],
+        help="群成员数，逗号分隔",
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
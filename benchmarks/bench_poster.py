@@ -0,0 +1,60 @@
+"""喜报/悲报渲染器的微基准。
+
+    python benchmarks/bench_poster.py --repeat 50
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import Recorder, load_plugin, measure  # noqa: E402
+
+TEXT = "恭喜本群成功完成了离线基准测试，渲染速度又快了一点！"
+
+
+async def bench_cached(renderer, recorder: Recorder, repeat: int) -> None:
+    await renderer.render("congrats", TEXT)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        t = time.perf_counter()
+        await renderer.render("congrats", TEXT)
+        recorder.record("render 缓存命中", time.perf_counter() - t)
+    recorder.wall["render 缓存命中"] = time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    poster = importlib.import_module(f"{load_plugin()}.poster")
+    renderer = poster.PosterRenderer()
+    recorder = Recorder()
+    for length in (10, 100, 500):
+        text = (TEXT * (length // len(TEXT) + 1))[:length]
+        for template in ("congrats", "uncongrats"):
+            measure(
+                recorder,
+                f"{template} {length} 字",
+                lambda: renderer.render_sync(template, text),
+                args.repeat,
+            )
+    measure(
+        recorder, "排版 500 字", lambda: renderer.layout("congrats", TEXT * 20), args.repeat * 100
+    )
+    if poster.font_available(renderer.font_path):
+        asyncio.run(bench_cached(renderer, recorder, args.repeat * 100))
+    else:
+        # 缺字体时 render 会拒绝渲染，上面的同步渲染使用的是 Pillow 默认字体
+        print("未找到字体文件，跳过缓存命中测试")
+    renderer.close()
+    print(recorder.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""基准测试公用工具：插件加载、延迟统计、本地替身服务器和伪造的消息事件。"""
+
+import asyncio
+import importlib.machinery
+import importlib.util
+import inspect
+import json
+import os
+import random
+import sys
+import time
+import unicodedata
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+
+
+def load_plugin(name: str = "essential_bench"):
+    """把插件目录注册为包 `name`，之后可用 `importlib.import_module(f"{name}.main")` 导入。
+
+    插件内部使用相对导入，目录名又随安装位置变化，所以这里手动注册。
+    """
+    if name not in sys.modules:
+        spec = importlib.machinery.ModuleSpec(name, None, is_package=True)
+        spec.submodule_search_locations = [PLUGIN_DIR]
+        sys.modules[name] = importlib.util.module_from_spec(spec)
+    return name
+
+
+def load_payload(filename: str):
+    with open(os.path.join(PAYLOAD_DIR, filename), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """最近秩法百分位数，`sorted_values` 须已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _ljust(text: str, width: int) -> str:
+    """按显示宽度左对齐，中文字符占两列"""
+    used = sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+    return text + " " * max(width - used, 0)
+
+
+class Recorder:
+    """按名字记录每次调用的耗时和错误"""
+
+    def __init__(self) -> None:
+        self.latencies: dict = defaultdict(list)
+        self.errors: dict = defaultdict(Counter)
+        self.wall: dict = {}
+
+    def record(self, name: str, seconds: float, error: str = None) -> None:
+        self.latencies[name].append(seconds)
+        if error:
+            self.errors[name][error] += 1
+
+    def summary(self, name: str) -> dict:
+        values = sorted(self.latencies[name])
+        wall = self.wall.get(name) or sum(values)
+        return {
+            "name": name,
+            "count": len(values),
+            "errors": sum(self.errors[name].values()),
+            "throughput": len(values) / wall if wall else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": (values[-1] if values else 0.0) * 1000,
+        }
+
+    def report(self) -> str:
+        lines = [
+            f"{_ljust('名称', 24)}{'次数':>6}{'错误':>4}{'吞吐/s':>9}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        ]
+        for name in self.latencies:
+            s = self.summary(name)
+            lines.append(
+                f"{_ljust(name, 24)}{s['count']:>8}{s['errors']:>6}{s['throughput']:>10.1f}"
+                f"{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}"
+            )
+            for error, count in self.errors[name].most_common(3):
+                lines.append(f"    {count} × {error}")
+        return "\n".join(lines)
+
+
+async def run_load(
+    recorder: Recorder, name: str, call, total: int, concurrency: int
+) -> None:
+    """以 `concurrency` 个并发 worker 共调用 `call(i)` `total` 次"""
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            error = None
+            try:
+                await call(i)
+            except Exception as e:
+                error = type(e).__name__
+            recorder.record(name, time.perf_counter() - start, error)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    recorder.wall[name] = time.perf_counter() - start
+
+
+def measure(recorder: Recorder, name: str, func, repeat: int) -> None:
+    """同步函数的微基准"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        recorder.record(name, time.perf_counter() - t)
+    recorder.wall[name] = time.perf_counter() - start
+
+
+async def call_handler(handler, event):
+    """调用指令处理函数；异步生成器形式的处理函数返回最后一个结果"""
+    result = handler(event)
+    if inspect.isasyncgen(result):
+        last = None
+        async for last in result:
+            pass
+        return last
+    return await result
+
+
+class Faults:
+    """延迟和错误注入：每个请求先等待 latency ± jitter，再以 error_rate 的概率返回 500"""
+
+    def __init__(self, latency: float = 0, jitter: float = 0, error_rate: float = 0) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    async def apply(self) -> bool:
+        """返回 True 表示本次请求应当失败"""
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return random.random() < self.error_rate
+
+
+class StandIn:
+    """本地 aiohttp 替身服务器，按路由回放录制的响应"""
+
+    def __init__(self, faults: Faults = None) -> None:
+        self.faults = faults or Faults()
+        self.app = web.Application(
+            middlewares=[self._middleware], client_max_size=32 * 1024 * 1024
+        )
+        self.requests = Counter()
+        self._runner: web.AppRunner = None
+        self.port = None
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        self.requests[request.match_info.route.resource.canonical] += 1
+        if await self.faults.apply():
+            return web.Response(status=500, text="injected error")
+        return await handler(request)
+
+    def route(self, method: str, path: str, handler) -> None:
+        self.app.router.add_route(method, path, handler)
+
+    def json(self, path: str, payload, method: str = "GET") -> None:
+        async def handler(request):
+            data = payload(request) if callable(payload) else payload
+            return web.json_response(data)
+
+        self.route(method, path, handler)
+
+    def bytes(self, path: str, payload, content_type: str) -> None:
+        async def handler(request):
+            data = payload(request) if callable(payload) else payload
+            return web.Response(body=data, content_type=content_type)
+
+        self.route("GET", path, handler)
+
+    def url(self, path: str = "/") -> str:
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+        self.port = self._runner.addresses[0][1]
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+async def _read_varint(reader) -> int:
+    result = 0
+    for i in range(5):
+        byte = (await reader.readexactly(1))[0]
+        result |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return result
+    raise ValueError("VarInt 过长")
+
+
+class FakeJavaServer:
+    """只实现 Server List Ping 的 Minecraft Java 版替身服务器"""
+
+    def __init__(self, status: dict, faults: Faults = None) -> None:
+        self.status = json.dumps(status, ensure_ascii=False).encode("utf-8")
+        self.faults = faults or Faults()
+        self._server: asyncio.AbstractServer = None
+        self.port = None
+        self.pings = 0
+
+    async def _handle(self, reader, writer) -> None:
+        try:
+            await reader.readexactly(await _read_varint(reader))  # 握手
+            await reader.readexactly(await _read_varint(reader))  # 状态请求
+            self.pings += 1
+            if await self.faults.apply():
+                return
+            body = _varint(0x00) + _varint(len(self.status)) + self.status
+            writer.write(_varint(len(body)) + body)
+            await writer.drain()
+            length = await _read_varint(reader)
+            ping = await reader.readexactly(length)
+            writer.write(_varint(len(ping)) + ping)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self.port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+class FakeSender:
+    def __init__(self, user_id: str, nickname: str) -> None:
+        self.user_id = user_id
+        self.nickname = nickname
+
+
+class FakeMessageObj:
+    def __init__(self, sender: FakeSender, message: list, raw_message: dict) -> None:
+        self.sender = sender
+        self.message = message
+        self.raw_message = raw_message
+
+
+class FakeEvent:
+    """只实现插件用到的 AstrMessageEvent 接口"""
+
+    def __init__(
+        self,
+        message_str: str,
+        user_id: str = "10001",
+        group_id: str = "20001",
+        platform: str = "aiocqhttp",
+        components: list = None,
+        raw_message: dict = None,
+    ) -> None:
+        self.message_str = message_str
+        self.platform = platform
+        self.group_id = group_id
+        self.unified_msg_origin = f"{platform}:GroupMessage:{group_id}"
+        self.message_obj = FakeMessageObj(
+            FakeSender(user_id, f"用户{user_id}"), components or [], raw_message or {}
+        )
+        self.sent: list = []
+
+    def get_platform_name(self) -> str:
+        return self.platform
+
+    def get_session_id(self) -> str:
+        return self.group_id
+
+    def get_sender_id(self) -> str:
+        return self.message_obj.sender.user_id
+
+    def plain_result(self, text: str):
+        return text
+
+    async def send(self, chain) -> None:
+        self.sent.append(chain)
+
+
+class FakeContext:
+    """只实现插件用到的 Context 接口"""
+
+    def __init__(self) -> None:
+        self.sent: list = []
+
+    async def send_message(self, umo: str, chain) -> bool:
+        self.sent.append((umo, chain))
+        return True
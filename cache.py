@@ -0,0 +1,137 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """带容量上限（字节数/条目数）和 TTL 的 LRU 缓存。
+
+    `sizeof` 用于计算每个值占用的字节数，默认按 `len(value)` 计算。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        max_items: int = 0,
+        ttl: float = 0,
+        sizeof=len,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.ttl = ttl
+        self.sizeof = sizeof
+        # key -> (value, size, expire_at)
+        self._data: OrderedDict = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, count=False) is not None
+
+    def _remove(self, key) -> None:
+        _, size, _ = self._data.pop(key)
+        self.current_bytes -= size
+
+    def get(self, key, default=None, count: bool = True):
+        item = self._data.get(key)
+        if item is None:
+            if count:
+                self.misses += 1
+            return default
+        value, _, expire_at = item
+        if expire_at and expire_at <= time.monotonic():
+            self._remove(key)
+            if count:
+                self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        if count:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float = None) -> None:
+        size = self.sizeof(value)
+        if self.max_bytes and size > self.max_bytes:
+            # 单个值超过上限，不缓存
+            return
+        if key in self._data:
+            self._remove(key)
+        ttl = self.ttl if ttl is None else ttl
+        expire_at = time.monotonic() + ttl if ttl else 0
+        self._data[key] = (value, size, expire_at)
+        self.current_bytes += size
+        while self._data and (
+            (self.max_bytes and self.current_bytes > self.max_bytes)
+            or (self.max_items and len(self._data) > self.max_items)
+        ):
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        if key not in self._data:
+            return default
+        value = self._data[key][0]
+        self._remove(key)
+        return value
+
+    def purge_expired(self) -> int:
+        """清理所有过期条目，返回清理数量"""
+        now = time.monotonic()
+        expired = [k for k, (_, _, e) in self._data.items() if e and e <= now]
+        for k in expired:
+            self._remove(k)
+        return len(expired)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class SingleFlight:
+    """合并相同键的并发调用：同一时刻只执行一次，其余调用方等待同一个结果。
+
+    调用在单独的任务中执行，某个调用方超时或被取消不会影响共享的调用和其它调用方。
+    """
+
+    def __init__(self) -> None:
+        self._inflight: dict = {}
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key, func):
+        """`func` 为无参协程函数，相同 key 的并发调用共享它的结果或异常"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.get_running_loop().create_task(func())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._on_done, key))
+        return await asyncio.shield(task)
+
+    def _on_done(self, key, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有调用方都已离开时避免 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
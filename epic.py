@@ -0,0 +1,280 @@
+import asyncio
+import datetime
+import hashlib
+import logging
+import time
+
+import aiohttp
+
+from .cache import SingleFlight
+
+logger = logging.getLogger("astrbot")
+
+EPIC_URL = "https://store-site-backend-static-ipv4.ak.epicgames.com/freeGamesPromotions"
+
+
+class EpicFetchError(Exception):
+    pass
+
+
+def _parse_date(text: str) -> datetime.datetime:
+    # 2024-09-19T15:00:00.000Z
+    return datetime.datetime.strptime(text, "%Y-%m-%dT%H:%M:%S.%fZ").replace(
+        tzinfo=datetime.timezone.utc
+    )
+
+
+def _human(dt: datetime.datetime) -> str:
+    return (dt + datetime.timedelta(hours=8)).strftime("%Y-%m-%d %H:%M")
+
+
+def parse_promotions(data: dict) -> dict:
+    """解析 freeGamesPromotions 返回的数据。
+
+    单个游戏数据异常只影响该游戏，不会中断整个解析。返回的 `next_change` 为最早一个尚未到达的开始/结束时间（epoch 秒）。
+    """
+    games = []
+    upcoming = []
+    now = time.time()
+    next_change = None
+
+    for game in data["data"]["Catalog"]["searchStore"]["elements"]:
+        title = game.get("title", "未知")
+        try:
+            if not game.get("promotions"):
+                continue
+            original_price = game["price"]["totalPrice"]["fmtPrice"]["originalPrice"]
+            discount_price = game["price"]["totalPrice"]["fmtPrice"]["discountPrice"]
+            promotions = game["promotions"]["promotionalOffers"]
+            upcoming_promotions = game["promotions"]["upcomingPromotionalOffers"]
+
+            if promotions:
+                promotion = promotions[0]["promotionalOffers"][0]
+            else:
+                promotion = upcoming_promotions[0]["promotionalOffers"][0]
+            start = _parse_date(promotion["startDate"])
+            end = _parse_date(promotion["endDate"])
+            discount = float(promotion["discountSetting"]["discountPercentage"])
+            if discount != 0:
+                # 过滤掉不是免费的游戏
+                continue
+
+            for ts in (start.timestamp(), end.timestamp()):
+                if ts > now and (next_change is None or ts < next_change):
+                    next_change = ts
+
+            line = (
+                f"【{title}】\n原价: {original_price} | 现价: {discount_price}\n"
+                f"活动时间: {_human(start)} - {_human(end)}"
+            )
+            if promotions:
+                games.append(line)
+            else:
+                upcoming.append(line)
+        except Exception as e:
+            logger.warning(f"解析 EPIC 游戏 {title} 失败: {e!r}")
+            games.append(f"处理 {title} 时出现错误")
+
+    return {"games": games, "upcoming": upcoming, "next_change": next_change}
+
+
+def format_message(result: dict) -> str:
+    return (
+        "【EPIC 喜加一】\n"
+        + "\n\n".join(result["games"])
+        + "\n\n"
+        + "【即将免费】\n"
+        + "\n\n".join(result["upcoming"])
+    )
+
+
+class EpicFreeGames:
+    """EPIC 免费游戏数据，解析结果常驻内存。
+
+    在数据中最早的促销开始/结束时间刷新（不早于 `min_refresh`，不晚于 `max_refresh`），
+    刷新由后台定时任务完成，并发的调用方共享同一次请求。
+    """
+
+    def __init__(
+        self,
+        http,
+        url: str = EPIC_URL,
+        min_refresh: float = 300,
+        max_refresh: float = 6 * 3600,
+    ) -> None:
+        self.http = http
+        self.url = url
+        self.min_refresh = min_refresh
+        self.max_refresh = max_refresh
+        self.result: dict = None
+        self.expires_at = 0.0
+        self._flight = SingleFlight()
+        self._timer: asyncio.TimerHandle = None
+        self._refresh_task: asyncio.Task = None
+        self.fetches = 0
+        # 每次拉取到新数据后调用 listener(result)
+        self.listeners: list = []
+
+    async def _fetch(self) -> dict:
+        try:
+            async with self.http.get(self.url, endpoint="epic") as resp:
+                if resp.status != 200:
+                    raise EpicFetchError(f"请求失败: {resp.status}")
+                data = await resp.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            # ValueError: 返回的不是合法的 JSON
+            raise EpicFetchError(f"请求失败: {type(e).__name__}") from e
+        self.fetches += 1
+        try:
+            result = parse_promotions(data)
+        except (KeyError, TypeError) as e:
+            raise EpicFetchError(f"数据格式错误: {e!r}") from e
+
+        now = time.time()
+        delay = self.max_refresh
+        if result["next_change"] is not None:
+            delay = min(delay, result["next_change"] - now)
+        delay = max(delay, self.min_refresh)
+        self.result = result
+        self.expires_at = now + delay
+        self._schedule(delay)
+        for listener in self.listeners:
+            try:
+                listener(result)
+            except Exception:
+                logger.exception("EPIC 数据监听器出错")
+        return result
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._start_refresh)
+
+    def ensure_scheduled(self) -> None:
+        """还没有定时刷新时，在后台立即拉取一次，之后按促销时间自动刷新"""
+        if self._timer is None and (
+            self._refresh_task is None or self._refresh_task.done()
+        ):
+            self._start_refresh()
+
+    def _start_refresh(self) -> None:
+        self._refresh_task = asyncio.get_running_loop().create_task(self._refresh())
+
+    async def _refresh(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            # 任何失败都要重新定时，否则定时刷新（以及订阅推送）会就此停止
+            logger.warning(f"定时刷新 EPIC 数据失败: {e!r}")
+            self._schedule(self.min_refresh)
+
+    async def refresh(self) -> dict:
+        return await self._flight.do("epic", self._fetch)
+
+    async def get(self) -> dict:
+        if self.result is not None and time.time() < self.expires_at:
+            return self.result
+        return await self.refresh()
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+
+def promotions_signature(result: dict) -> str:
+    """当前免费游戏列表的指纹，促销变化时改变"""
+    return hashlib.sha1("\n".join(result["games"]).encode("utf-8")).hexdigest()
+
+
+class EpicSubscriptions:
+    """EPIC 喜加一主动推送。
+
+    订阅者（unified_msg_origin）保存在 `store` 中。推送挂在 `EpicFreeGames` 的定时刷新上，
+    每个促销周期只拉取一次，免费游戏变化时并发（不超过 `concurrency`）发送给所有订阅者。
+    `send(umo, text)` 为发送消息的协程函数。
+    """
+
+    def __init__(self, epic: EpicFreeGames, store, send, concurrency: int = 4) -> None:
+        self.epic = epic
+        self.store = store
+        self.send = send
+        self.concurrency = concurrency
+        self._push_task: asyncio.Task = None
+        self.pushed = 0
+        self.failed = 0
+        epic.listeners.append(self._on_update)
+
+    @property
+    def subscribers(self) -> list:
+        return self.store.data.setdefault("subscribers", [])
+
+    def start(self) -> None:
+        """有订阅者时启动定时刷新；不在事件循环中时推迟到下一次订阅或查询"""
+        if not self.subscribers:
+            return
+        try:
+            self.epic.ensure_scheduled()
+        except RuntimeError:
+            pass
+
+    def subscribe(self, umo: str) -> bool:
+        if umo in self.subscribers:
+            return False
+        self.subscribers.append(umo)
+        self.store.mark_dirty()
+        self.epic.ensure_scheduled()
+        return True
+
+    def unsubscribe(self, umo: str) -> bool:
+        if umo not in self.subscribers:
+            return False
+        self.subscribers.remove(umo)
+        self.store.mark_dirty()
+        return True
+
+    def _on_update(self, result: dict) -> None:
+        signature = promotions_signature(result)
+        last = self.store.data.get("last_signature")
+        if signature == last:
+            return
+        self.store.data["last_signature"] = signature
+        self.store.mark_dirty()
+        # 首次运行只记录当前状态，避免启动时重复推送
+        if last is None or not result["games"] or not self.subscribers:
+            return
+        if self._push_task is not None and not self._push_task.done():
+            self._push_task.cancel()
+        self._push_task = asyncio.get_running_loop().create_task(
+            self._push(format_message(result))
+        )
+
+    async def _push(self, text: str) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(umo: str) -> None:
+            async with semaphore:
+                try:
+                    await self.send(umo, text)
+                    self.pushed += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning(f"推送 EPIC 喜加一到 {umo} 失败: {e!r}")
+
+        subscribers = list(self.subscribers)
+        logger.info(f"EPIC 免费游戏有变化，推送给 {len(subscribers)} 个订阅者")
+        await asyncio.gather(*(one(umo) for umo in subscribers))
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "pushed": self.pushed,
+            "failed": self.failed,
+        }
+
+    def close(self) -> None:
+        if self._push_task is not None and not self._push_task.done():
+            self._push_task.cancel()
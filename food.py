@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import random
+
+from .storage import BackgroundLoader, JsonStore
+
+logger = logging.getLogger("astrbot")
+
+
+class IndexedSet:
+    """保持插入顺序的集合，添加、删除、随机选取均为 O(1)（均摊）。
+
+    删除时只在列表中留下空位，空位超过一半时再压缩，因此不会打乱顺序。
+    """
+
+    _HOLE = object()
+
+    def __init__(self, items=()) -> None:
+        self._items: list = []
+        self._index: dict = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, item) -> bool:
+        return item in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def add(self, item) -> bool:
+        if item in self._index:
+            return False
+        self._index[item] = len(self._items)
+        self._items.append(item)
+        return True
+
+    def discard(self, item) -> bool:
+        pos = self._index.pop(item, None)
+        if pos is None:
+            return False
+        self._items[pos] = self._HOLE
+        if len(self._items) > 2 * len(self._index) + 16:
+            self._compact()
+        return True
+
+    def _compact(self) -> None:
+        self._items = list(self._index)
+        self._index = {item: i for i, item in enumerate(self._items)}
+
+    def choice(self, exclude=None):
+        """随机取一个元素，`exclude` 中的元素不会被选中；没有可选元素时返回 None"""
+        exclude = exclude or ()
+        if len(self._index) <= len(exclude):
+            candidates = [i for i in self._index if i not in exclude]
+            return random.choice(candidates) if candidates else None
+        # 空位不超过一半，拒绝采样的期望次数很小
+        for _ in range(32):
+            item = random.choice(self._items)
+            if item is not self._HOLE and item not in exclude:
+                return item
+        candidates = [i for i in self._index if i not in exclude]
+        return random.choice(candidates) if candidates else None
+
+
+class FoodStore:
+    """今天吃什么的菜单。
+
+    全局菜单之上，每个会话可以额外添加自己的食物或隐藏全局菜单中的食物。
+    首次运行时从插件自带的 `defaults_path` 导入全局菜单，之后数据保存在 `path`（data 目录下），
+    修改后防抖原子写盘，插件更新不会覆盖。
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path: str, defaults_path: str) -> None:
+        self.defaults_path = defaults_path
+        self.menu = IndexedSet()
+        # umo -> {"added": IndexedSet, "hidden": set}
+        self.groups: dict = {}
+        self._store = JsonStore(path, dump=self._dump)
+        self._lock = asyncio.Lock()
+        self._loader = BackgroundLoader(self.load, "food")
+
+    def start_loading(self) -> None:
+        self._loader.start()
+
+    async def ensure_loaded(self) -> None:
+        await self._loader.wait()
+
+    def load(self) -> None:
+        self._store.load()
+        raw = self._store.data
+        if raw.get("version") is None:
+            try:
+                with open(self.defaults_path, "r", encoding="utf-8") as f:
+                    foods = json.load(f)["data"]
+            except Exception:
+                logger.exception("读取默认菜单失败")
+                foods = []
+            self.menu = IndexedSet(foods)
+            return
+        self.menu = IndexedSet(raw.get("menu", []))
+        for umo, group in raw.get("groups", {}).items():
+            self.groups[umo] = {
+                "added": IndexedSet(group.get("added", [])),
+                "hidden": set(group.get("hidden", [])),
+            }
+
+    def _dump(self) -> dict:
+        return {
+            "version": self.FORMAT_VERSION,
+            "menu": list(self.menu),
+            "groups": {
+                umo: {"added": list(g["added"]), "hidden": sorted(g["hidden"])}
+                for umo, g in self.groups.items()
+                if g["added"] or g["hidden"]
+            },
+        }
+
+    def _group(self, umo: str) -> dict:
+        group = self.groups.get(umo)
+        if group is None:
+            group = self.groups[umo] = {"added": IndexedSet(), "hidden": set()}
+        return group
+
+    def choice(self, umo: str = None):
+        group = self.groups.get(umo) if umo else None
+        if group is None:
+            return self.menu.choice()
+        added, hidden = group["added"], group["hidden"]
+        # 按数量加权，在全局菜单和本会话菜单中均匀选取
+        visible = max(len(self.menu) - len(hidden), 0)
+        if added and random.randrange(visible + len(added)) < len(added):
+            return added.choice()
+        return self.menu.choice(exclude=hidden) or added.choice()
+
+    async def add(self, foods: list, umo: str = None) -> list:
+        """添加食物，返回实际新增的部分。指定 `umo` 时只加入该会话的菜单"""
+        await self.ensure_loaded()
+        async with self._lock:
+            if umo is None:
+                added = [f for f in foods if self.menu.add(f)]
+            else:
+                group = self._group(umo)
+                added = []
+                for food in foods:
+                    if food in group["hidden"]:
+                        group["hidden"].discard(food)
+                        added.append(food)
+                    elif food not in self.menu and group["added"].add(food):
+                        added.append(food)
+            if added:
+                self._store.mark_dirty()
+            return added
+
+    async def remove(self, foods: list, umo: str = None) -> list:
+        """删除食物，返回实际删除的部分。指定 `umo` 时只影响该会话的菜单"""
+        await self.ensure_loaded()
+        async with self._lock:
+            if umo is None:
+                removed = [f for f in foods if self.menu.discard(f)]
+            else:
+                group = self._group(umo)
+                removed = []
+                for food in foods:
+                    if group["added"].discard(food):
+                        removed.append(food)
+                    elif food in self.menu and food not in group["hidden"]:
+                        group["hidden"].add(food)
+                        removed.append(food)
+            if removed:
+                self._store.mark_dirty()
+            return removed
+
+    def stats(self) -> dict:
+        return {"menu": len(self.menu), "groups": len(self.groups)}
+
+    async def close(self) -> None:
+        await self._loader.close()
+        await self._store.close()
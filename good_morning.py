@@ -0,0 +1,208 @@
+import datetime
+import json
+import logging
+import os
+
+from .storage import BackgroundLoader, DebouncedStore, atomic_write
+
+logger = logging.getLogger("astrbot")
+
+TZ_UTC8 = datetime.timezone(datetime.timedelta(hours=8))
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+UTC8_OFFSET = 8 * 3600
+
+
+def format_time(ts: int) -> str:
+    """epoch 秒 -> UTC+8 时间字符串，仅用于展示"""
+    if not ts:
+        return ""
+    return datetime.datetime.fromtimestamp(ts, TZ_UTC8).strftime(TIME_FORMAT)
+
+
+def parse_time(text: str) -> int:
+    """UTC+8 时间字符串 -> epoch 秒，兼容旧数据"""
+    if not text:
+        return 0
+    dt = datetime.datetime.strptime(text, TIME_FORMAT).replace(tzinfo=TZ_UTC8)
+    return int(dt.timestamp())
+
+
+def day_of(ts: int) -> int:
+    """epoch 秒所在的 UTC+8 日期序号"""
+    return (ts + UTC8_OFFSET) // 86400
+
+
+class SleepRecord:
+    """单个用户的早晚安记录，时间均为 epoch 秒，0 表示没有记录"""
+
+    __slots__ = ("night", "morning")
+
+    def __init__(self, night: int = 0, morning: int = 0) -> None:
+        self.night = night
+        self.morning = morning
+
+    def to_list(self) -> list:
+        return [self.night, self.morning]
+
+    @classmethod
+    def from_raw(cls, raw) -> "SleepRecord":
+        if isinstance(raw, list):
+            return cls(int(raw[0]), int(raw[1]))
+        # 旧格式：{"daily": {"morning_time": str, "night_time": str}}
+        daily = raw.get("daily", {})
+        return cls(
+            parse_time(daily.get("night_time", "")),
+            parse_time(daily.get("morning_time", "")),
+        )
+
+
+class GoodMorningStore(DebouncedStore):
+    """早晚安数据的持久化层。
+
+    修改数据后只标记对应的群为脏，由定时任务在防抖间隔后统一写盘，插件卸载时也会写盘。
+    每个群的 JSON 片段单独缓存，写盘时只重新序列化发生变化的群，拼接和写文件在线程池中完成。
+
+    文件格式（version 2），时间为 epoch 秒，0 表示没有记录::
+
+        {"version": 2, "good_morning": {umo: {user_id: [night, morning]}}}
+
+    version 1 及更早的 `{"daily": {"morning_time": ..., "night_time": ...}}` 格式读取时自动转换。
+    """
+
+    FORMAT_VERSION = 2
+    # JSON 只保存最近一次早晚安，不保存历史
+    supports_history = False
+
+    def __init__(self, path: str, flush_interval: float = 5.0) -> None:
+        super().__init__("good_morning_json", flush_interval)
+        self.path = path
+        # umo -> user_id -> SleepRecord
+        self.groups: dict = {}
+        # 文件中其它顶层字段，原样保留
+        self.extra: dict = {}
+        self._fragments: dict = {}
+        self._dirty: set = set()
+        self._loader = BackgroundLoader(self.load, "good_morning_json")
+
+    def start_loading(self) -> None:
+        """在后台线程中读取数据文件，不阻塞插件加载"""
+        self._loader.start()
+
+    async def ensure_loaded(self) -> None:
+        await self._loader.wait()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        if not isinstance(raw, dict):
+            raw = {}
+        legacy = raw.get("version") != self.FORMAT_VERSION
+        if "version" in raw:
+            raw.pop("version")
+            groups = raw.pop("good_morning", {})
+            self.extra = raw
+        elif "good_morning" in raw:
+            # 旧格式：{"good_morning": {...}}
+            groups = raw.pop("good_morning")
+            self.extra = raw
+        else:
+            # 旧版本直接把 good_morning 数据写在顶层
+            groups = raw
+        self.groups = {
+            umo: {uid: SleepRecord.from_raw(r) for uid, r in users.items()}
+            for umo, users in groups.items()
+        }
+        if legacy and groups:
+            # 旧格式迁移为新格式
+            self._dirty.update(groups.keys())
+
+    def get_group(self, umo: str) -> dict:
+        group = self.groups.get(umo)
+        if group is None:
+            group = self.groups[umo] = {}
+        return group
+
+    async def load_group(self, umo: str) -> dict:
+        # 数据文件整体载入内存
+        await self.ensure_loaded()
+        return self.get_group(umo)
+
+    def mark_dirty(self, umo: str, user_id: str = None) -> None:
+        self._dirty.add(umo)
+        self._schedule_flush()
+
+    def record_sleep(self, umo, user_id, name, night, morning) -> None:
+        pass
+
+    def _serialize_group(self, umo: str) -> str:
+        users = self.groups.get(umo, {})
+        return json.dumps(
+            {uid: r.to_list() for uid, r in users.items()}, ensure_ascii=False
+        )
+
+    def _take_dirty(self):
+        if not self._dirty:
+            return None
+        dirty, self._dirty = self._dirty, set()
+        for umo in dirty:
+            if umo in self.groups:
+                self._fragments[umo] = self._serialize_group(umo)
+            else:
+                self._fragments.pop(umo, None)
+        # 首次写盘时补齐未修改过的群
+        for umo in self.groups.keys() - self._fragments.keys():
+            self._fragments[umo] = self._serialize_group(umo)
+        return dirty, list(self._fragments.items()), dict(self.extra)
+
+    def _write(self, snapshot: tuple) -> None:
+        _, fragments, extra = snapshot
+        body = ",".join(
+            f"{json.dumps(umo, ensure_ascii=False)}:{frag}" for umo, frag in fragments
+        )
+        head = {"version": self.FORMAT_VERSION, **extra}
+        content = json.dumps(head, ensure_ascii=False)[:-1]
+        content += f', "good_morning": {{{body}}}}}'
+        atomic_write(self.path, content)
+
+    def _restore_dirty(self, snapshot: tuple) -> None:
+        self._dirty |= snapshot[0]
+
+    async def close(self) -> None:
+        await self._loader.close()
+        await super().close()
+
+
+def is_sleeping_on(record: SleepRecord, day: int) -> bool:
+    """用户是否在 `day`（见 `day_of`）说了晚安且还没说早安"""
+    return bool(record.night) and not record.morning and day_of(record.night) == day
+
+
+class SleepingIndex:
+    """按群维护当天睡觉人数的索引。
+
+    每次早晚安以 O(1) 增减计数；首次访问某个群时扫描一次重建，跨天时直接清零
+    （晚安时间总是当前时间，新的一天开始时不可能有人已经在当天睡下）。
+    """
+
+    def __init__(self) -> None:
+        # umo -> [day, count]
+        self._index: dict = {}
+
+    def ensure(self, umo: str, group: dict, day: int) -> None:
+        entry = self._index.get(umo)
+        if entry is None:
+            count = sum(1 for record in group.values() if is_sleeping_on(record, day))
+            self._index[umo] = [day, count]
+        elif entry[0] != day:
+            entry[0] = day
+            entry[1] = 0
+
+    def update(self, umo: str, was_sleeping: bool, is_sleeping: bool) -> None:
+        if was_sleeping != is_sleeping:
+            self._index[umo][1] += 1 if is_sleeping else -1
+
+    def count(self, umo: str) -> int:
+        entry = self._index.get(umo)
+        return entry[1] if entry else 0
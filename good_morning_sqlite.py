@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from .good_morning import GoodMorningStore, SleepRecord, day_of
+from .storage import BackgroundLoader, DebouncedStore
+
+logger = logging.getLogger("astrbot")
+
+# 超过这个时长的睡眠视为漏说早安，不计入历史
+MAX_SLEEP_SECONDS = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sleep_state (
+    umo TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    night INTEGER NOT NULL DEFAULT 0,
+    morning INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (umo, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sleep_log (
+    id INTEGER PRIMARY KEY,
+    umo TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    name TEXT,
+    night INTEGER NOT NULL,
+    morning INTEGER NOT NULL,
+    duration INTEGER NOT NULL,
+    day INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sleep_log_umo_day ON sleep_log (umo, day);
+CREATE INDEX IF NOT EXISTS idx_sleep_log_user_day ON sleep_log (umo, user_id, day);
+"""
+
+
+class SqliteGoodMorningStore(DebouncedStore):
+    """基于 SQLite（WAL 模式）的早晚安存储，保存每次睡眠的历史记录。
+
+    与 `GoodMorningStore` 接口一致。群数据在第一次使用时才从数据库载入，
+    修改和历史记录在防抖间隔后批量写入。所有数据库操作都在单独的线程中串行执行。
+    首次启动时会从 JSON 数据文件迁移一次。
+    """
+
+    supports_history = True
+
+    def __init__(
+        self, path: str, json_path: str = None, flush_interval: float = 5.0
+    ) -> None:
+        self.path = path
+        self.json_path = json_path
+        # 已载入的群：umo -> user_id -> SleepRecord
+        self.groups: dict = {}
+        self._dirty_users: set = set()
+        self._dirty_groups: set = set()
+        self._pending_log: list = []
+        self._conn: sqlite3.Connection = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="essential-sqlite"
+        )
+        super().__init__("good_morning_sqlite", flush_interval, executor=self._executor)
+        # 建表和 JSON 迁移也在数据库线程中执行
+        self._loader = BackgroundLoader(
+            self.load, "good_morning_sqlite", executor=self._executor
+        )
+
+    def start_loading(self) -> None:
+        self._loader.start()
+
+    async def ensure_loaded(self) -> None:
+        await self._loader.wait()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def load(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate_from_json()
+
+    def _migrate_from_json(self) -> None:
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'json_migrated'"
+        ).fetchone()
+        if row or not self.json_path or not os.path.exists(self.json_path):
+            return
+        legacy = GoodMorningStore(self.json_path)
+        legacy.load()
+        rows = [
+            (umo, uid, r.night, r.morning)
+            for umo, users in legacy.groups.items()
+            for uid, r in users.items()
+        ]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sleep_state (umo, user_id, night, morning) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                (str(len(rows)),),
+            )
+        logger.info(f"已从 {self.json_path} 迁移 {len(rows)} 条早晚安记录到 SQLite。")
+
+    def _select_group(self, umo: str) -> list:
+        return self._conn.execute(
+            "SELECT user_id, night, morning FROM sleep_state WHERE umo = ?", (umo,)
+        ).fetchall()
+
+    async def load_group(self, umo: str) -> dict:
+        group = self.groups.get(umo)
+        if group is not None:
+            return group
+        await self.ensure_loaded()
+        rows = await self._run(self._select_group, umo)
+        # 等待期间可能已有其它协程载入
+        group = self.groups.get(umo)
+        if group is None:
+            group = self.groups[umo] = {
+                uid: SleepRecord(night, morning) for uid, night, morning in rows
+            }
+        return group
+
+    def mark_dirty(self, umo: str, user_id: str = None) -> None:
+        if user_id is None:
+            self._dirty_groups.add(umo)
+        else:
+            self._dirty_users.add((umo, user_id))
+        self._schedule_flush()
+
+    def record_sleep(self, umo, user_id, name, night, morning) -> None:
+        duration = morning - night
+        if not night or duration <= 0 or duration > MAX_SLEEP_SECONDS:
+            return
+        self._pending_log.append(
+            (umo, user_id, name, night, morning, duration, day_of(morning))
+        )
+        self._schedule_flush()
+
+    def _take_dirty(self):
+        if not (self._dirty_users or self._dirty_groups or self._pending_log):
+            return None
+        dirty_users, self._dirty_users = self._dirty_users, set()
+        dirty_groups, self._dirty_groups = self._dirty_groups, set()
+        log_rows, self._pending_log = self._pending_log, []
+        for umo in dirty_groups:
+            dirty_users.update((umo, uid) for uid in self.groups.get(umo, {}))
+        state_rows = []
+        for umo, uid in dirty_users:
+            r = self.groups.get(umo, {}).get(uid)
+            if r is not None:
+                state_rows.append((umo, uid, r.night, r.morning))
+        return dirty_users, state_rows, log_rows
+
+    def _write(self, snapshot: tuple) -> None:
+        _, state_rows, log_rows = snapshot
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sleep_state (umo, user_id, night, morning) "
+                "VALUES (?, ?, ?, ?)",
+                state_rows,
+            )
+            self._conn.executemany(
+                "INSERT INTO sleep_log (umo, user_id, name, night, morning, duration, day) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                log_rows,
+            )
+
+    def _restore_dirty(self, snapshot: tuple) -> None:
+        dirty_users, _, log_rows = snapshot
+        self._dirty_users |= dirty_users
+        self._pending_log = log_rows + self._pending_log
+
+    def _query_user_stats(self, umo: str, user_id: str, since_day: int):
+        return self._conn.execute(
+            "SELECT COUNT(*), AVG(duration) FROM sleep_log "
+            "WHERE umo = ? AND user_id = ? AND day >= ?",
+            (umo, user_id, since_day),
+        ).fetchone()
+
+    def _query_leaderboard(self, umo: str, since_day: int, limit: int):
+        return self._conn.execute(
+            # 昵称取该用户最近一条记录里的，而不是按字符串排序最大的
+            "SELECT s.user_id, (SELECT name FROM sleep_log WHERE id = s.last_id), "
+            "s.count, s.avg_duration FROM ("
+            "SELECT user_id, MAX(id) AS last_id, COUNT(*) AS count, "
+            "AVG(duration) AS avg_duration FROM sleep_log "
+            "WHERE umo = ? AND day >= ? GROUP BY user_id "
+            "ORDER BY avg_duration DESC LIMIT ?"
+            ") AS s ORDER BY s.avg_duration DESC",
+            (umo, since_day, limit),
+        ).fetchall()
+
+    async def user_stats(self, umo: str, user_id: str, days: int, now: int) -> dict:
+        """最近 `days` 天的睡眠次数、平均时长（秒）"""
+        await self.ensure_loaded()
+        await self.flush()
+        count, avg = await self._run(
+            self._query_user_stats, umo, user_id, day_of(now) - days + 1
+        )
+        return {"count": count, "avg_duration": avg or 0}
+
+    async def leaderboard(self, umo: str, days: int, now: int, limit: int = 10) -> list:
+        """最近 `days` 天本群平均睡眠时长排行：[(user_id, name, count, avg_duration)]"""
+        await self.ensure_loaded()
+        await self.flush()
+        return await self._run(
+            self._query_leaderboard, umo, day_of(now) - days + 1, limit
+        )
+
+    async def close(self) -> None:
+        await self._loader.close()
+        await super().close()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
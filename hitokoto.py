@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+
+import aiohttp
+
+logger = logging.getLogger("astrbot")
+
+HITOKOTO_URL = "https://v1.hitokoto.cn"
+
+# 一言句子类型，见 https://developer.hitokoto.cn/sentence/#句子类型-参数
+CATEGORIES = {
+    "动画": "a",
+    "漫画": "b",
+    "游戏": "c",
+    "文学": "d",
+    "原创": "e",
+    "网络": "f",
+    "其他": "g",
+    "影视": "h",
+    "诗词": "i",
+    "网易云": "j",
+    "哲学": "k",
+    "抖机灵": "l",
+}
+
+
+class HitokotoError(Exception):
+    pass
+
+
+def parse_categories(args: list) -> tuple:
+    """把指令参数（中文名或类型字母）转成排序后的类型元组，无法识别时抛出 ValueError"""
+    codes = set()
+    for arg in args:
+        code = CATEGORIES.get(arg, arg.lower())
+        if code not in CATEGORIES.values():
+            raise ValueError(arg)
+        codes.add(code)
+    return tuple(sorted(codes))
+
+
+def format_hitokoto(data: dict) -> str:
+    return data["hitokoto"] + " —— " + data["from"]
+
+
+class HitokotoPool:
+    """一言预取缓冲。
+
+    每种类型组合维护一个环形缓冲（最多 `size` 条），取走后由后台任务按 `batch` 条一批并发补充。
+    缓冲为空时现场请求，不超过 `live_timeout` 秒；上游不可用时从本地语料中随机返回同类型的句子，不会卡住回复，
+    本地语料没有所需类型时抛出 `HitokotoError`。
+    只为最近使用过的 `max_keys` 种类型组合保留缓冲。
+    """
+
+    def __init__(
+        self,
+        http,
+        fallback_path: str,
+        url: str = HITOKOTO_URL,
+        size: int = 8,
+        batch: int = 4,
+        max_keys: int = 16,
+        live_timeout: float = 3,
+    ) -> None:
+        self.http = http
+        self.fallback_path = fallback_path
+        self.url = url
+        self.size = size
+        self.batch = batch
+        self.max_keys = max_keys
+        self.live_timeout = live_timeout
+        # 类型元组 -> deque，按最近使用排序
+        self._buffers: OrderedDict = OrderedDict()
+        self._refilling: dict = {}
+        self._fallback: list = None
+        # 上游失败后在此时间之前直接使用本地语料
+        self._down_until = 0.0
+        self._backoff = 1
+
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self.failures = 0
+
+    def _load_fallback(self) -> list:
+        if self._fallback is None:
+            try:
+                with open(self.fallback_path, "r", encoding="utf-8") as f:
+                    self._fallback = json.load(f)["data"]
+            except Exception:
+                logger.exception("读取一言本地语料失败")
+                self._fallback = []
+        return self._fallback
+
+    def _pick_fallback(self, categories: tuple) -> dict:
+        corpus = self._load_fallback()
+        if not corpus:
+            raise HitokotoError("一言暂时不可用")
+        matched = [q for q in corpus if not categories or q.get("type") in categories]
+        if not matched:
+            # 本地语料只覆盖部分类型，不拿其它类型的句子冒充
+            names = "、".join(n for n, c in CATEGORIES.items() if c in categories)
+            raise HitokotoError(f"一言暂时不可用，本地语料中没有{names}类型的句子")
+        self.fallbacks += 1
+        return random.choice(matched)
+
+    async def _fetch(self, categories: tuple) -> dict:
+        params = [("c", c) for c in categories]
+        try:
+            async with self.http.get(self.url, endpoint="hitokoto", params=params) as resp:
+                if resp.status != 200:
+                    raise HitokotoError(f"请求失败: {resp.status}")
+                data = await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise HitokotoError(f"请求失败: {type(e).__name__}") from e
+        if not isinstance(data, dict) or "hitokoto" not in data:
+            raise HitokotoError("无效的响应")
+        return {
+            "hitokoto": data["hitokoto"],
+            "from": data.get("from") or "佚名",
+            "type": data.get("type"),
+        }
+
+    def _mark_up(self) -> None:
+        self._down_until = 0.0
+        self._backoff = 1
+
+    def _mark_down(self, error: Exception) -> None:
+        self.failures += 1
+        self._down_until = time.monotonic() + self._backoff
+        logger.warning(f"获取一言失败: {error}，{self._backoff} 秒内使用本地语料")
+        self._backoff = min(self._backoff * 2, 300)
+
+    def _buffer(self, categories: tuple) -> deque:
+        buf = self._buffers.get(categories)
+        if buf is None:
+            buf = self._buffers[categories] = deque(maxlen=self.size)
+            while len(self._buffers) > self.max_keys:
+                self._buffers.popitem(last=False)
+        self._buffers.move_to_end(categories)
+        return buf
+
+    def _ensure_refill(self, categories: tuple) -> None:
+        task = self._refilling.get(categories)
+        if task is not None and not task.done():
+            return
+        if time.monotonic() < self._down_until:
+            return
+        self._refilling[categories] = asyncio.get_running_loop().create_task(
+            self._refill(categories)
+        )
+
+    async def _refill(self, categories: tuple) -> None:
+        try:
+            while categories in self._buffers:
+                buf = self._buffers[categories]
+                missing = buf.maxlen - len(buf)
+                if missing <= 0:
+                    return
+                results = await asyncio.gather(
+                    *(self._fetch(categories) for _ in range(min(missing, self.batch))),
+                    return_exceptions=True,
+                )
+                errors = [r for r in results if isinstance(r, Exception)]
+                buf.extend(r for r in results if not isinstance(r, Exception))
+                if errors:
+                    self._mark_down(errors[0])
+                    return
+                self._mark_up()
+        finally:
+            self._refilling.pop(categories, None)
+
+    async def get(self, categories: tuple = ()) -> dict:
+        buf = self._buffer(categories)
+        try:
+            if buf:
+                self.hits += 1
+                return buf.popleft()
+            self.misses += 1
+            if time.monotonic() < self._down_until:
+                return self._pick_fallback(categories)
+            try:
+                data = await asyncio.wait_for(self._fetch(categories), self.live_timeout)
+            except HitokotoError as e:
+                self._mark_down(e)
+                return self._pick_fallback(categories)
+            except asyncio.TimeoutError:
+                self._mark_down(HitokotoError("请求超时"))
+                return self._pick_fallback(categories)
+            self._mark_up()
+            return data
+        finally:
+            self._ensure_refill(categories)
+
+    def stats(self) -> dict:
+        return {
+            "buffers": {"".join(k) or "*": len(v) for k, v in self._buffers.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "fallbacks": self.fallbacks,
+            "failures": self.failures,
+        }
+
+    async def close(self) -> None:
+        tasks = [t for t in self._refilling.values() if not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refilling.clear()
+        self._buffers.clear()
@@ -0,0 +1,190 @@
+import logging
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .metrics import METRICS
+
+logger = logging.getLogger("astrbot")
+
+# 各上游接口的超时配置（秒）
+DEFAULT_TIMEOUTS = {
+    "default": aiohttp.ClientTimeout(total=15, connect=5),
+    "moe": aiohttp.ClientTimeout(total=20, connect=5, sock_read=10),
+    "mcs": aiohttp.ClientTimeout(total=10, connect=5),
+    "hitokoto": aiohttp.ClientTimeout(total=5, connect=3),
+    "epic": aiohttp.ClientTimeout(total=15, connect=5),
+    "saucenao": aiohttp.ClientTimeout(total=15, connect=5),
+    "image": aiohttp.ClientTimeout(total=10, connect=5),
+    # 搜番时仅用于计算感知哈希的下载，慢了就放弃，不拖慢搜番
+    "image_hash": aiohttp.ClientTimeout(total=3, connect=2),
+}
+
+
+class HttpClient:
+    """插件共享的 HTTP 客户端。
+
+    整个插件只持有一个 `aiohttp.ClientSession`，连接池按 host 限流，开启 DNS 缓存和 keep-alive，
+    使重复的指令可以复用已经建立好的 TCP/TLS 连接。
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 8,
+        dns_ttl: int = 300,
+        keepalive_timeout: float = 30,
+        timeouts: dict = None,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+
+        self._session: aiohttp.ClientSession = None
+        self._connector: aiohttp.TCPConnector = None
+        self._closed = False
+
+        # 统计信息
+        self.requests_total = 0
+        self.requests_by_host = defaultdict(int)
+        self.errors_total = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_conn_create(session, ctx, params):
+            self.connections_created += 1
+
+        async def on_conn_reuse(session, ctx, params):
+            self.connections_reused += 1
+
+        async def on_dns_hit(session, ctx, params):
+            self.dns_cache_hits += 1
+
+        async def on_dns_miss(session, ctx, params):
+            self.dns_cache_misses += 1
+
+        async def on_exception(session, ctx, params):
+            self.errors_total += 1
+
+        trace.on_connection_create_end.append(on_conn_create)
+        trace.on_connection_reuseconn.append(on_conn_reuse)
+        trace.on_dns_cache_hit.append(on_dns_hit)
+        trace.on_dns_cache_miss.append(on_dns_miss)
+        trace.on_request_exception.append(on_exception)
+        if METRICS.enabled:
+            self._add_metric_hooks(trace)
+        return trace
+
+    @staticmethod
+    def _add_metric_hooks(trace: aiohttp.TraceConfig) -> None:
+        """按 endpoint 记录上游耗时（到收到响应头为止）、状态码、异常类型和收发字节数"""
+
+        def endpoint(ctx) -> str:
+            return (ctx.trace_request_ctx or {}).get("endpoint", "default")
+
+        async def on_start(session, ctx, params):
+            ctx.start = time.perf_counter()
+
+        async def on_end(session, ctx, params):
+            name = endpoint(ctx)
+            METRICS.observe("upstream_seconds", time.perf_counter() - ctx.start, endpoint=name)
+            METRICS.inc("upstream_responses", endpoint=name, status=params.response.status)
+
+        async def on_exception(session, ctx, params):
+            METRICS.inc(
+                "upstream_errors", endpoint=endpoint(ctx), type=type(params.exception).__name__
+            )
+
+        async def on_chunk_sent(session, ctx, params):
+            METRICS.inc("upstream_bytes_sent", len(params.chunk), endpoint=endpoint(ctx))
+
+        async def on_chunk_received(session, ctx, params):
+            METRICS.inc("upstream_bytes_received", len(params.chunk), endpoint=endpoint(ctx))
+
+        trace.on_request_start.append(on_start)
+        trace.on_request_end.append(on_end)
+        trace.on_request_exception.append(on_exception)
+        trace.on_request_chunk_sent.append(on_chunk_sent)
+        trace.on_response_chunk_received.append(on_chunk_received)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """懒加载 session，保证在事件循环中创建"""
+        if self._closed:
+            raise RuntimeError("HttpClient 已关闭")
+        if self._session is None or self._session.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=self._connector,
+                timeout=self.timeouts["default"],
+                trace_configs=[self._build_trace_config()],
+            )
+        return self._session
+
+    def timeout_for(self, endpoint: str) -> aiohttp.ClientTimeout:
+        return self.timeouts.get(endpoint, self.timeouts["default"])
+
+    def request(self, method: str, url: str, endpoint: str = "default", **kwargs):
+        """发起请求，返回可 `async with` 的响应上下文。
+
+        `endpoint` 用于选择对应的超时配置，也可以直接传入 `timeout` 覆盖。
+        """
+        kwargs.setdefault("timeout", self.timeout_for(endpoint))
+        if METRICS.enabled:
+            kwargs.setdefault("trace_request_ctx", {"endpoint": endpoint})
+        self.requests_total += 1
+        self.requests_by_host[urlsplit(url).hostname or ""] += 1
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, endpoint: str = "default", **kwargs):
+        return self.request("GET", url, endpoint=endpoint, **kwargs)
+
+    def post(self, url: str, endpoint: str = "default", **kwargs):
+        return self.request("POST", url, endpoint=endpoint, **kwargs)
+
+    def stats(self) -> dict:
+        """连接池统计信息"""
+        idle = 0
+        acquired = 0
+        if self._connector is not None and not self._connector.closed:
+            # aiohttp 未公开这些字段，取不到时按 0 处理
+            conns = getattr(self._connector, "_conns", {}) or {}
+            idle = sum(len(v) for v in conns.values())
+            acquired = len(getattr(self._connector, "_acquired", ()) or ())
+        return {
+            "requests_total": self.requests_total,
+            "requests_by_host": dict(self.requests_by_host),
+            "errors_total": self.errors_total,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "connections_idle": idle,
+            "connections_acquired": acquired,
+            "dns_cache_hits": self.dns_cache_hits,
+            "dns_cache_misses": self.dns_cache_misses,
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+        }
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._connector = None
@@ -0,0 +1,89 @@
+import asyncio
+import io
+import logging
+import tempfile
+
+from .metrics import METRICS
+
+logger = logging.getLogger("astrbot")
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+async def fetch_image(
+    http,
+    url: str,
+    headers: dict = None,
+    max_memory: int = 4 * 1024 * 1024,
+    max_size: int = 20 * 1024 * 1024,
+    chunk_size: int = 64 * 1024,
+    endpoint: str = "image",
+) -> tempfile.SpooledTemporaryFile:
+    """流式下载图片。
+
+    `max_memory` 以内的数据只保存在内存中，超出后才写入唯一的临时文件；超过 `max_size` 抛出 `ImageTooLarge`。
+    `endpoint` 决定使用的超时配置。返回已定位到开头的 SpooledTemporaryFile，调用方负责关闭。
+    """
+    async with http.get(url, endpoint=endpoint, headers=headers) as resp:
+        if resp.status != 200:
+            raise ImageFetchError(f"HTTP {resp.status}")
+        if resp.content_length and resp.content_length > max_size:
+            raise ImageTooLarge(f"图片过大: {resp.content_length} 字节")
+        spool = tempfile.SpooledTemporaryFile(max_size=max_memory, prefix="essential_img_")
+        try:
+            size = 0
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                size += len(chunk)
+                if size > max_size:
+                    raise ImageTooLarge(f"图片过大: 超过 {max_size} 字节")
+                spool.write(chunk)
+            spool.seek(0)
+            return spool
+        except BaseException:
+            spool.close()
+            raise
+
+
+def shrink_image(
+    spool, max_side: int = 1600, max_bytes: int = 1024 * 1024, quality: int = 90
+) -> bytes:
+    """图片边长或体积过大时缩小并重新编码为 JPEG，否则原样返回字节"""
+    from PIL import Image as PILImage
+
+    size = spool.seek(0, io.SEEK_END)
+    spool.seek(0)
+    try:
+        # 直接从临时文件解码，大图不会整个读回内存
+        with PILImage.open(spool) as img:
+            if max(img.size) <= max_side and size <= max_bytes:
+                spool.seek(0)
+                return spool.read()
+            img.draft("RGB", (max_side, max_side))
+            img = img.convert("RGB")
+            img.thumbnail((max_side, max_side), PILImage.Resampling.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=quality)
+    except Exception as e:
+        logger.warning(f"压缩图片失败，使用原图: {e}")
+        spool.seek(0)
+        return spool.read()
+    logger.info(f"图片已压缩: {size} -> {buf.tell()} 字节")
+    return buf.getvalue()
+
+
+async def fetch_image_bytes(http, url: str, headers: dict = None, **kwargs) -> bytes:
+    """下载图片并在线程池中压缩，返回可直接上传的字节"""
+    with METRICS.timer("image_fetch_seconds", stage="download"):
+        spool = await fetch_image(http, url, headers, **kwargs)
+    try:
+        loop = asyncio.get_running_loop()
+        with METRICS.timer("image_fetch_seconds", stage="shrink"):
+            return await loop.run_in_executor(None, shrink_image, spool)
+    finally:
+        spool.close()
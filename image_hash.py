@@ -0,0 +1,78 @@
+import io
+
+
+def dhash(data, size: int = 8) -> int:
+    """计算图片的 dHash（差异哈希），返回 size*size 位整数。`data` 为图片字节或可读的文件对象。
+
+    先缩放为 (size+1)*size 的灰度图，再比较每行相邻像素的亮度，对缩放、压缩和轻微调色不敏感。
+    """
+    from PIL import Image as PILImage
+
+    if isinstance(data, (bytes, bytearray)):
+        data = io.BytesIO(data)
+    with PILImage.open(data) as img:
+        img.draft("L", (size * 8, size * 8))  # JPEG 可以直接按比例解码，省去大图全尺寸解码
+        small = img.convert("L").resize((size + 1, size), PILImage.Resampling.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """按汉明距离组织的 BK 树，用于查找相近的哈希值。
+
+    不支持删除，调用方需自行标记失效条目并在必要时调用 `rebuild`。
+    """
+
+    def __init__(self) -> None:
+        # 节点：[hash, {distance: child}]
+        self._root: list = None
+        self.size = 0
+
+    def add(self, value: int) -> None:
+        if self._root is None:
+            self._root = [value, {}]
+            self.size = 1
+            return
+        node = self._root
+        while True:
+            dist = hamming(value, node[0])
+            if dist == 0:
+                return
+            child = node[1].get(dist)
+            if child is None:
+                node[1][dist] = [value, {}]
+                self.size += 1
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> list:
+        """返回距离不超过 radius 的 [(distance, hash)]，按距离升序"""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            dist = hamming(value, node[0])
+            if dist <= radius:
+                found.append((dist, node[0]))
+            for d, child in node[1].items():
+                if dist - radius <= d <= dist + radius:
+                    stack.append(child)
+        found.sort()
+        return found
+
+    def rebuild(self, values) -> None:
+        self._root = None
+        self.size = 0
+        for v in values:
+            self.add(v)
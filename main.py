@@ -1,42 +1,113 @@
-import random
 import asyncio
+import inspect
 import os
-import json
-import datetime
+import time
 import aiohttp
+import re
 import urllib.parse
 import logging
-from PIL import Image as PILImage
-from PIL import ImageDraw as PILImageDraw
-from PIL import ImageFont as PILImageFont
 from astrbot.api.all import AstrMessageEvent, CommandResult, Context, Image, Plain
 import astrbot.api.event.filter as filter
+from astrbot.api.event import MessageChain
 from astrbot.api.star import register, Star
 from astrbot.core.config.astrbot_config import AstrBotConfig
 
+# 统计插件自身模块的导入耗时
+_import_started = time.perf_counter()
+
+from .epic import EpicFetchError, EpicFreeGames, EpicSubscriptions
+from .epic import format_message as format_epic_message
+from .food import FoodStore
+from .good_morning import (
+    GoodMorningStore,
+    SleepingIndex,
+    SleepRecord,
+    day_of,
+    format_time,
+    is_sleeping_on,
+)
+from .good_morning_sqlite import SqliteGoodMorningStore
+from .hitokoto import (
+    CATEGORIES as HITOKOTO_CATEGORIES,
+    HitokotoError,
+    HitokotoPool,
+    format_hitokoto,
+    parse_categories,
+)
+from .http_client import HttpClient
+from .image_fetch import (
+    ImageFetchError,
+    ImageTooLarge,
+    fetch_image,
+    fetch_image_bytes,
+)
+from .mcping import MCPingError, MCStatusClient
+from .mcs_card import MCSCardRenderer
+from .metrics import METRICS, instrumented
+from .mirrors import MirrorSelector
+from .moe import MoePrefetcher
+from .pending import PendingRequests
+from .poster import FontUnavailableError, PosterRenderer
+from .saucenao_cache import SauceNAOCache
+from .saucenao_scheduler import (
+    SauceNAONotConfigured,
+    SauceNAOQueueFull,
+    SauceNAORateLimited,
+    SauceNAOScheduler,
+)
+from .storage import JsonStore, atomic_write
+from .throttle import (
+    CommandGuard,
+    guarded,
+    message_text,
+    normalized_text,
+    parse_command_limits,
+    parse_limit,
+    retry_after_text,
+)
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
 logger = logging.getLogger("astrbot")
 
 
 @register("astrbot_plugin_essential", "Soulter", "", "", "")
 class Main(Star):
+    # mcs 一次最多查询的服务器数量
+    MCS_MAX_BATCH = 16
+    # 未配置 SauceNAO API key 时的提示
+    SAUCENAO_NOT_CONFIGURED = "管理员还没有配置 SauceNAO API key，暂时不能搜番喵"
+    # 插件目录下缺少中文字体时的提示
+    POSTER_FONT_MISSING = "缺少字体文件 simhei.ttf，请管理员放到插件目录下后再试喵"
+    # __init__ 超过这个耗时（秒）时打印警告，耗时的初始化应放到后台或首次使用时
+    INIT_TIME_BUDGET = 0.1
+
     def __init__(self, context: Context, config: AstrBotConfig) -> None:
+        init_started = time.perf_counter()
         super().__init__(context)
         self.PLUGIN_NAME = "astrbot_plugin_essential"
         PLUGIN_NAME = self.PLUGIN_NAME
         path = os.path.abspath(os.path.dirname(__file__))
-        self.mc_html_tmpl = open(
-            path + "/templates/mcs.html", "r", encoding="utf-8"
-        ).read()
-        self.what_to_eat_data: list = json.loads(
-            open(path + "/resources/food.json", "r", encoding="utf-8").read()
-        )["data"]
-
-        if not os.path.exists(f"data/{PLUGIN_NAME}_data.json"):
-            with open(f"data/{PLUGIN_NAME}_data.json", "w", encoding="utf-8") as f:
-                f.write(json.dumps({}, ensure_ascii=False, indent=2))
-        with open(f"data/{PLUGIN_NAME}_data.json", "r", encoding="utf-8") as f:
-            self.data = json.loads(f.read())
-        self.good_morning_data = self.data.get("good_morning", {})
+        # 指标统计，需在创建各组件前启用
+        METRICS.enabled = config.get("METRICS_ENABLED", True)
+        METRICS.reset()
+        METRICS.observe("startup_seconds", IMPORT_SECONDS, stage="import")
+        # 今天吃什么的菜单，数据保存在 data 目录
+        self.food_store = FoodStore(
+            f"data/{PLUGIN_NAME}_food.json", path + "/resources/food.json"
+        )
+        self.food_store.start_loading()
+
+        # 早晚安数据，防抖写盘
+        if config.get("GOOD_MORNING_STORAGE", "json") == "sqlite":
+            self.good_morning_store = SqliteGoodMorningStore(
+                f"data/{PLUGIN_NAME}_data.db",
+                json_path=f"data/{PLUGIN_NAME}_data.json",
+            )
+        else:
+            self.good_morning_store = GoodMorningStore(f"data/{PLUGIN_NAME}_data.json")
+        self.good_morning_store.start_loading()
+        self.sleeping_index = SleepingIndex()
 
         # moe
         self.moe_urls = [
@@ -45,315 +116,578 @@ class Main(Star):
             "https://www.loliapi.com/acg/",
             "https://www.loliapi.com/acg/pc/",
         ]
+        self.moe_mirrors = MirrorSelector(self.moe_urls)
+        self.moe_pool = MoePrefetcher(self._fetch_moe)
 
-        self.search_anmime_demand_users = {}
+        # 搜番等待发图的请求，键为 (platform, session, sender)
+        self.search_anime_pending = PendingRequests(self._on_search_anime_expire)
         # SauceNAO API配置
         self.saucenao_api_key = config.get("SAUCENAO_API_KEY")
+        # 多个 key 组成池子，由调度器按配额分配
+        self.saucenao_scheduler = SauceNAOScheduler(
+            [self.saucenao_api_key, *config.get("SAUCENAO_EXTRA_API_KEYS", [])]
+        )
         self.saucenao_api_url = "https://saucenao.com/search.php"
+        # 按图片感知哈希缓存搜番结果
+        self.saucenao_cache = SauceNAOCache(f"data/{PLUGIN_NAME}_saucenao_cache.json")
+        self.saucenao_cache.start_loading()
+
+        # 插件共享的 HTTP 连接池
+        self.http = HttpClient()
+        # mc 服务器状态查询（直连 + mcsrvstat.us 回退）
+        self.mc_status = MCStatusClient(self.http)
+        # 各群保存的服务器组：umo -> {组名: [地址]}
+        self.mcs_groups = JsonStore(f"data/{PLUGIN_NAME}_mcs_groups.json")
+        self.mcs_groups.load()
+        # 本地渲染 mcs 卡片
+        self.mcs_render_card = config.get("MCS_RENDER_CARD", True)
+        self.mcs_card = MCSCardRenderer()
+        # EPIC 免费游戏，按促销时间定时刷新
+        self.epic = EpicFreeGames(self.http)
+        # 订阅了喜加一推送的会话
+        self.epic_subscribers = JsonStore(f"data/{PLUGIN_NAME}_epic_subscribers.json")
+        self.epic_subscribers.load()
+        self.epic_subscriptions = EpicSubscriptions(
+            self.epic, self.epic_subscribers, self._send_epic_push
+        )
+        self.epic_subscriptions.start()
+        # 一言预取缓冲，上游不可用时使用本地语料
+        self.hitokoto_pool = HitokotoPool(
+            self.http, path + "/resources/hitokoto.json"
+        )
+        # 喜报/悲报渲染器
+        self.poster = PosterRenderer()
+        # 指令限流（每用户、每群令牌桶）和相同请求合并
+        self.command_guard = self._create_command_guard(config)
+
+        self._register_metrics()
+        self.metrics_file = config.get("METRICS_PROMETHEUS_FILE", "")
+        self._metrics_task: asyncio.Task = None
+        if self.metrics_file:
+            try:
+                self._metrics_task = asyncio.get_running_loop().create_task(
+                    self._dump_metrics_loop()
+                )
+            except RuntimeError:
+                logger.warning("不在事件循环中，Prometheus 指标导出未启动")
+
+        init_seconds = time.perf_counter() - init_started
+        METRICS.observe("startup_seconds", init_seconds, stage="init")
+        logger.info(
+            f"essential 插件加载耗时: 导入 {IMPORT_SECONDS * 1000:.1f}ms, "
+            f"初始化 {init_seconds * 1000:.1f}ms"
+        )
+        if init_seconds > self.INIT_TIME_BUDGET:
+            logger.warning(
+                f"essential 插件初始化耗时 {init_seconds * 1000:.1f}ms，"
+                f"超过预算 {self.INIT_TIME_BUDGET * 1000:.0f}ms"
+            )
+
+    def _create_command_guard(self, config: AstrBotConfig) -> CommandGuard:
+        limits = {}
+        for name, default in (("user", "10/60"), ("group", "30/60")):
+            option = f"THROTTLE_{name.upper()}_LIMIT"
+            try:
+                limits[name] = parse_limit(config.get(option, default))
+            except ValueError:
+                logger.warning(f"配置项 {option} 格式错误，使用默认值 {default}")
+                limits[name] = parse_limit(default)
+        return CommandGuard(
+            user_limit=limits["user"],
+            group_limit=limits["group"],
+            command_limits=parse_command_limits(config.get("THROTTLE_COMMAND_LIMITS", [])),
+            on_reject=self._on_throttled,
+            enabled=config.get("THROTTLE_ENABLED", True),
+        )
+
+    @staticmethod
+    def _on_throttled(scope: str, retry_after: float) -> CommandResult:
+        if scope == "group":
+            return CommandResult().error(
+                f"本群使用得太频繁了，请 {retry_after_text(retry_after)}后再试"
+            )
+        return CommandResult().error(f"你太快了，请 {retry_after_text(retry_after)}后再试")
+
+    def _register_metrics(self):
+        """各组件的状态（队列长度、缓存命中等）在查看统计时才采集"""
+        METRICS.register("http", self.http.stats)
+        METRICS.register("poster_cache", self.poster.cache.stats)
+        METRICS.register("mcs_card_cache", self.mcs_card.cache.stats)
+        METRICS.register("mc_status", self.mc_status.stats)
+        METRICS.register("search_anime_pending", self.search_anime_pending.stats)
+        METRICS.register("saucenao_scheduler", self.saucenao_scheduler.stats)
+        METRICS.register("saucenao_cache", self.saucenao_cache.stats)
+        METRICS.register("moe_pool", self.moe_pool.stats)
+        METRICS.register("moe_mirrors", self.moe_mirrors.stats)
+        METRICS.register("hitokoto", self.hitokoto_pool.stats)
+        METRICS.register("epic_subscriptions", self.epic_subscriptions.stats)
+        METRICS.register("food", self.food_store.stats)
+        METRICS.register("command_guard", self.command_guard.stats)
+
+    async def _dump_metrics_loop(self, interval: float = 60):
+        """定期把指标以 Prometheus 文本格式写入文件，供 node_exporter textfile collector 等读取"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(
+                    None, atomic_write, self.metrics_file, METRICS.prometheus()
+                )
+            except Exception:
+                logger.exception(f"写入指标文件 {self.metrics_file} 失败")
+
+    async def terminate(self):
+        """插件卸载时释放资源。各项分别关闭，某一项出错不影响其它资源的释放"""
+        if self._metrics_task is not None:
+            self._metrics_task.cancel()
+        # 定时器和后台任务先停，避免卸载后旧实例仍在推送或请求
+        closers = [
+            self.epic_subscriptions.close,
+            self.epic.close,
+            self.poster.close,
+            self.mcs_card.close,
+            self.good_morning_store.close,
+            self.search_anime_pending.close,
+            self.saucenao_cache.close,
+            self.saucenao_scheduler.close,
+            self.moe_pool.close,
+            self.mcs_groups.close,
+            self.epic_subscribers.close,
+            self.hitokoto_pool.close,
+            self.food_store.close,
+        ]
+        for close in closers:
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception(f"释放 {close.__qualname__} 失败")
+        # 连接池最后关闭，避免后台任务在退出过程中请求失败
+        logger.info(f"HTTP 连接池统计: {self.http.stats()}")
+        await self.http.close()
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("essential")
+    async def essential_admin(self, message: AstrMessageEvent):
+        """插件管理指令。格式: essential stats [reset]"""
+        args = message.message_str.split()[1:]
+        if not args or args[0] != "stats":
+            return CommandResult().error("格式：essential stats [reset]")
+        if len(args) > 1 and args[1] == "reset":
+            METRICS.reset()
+            return CommandResult().message("已清空统计数据")
+        return CommandResult().message(METRICS.format_text()).use_t2i(False)
 
     def time_convert(self, t):
         m, s = divmod(t, 60)
         return f"{int(m)}分{int(s)}秒"
 
+    @staticmethod
+    def _search_anime_key(message: AstrMessageEvent) -> tuple:
+        return (
+            message.get_platform_name(),
+            message.get_session_id(),
+            message.get_sender_id(),
+        )
+
+    async def _on_search_anime_expire(self, key: tuple, message: AstrMessageEvent):
+        await message.send(
+            MessageChain().message("🧐你没有发送图片，搜番请求已取消了喵")
+        )
+
     @filter.event_message_type(filter.EventMessageType.ALL)
     async def handle_search_anime(self, message: AstrMessageEvent):
         """检查是否有搜番请求"""
-        sender = message.get_sender_id()
-        if sender in self.search_anmime_demand_users:
-            message_obj = message.message_obj
-            image_obj = None
-
-            # 遍历消息链寻找图片（兼容所有平台）
-            for comp in message_obj.message:
-                if isinstance(comp, Image):
-                    image_obj = comp
-                    break
-
-            # 微信平台特殊处理
-            if not image_obj and message.get_platform_name() in ["gewechat", "wechatpadpro"]:
-                raw_msg = message.message_obj.raw_message
-                if 'image' in raw_msg:
-                    image_obj = Image.fromURL(raw_msg['image'])
-
-            if not image_obj:
-                if sender in self.search_anmime_demand_users:
-                    del self.search_anmime_demand_users[sender]
-                return CommandResult().error("未找到有效的图片数据")
+        key = self._search_anime_key(message)
+        if key in self.search_anime_pending:
+            with METRICS.timer("command_seconds", command="搜番识别"):
+                return await self._search_anime_image(message, key)
 
-            try:
-                # ==== 关键修复部分 ====
-                temp_file = None
-                headers = {
-                    "Referer": "https://weixin.qq.com/",
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36"
-                }
-
-                # 微信平台强制下载图片到本地
-                if message.get_platform_name() in ["gewechat", "wechatpadpro"]:
-                    temp_file = "temp_wechat_img.jpg"
-                    logger.info(f"开始下载微信图片: {image_obj.url}")
-
-                    for attempt in range(3):  # 增加重试机制
-                        try:
-                            async with aiohttp.ClientSession() as session:
-                                async with session.get(image_obj.url, headers=headers, timeout=10) as resp:
-                                    if resp.status != 200:
-                                        logger.error(f"图片下载失败 HTTP {resp.status}")
-                                        continue
-                                    with open(temp_file, "wb") as f:
-                                        f.write(await resp.read())
-                                    logger.info("微信图片下载成功")
-                                    break
-                        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
-                            logger.warning(f"图片下载失败(尝试 {attempt + 1}/3): {str(e)}")
-                            if attempt == 2:
-                                raise
-                            await asyncio.sleep(1)
-                else:
-                    temp_file = image_obj.url
-
-                # 使用POST表单上传图片数据（关键修复）
-                form_data = aiohttp.FormData()
-
-                # 微信平台使用文件上传，其他平台使用URL
-                if message.get_platform_name() in ["gewechat", "wechatpadpro"]:
-                    form_data.add_field('file',
-                                        open(temp_file, 'rb'),
-                                        filename='image.jpg',
-                                        content_type='image/jpeg')
-                else:
-                    form_data.add_field('url', temp_file)
-
-                # 添加API参数
-                form_data.add_field('api_key', self.saucenao_api_key)
-                form_data.add_field('db', '999')
-                form_data.add_field('output_type', '2')
-
-                # 设置超时和SSL配置
-                connector = aiohttp.TCPConnector(ssl=False)
-                timeout = aiohttp.ClientTimeout(total=15, connect=5)
-
-                logger.info(f"准备请求SauceNAO API: {self.saucenao_api_url}")
-                async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-                    async with session.post(
-                            self.saucenao_api_url,
-                            data=form_data,
-                            headers=headers
-                    ) as resp:
-                        logger.info(f"API响应状态: {resp.status}")
-                        if resp.status != 200:
-                            error_msg = f"SauceNAO API请求失败: {resp.status}"
-                            logger.error(error_msg)
-                            try:
-                                error_content = await resp.text()
-                                logger.error(f"API错误响应: {error_content[:500]}")
-                            except:
-                                logger.exception("获取错误响应失败")
-                            return CommandResult().error(f"API服务错误({resp.status})")
-
-                        try:
-                            data = await resp.json()
-                            logger.info("成功解析API返回的JSON数据")
-                        except Exception as e:
-                            logger.error(f"解析JSON失败: {str(e)}")
-                            try:
-                                data_text = await resp.text()
-                                logger.debug(f"API原始响应: {data_text[:500]}")
-                            except:
-                                logger.exception("获取原始响应失败")
-                            return CommandResult().error("API返回数据格式错误")
-
-                # 处理SauceNAO返回结果
-                if data.get("results") and len(data["results"]) > 0:
-                    logger.info(f"找到 {len(data['results'])} 条记录")
-                    best_result = data["results"][0]
-                    header = best_result["header"]
-                    data_part = best_result["data"]
-
-                    # 提取信息
-                    similarity = float(header["similarity"])
-                    source = data_part.get("source") or data_part.get("title") or "未知来源"
-                    author = data_part.get("member_name") or data_part.get("author") or "未知作者"
-                    ext_urls = data_part.get("ext_urls", [])
-
-                    logger.info(f"相似度: {similarity}%, 番名: {source}, 作者: {author}")
-
-                    warn = ""
-                    if similarity < 80.0:
-                        warn = "相似度过低，可能不是同一番剧。建议：相同尺寸大小的截图; 去除四周的黑边\n\n"
-                        logger.warning("相似度过低警告")
-
-                    if sender in self.search_anmime_demand_users:
-                        logger.info("清除用户搜番状态")
-                        del self.search_anmime_demand_users[sender]
-
-                    result_text = (
-                        f"{warn}番名: {source}\n"
-                        f"相似度: {similarity}%\n"
-                        f"作者: {author}\n"
-                    )
+    async def _hash_image(self, data) -> int:
+        """计算图片的感知哈希，失败时返回 None，不影响搜番"""
+        try:
+            return await self.saucenao_cache.hash_image(data)
+        except Exception as e:
+            logger.warning(f"计算图片哈希失败: {str(e)}")
+            return None
 
-                    if ext_urls:
-                        result_text += f"来源: {ext_urls[0]}\n"
-                        logger.info(f"来源链接: {ext_urls[0]}")
+    async def _hash_remote_image(self, url: str, headers: dict) -> int:
+        """下载图片仅用于查搜番缓存：使用较短的超时，直接从下载的临时文件计算哈希，不压缩"""
+        try:
+            with METRICS.timer("image_fetch_seconds", stage="download"):
+                spool = await fetch_image(self.http, url, headers, endpoint="image_hash")
+        except (
+            ImageFetchError,
+            ImageTooLarge,
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+        ) as e:
+            logger.warning(f"下载图片计算哈希失败: {str(e)}")
+            return None
+        try:
+            return await self._hash_image(spool)
+        finally:
+            spool.close()
+
+    async def _search_anime_image(self, message: AstrMessageEvent, key: tuple):
+        """处理等待中的搜番请求收到的消息"""
+        message_obj = message.message_obj
+        image_obj = None
+
+        # 遍历消息链寻找图片（兼容所有平台）
+        for comp in message_obj.message:
+            if isinstance(comp, Image):
+                image_obj = comp
+                break
+
+        # 微信平台特殊处理
+        if not image_obj and message.get_platform_name() in ["gewechat", "wechatpadpro"]:
+            raw_msg = message.message_obj.raw_message
+            if 'image' in raw_msg:
+                image_obj = Image.fromURL(raw_msg['image'])
+
+        # 收到消息即结束等待，排队期间不会再触发超时提示
+        self.search_anime_pending.pop(key)
+        if not image_obj:
+            return CommandResult().error("未找到有效的图片数据")
+
+        try:
+            headers = {
+                "Referer": "https://weixin.qq.com/",
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36"
+            }
+            is_wechat = message.get_platform_name() in ["gewechat", "wechatpadpro"]
+            image_data = None
+            image_hash = None
+
+            # 微信平台必须下载图片后上传
+            if is_wechat:
+                logger.info(f"开始下载微信图片: {image_obj.url}")
 
-                    logger.info("返回搜番结果")
-                    return CommandResult(
-                        chain=[Plain(result_text)],
-                        use_t2i_=False,
+                for attempt in range(3):  # 增加重试机制
+                    try:
+                        image_data = await fetch_image_bytes(
+                            self.http, image_obj.url, headers
+                        )
+                        logger.info("微信图片下载成功")
+                        break
+                    except ImageFetchError as e:
+                        logger.error(f"图片下载失败 {str(e)}")
+                        continue
+                    except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                        logger.warning(f"图片下载失败(尝试 {attempt + 1}/3): {str(e)}")
+                        if attempt == 2:
+                            raise
+                        await asyncio.sleep(1)
+                if not image_data:
+                    return CommandResult().error("图片下载失败，请重试")
+                image_hash = await self._hash_image(image_data)
+            else:
+                image_hash = await self._hash_remote_image(
+                    image_obj.url, {"User-Agent": headers["User-Agent"]}
+                )
+
+            # 相同或相近的图片直接使用缓存结果
+            data = None
+            if image_hash is not None:
+                await self.saucenao_cache.ensure_loaded()
+                data = self.saucenao_cache.get(image_hash)
+            if data is None:
+                upload = image_data if is_wechat else None
+
+                async def on_queued(position: int):
+                    await message.send(
+                        MessageChain().message(
+                            f"搜番的人有点多，你排在第 {position} 位，请稍候喵"
+                        )
                     )
-                else:
-                    logger.info("API返回结果为空")
-                    if sender in self.search_anmime_demand_users:
-                        del self.search_anmime_demand_users[sender]
-                    return CommandResult(True, False, [Plain("没有找到番剧")], "sf")
-
-            # ==== 增强异常处理 ====
-            except aiohttp.InvalidURL as e:
-                logger.error(f"URL格式错误: {str(e)}")
-                return CommandResult().error("图片URL无效，请重试")
-            except aiohttp.ClientConnectionError as e:
-                logger.error(f"连接失败: {str(e)}")
-                return CommandResult().error("无法连接服务器，请检查网络")
-            except aiohttp.ClientTimeout as e:
-                logger.error(f"请求超时: {str(e)}")
-                return CommandResult().error("响应超时，请重试或更换图片")
-            except aiohttp.ClientResponseError as e:
-                logger.error(f"HTTP错误 {e.status}: {e.message}")
-                return CommandResult().error(f"服务器错误({e.status})")
+
+                data = await self.saucenao_scheduler.submit(
+                    key,
+                    lambda api_key: self._request_saucenao(
+                        image_obj.url, upload, headers, api_key
+                    ),
+                    on_queued=on_queued,
+                )
+                if isinstance(data, CommandResult):
+                    return data
+                if image_hash is not None and data.get("results"):
+                    self.saucenao_cache.put(
+                        image_hash, {"results": data["results"][:3]}
+                    )
+
+            # 处理SauceNAO返回结果
+            if data.get("results") and len(data["results"]) > 0:
+                logger.info(f"找到 {len(data['results'])} 条记录")
+                best_result = data["results"][0]
+                header = best_result["header"]
+                data_part = best_result["data"]
+
+                # 提取信息
+                similarity = float(header["similarity"])
+                source = data_part.get("source") or data_part.get("title") or "未知来源"
+                author = data_part.get("member_name") or data_part.get("author") or "未知作者"
+                ext_urls = data_part.get("ext_urls", [])
+
+                logger.info(f"相似度: {similarity}%, 番名: {source}, 作者: {author}")
+
+                warn = ""
+                if similarity < 80.0:
+                    warn = "相似度过低，可能不是同一番剧。建议：相同尺寸大小的截图; 去除四周的黑边\n\n"
+                    logger.warning("相似度过低警告")
+
+                result_text = (
+                    f"{warn}番名: {source}\n"
+                    f"相似度: {similarity}%\n"
+                    f"作者: {author}\n"
+                )
+
+                if ext_urls:
+                    result_text += f"来源: {ext_urls[0]}\n"
+                    logger.info(f"来源链接: {ext_urls[0]}")
+
+                logger.info("返回搜番结果")
+                return CommandResult(
+                    chain=[Plain(result_text)],
+                    use_t2i_=False,
+                )
+            else:
+                logger.info("API返回结果为空")
+                return CommandResult(True, False, [Plain("没有找到番剧")], "sf")
+
+        # ==== 增强异常处理 ====
+        except ImageTooLarge as e:
+            logger.warning(f"图片过大: {str(e)}")
+            return CommandResult().error("图片太大了，请换一张小一点的图片喵")
+        except SauceNAONotConfigured:
+            return CommandResult().error(self.SAUCENAO_NOT_CONFIGURED)
+        except SauceNAOQueueFull as e:
+            logger.warning(f"搜番请求被拒绝: {str(e)}")
+            return CommandResult().error("搜番的人太多了，请稍后再试喵")
+        except SauceNAORateLimited as e:
+            logger.error(f"SauceNAO 限流: {str(e)}")
+            return CommandResult().error("搜番次数已达上限，请稍后再试喵")
+        except aiohttp.InvalidURL as e:
+            logger.error(f"URL格式错误: {str(e)}")
+            return CommandResult().error("图片URL无效，请重试")
+        except aiohttp.ClientConnectionError as e:
+            logger.error(f"连接失败: {str(e)}")
+            return CommandResult().error("无法连接服务器，请检查网络")
+        except asyncio.TimeoutError as e:
+            logger.error(f"请求超时: {str(e)}")
+            return CommandResult().error("响应超时，请重试或更换图片")
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"HTTP错误 {e.status}: {e.message}")
+            return CommandResult().error(f"服务器错误({e.status})")
+        except Exception as e:
+            logger.exception("搜番处理异常")
+            return CommandResult().error(f"处理失败: {str(e)}")
+
+    async def _request_saucenao(
+        self, image_url: str, image_data: bytes, headers: dict, api_key: str
+    ):
+        """请求 SauceNAO，成功返回解析后的 JSON，失败返回 CommandResult。
+
+        被限流时抛出 `SauceNAORateLimited`，由调度器换 key 重试。
+        """
+        # 使用POST表单上传图片数据（关键修复）
+        form_data = aiohttp.FormData()
+
+        # 微信平台使用文件上传，其他平台使用URL
+        if image_data is not None:
+            form_data.add_field('file',
+                                image_data,
+                                filename='image.jpg',
+                                content_type='image/jpeg')
+        else:
+            form_data.add_field('url', image_url)
+
+        # 添加API参数
+        form_data.add_field('api_key', api_key)
+        form_data.add_field('db', '999')
+        form_data.add_field('output_type', '2')
+
+        logger.info(f"准备请求SauceNAO API: {self.saucenao_api_url}")
+        async with self.http.post(
+                self.saucenao_api_url,
+                endpoint="saucenao",
+                data=form_data,
+                headers=headers,
+                ssl=False,
+        ) as resp:
+            logger.info(f"API响应状态: {resp.status}")
+            if resp.status == 429:
+                error_content = await resp.text()
+                raise SauceNAORateLimited(daily="daily" in error_content.lower())
+            if resp.status != 200:
+                error_msg = f"SauceNAO API请求失败: {resp.status}"
+                logger.error(error_msg)
+                try:
+                    error_content = await resp.text()
+                    logger.error(f"API错误响应: {error_content[:500]}")
+                except:
+                    logger.exception("获取错误响应失败")
+                return CommandResult().error(f"API服务错误({resp.status})")
+
+            try:
+                data = await resp.json()
+                logger.info("成功解析API返回的JSON数据")
             except Exception as e:
-                logger.exception("搜番处理异常")
-                return CommandResult().error(f"处理失败: {str(e)}")
-            finally:
-                # 清理临时文件
-                if (message.get_platform_name() in ["gewechat", "wechatpadpro"] and
-                        temp_file and os.path.exists(temp_file)):
-                    try:
-                        os.remove(temp_file)
-                        logger.info("临时文件已清理")
-                    except Exception as e:
-                        logger.warning(f"删除临时文件失败: {str(e)}")
+                logger.error(f"解析JSON失败: {str(e)}")
+                try:
+                    data_text = await resp.text()
+                    logger.debug(f"API原始响应: {data_text[:500]}")
+                except:
+                    logger.exception("获取原始响应失败")
+                return CommandResult().error("API返回数据格式错误")
+        return data
 
     @filter.command("喜报")
+    @guarded("喜报", coalesce=message_text)
+    @instrumented("喜报")
     async def congrats(self, message: AstrMessageEvent):
         """喜报生成器"""
         msg = message.message_str.replace("喜报", "").strip()
-        for i in range(20, len(msg), 20):
-            msg = msg[:i] + "\n" + msg[i:]
-
-        path = os.path.abspath(os.path.dirname(__file__))
-        bg = path + "/congrats.jpg"
-        img = PILImage.open(bg)
-        draw = PILImageDraw.Draw(img)
-        font = PILImageFont.truetype(path + "/simhei.ttf", 65)
-
-        # Calculate the width and height of the text
-        text_width, text_height = draw.textbbox((0, 0), msg, font=font)[2:4]
-
-        # Calculate the starting position of the text to center it.
-        x = (img.size[0] - text_width) / 2
-        y = (img.size[1] - text_height) / 2
-
-        draw.text(
-            (x, y),
-            msg,
-            font=font,
-            fill=(255, 0, 0),
-            stroke_width=3,
-            stroke_fill=(255, 255, 0),
-        )
-
-        img.save("congrats_result.jpg")
-        return CommandResult().file_image("congrats_result.jpg")
+        try:
+            data = await self.poster.render("congrats", msg)
+        except FontUnavailableError:
+            return CommandResult().error(self.POSTER_FONT_MISSING)
+        return CommandResult(chain=[Image.fromBytes(data)])
 
     @filter.command("悲报")
+    @guarded("悲报", coalesce=message_text)
+    @instrumented("悲报")
     async def uncongrats(self, message: AstrMessageEvent):
         """悲报生成器"""
         msg = message.message_str.replace("悲报", "").strip()
-        for i in range(20, len(msg), 20):
-            msg = msg[:i] + "\n" + msg[i:]
+        try:
+            data = await self.poster.render("uncongrats", msg)
+        except FontUnavailableError:
+            return CommandResult().error(self.POSTER_FONT_MISSING)
+        return CommandResult(chain=[Image.fromBytes(data)])
 
-        path = os.path.abspath(os.path.dirname(__file__))
-        bg = path + "/uncongrats.jpg"
-        img = PILImage.open(bg)
-        draw = PILImageDraw.Draw(img)
-        font = PILImageFont.truetype(path + "/simhei.ttf", 65)
-
-        # Calculate the width and height of the text
-        text_width, text_height = draw.textbbox((0, 0), msg, font=font)[2:4]
-
-        # Calculate the starting position of the text to center it.
-        x = (img.size[0] - text_width) / 2
-        y = (img.size[1] - text_height) / 2
-
-        draw.text(
-            (x, y),
-            msg,
-            font=font,
-            fill=(0, 0, 0),
-            stroke_width=3,
-            stroke_fill=(255, 255, 255),
-        )
+    async def _fetch_moe_from(self, url: str) -> bytes:
+        async with self.http.get(url, endpoint="moe") as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"获取图片失败: {resp.status}")
+            return await resp.read()
 
-        img.save("uncongrats_result.jpg")
-        return CommandResult().file_image("uncongrats_result.jpg")
+    async def _fetch_moe(self) -> bytes:
+        """从最健康的图片 API 下载一张图片"""
+        return await self.moe_mirrors.fetch(self._fetch_moe_from)
 
     @filter.command("moe")
+    @guarded("moe")
+    @instrumented("moe")
     async def get_moe(self, message: AstrMessageEvent):
         """随机动漫图片"""
-        shuffle = random.sample(self.moe_urls, len(self.moe_urls))
-        for url in shuffle:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url) as resp:
-                        if resp.status != 200:
-                            return CommandResult().error(f"获取图片失败: {resp.status}")
-                        data = await resp.read()
-                        break
-            except Exception as e:
-                logger.error(f"从 {url} 获取图片失败: {e}。正在尝试下一个API。")
-                continue
-        # 保存图片到本地
         try:
-            with open("moe.jpg", "wb") as f:
-                f.write(data)
-            return CommandResult().file_image("moe.jpg")
-
+            data = await self.moe_pool.get()
         except Exception as e:
-            return CommandResult().error(f"保存图片失败: {e}")
+            return CommandResult().error(str(e))
+        return CommandResult(chain=[Image.fromBytes(data)])
 
     @filter.command("搜番")
+    @guarded("搜番")
+    @instrumented("搜番")
     async def get_search_anime(self, message: AstrMessageEvent):
         """以图搜番"""
-        sender = message.get_sender_id()
-        if sender in self.search_anmime_demand_users:
+        if not self.saucenao_scheduler.configured:
+            yield CommandResult().error(self.SAUCENAO_NOT_CONFIGURED)
+            return
+        key = self._search_anime_key(message)
+        if not self.search_anime_pending.add(key, message, timeout=30):
             yield message.plain_result("正在等你发图喵，请不要重复发送")
-        self.search_anmime_demand_users[sender] = False
+            return
         yield message.plain_result("请在 30 喵内发送一张图片让我识别喵")
-        await asyncio.sleep(30)
-        if sender in self.search_anmime_demand_users:
-            if self.search_anmime_demand_users[sender]:
-                del self.search_anmime_demand_users[sender]
-                return
-            del self.search_anmime_demand_users[sender]
-            yield message.plain_result("🧐你没有发送图片，搜番请求已取消了喵")
+
+    def _mcs_coalesce_key(self, message: AstrMessageEvent):
+        """mcs 按规范化后的地址合并；分组管理不合并，组名只在本群内合并"""
+        args = re.split(r"[\s,，]+", message.message_str.removeprefix("mcs").strip())
+        if not args[0] or args[0] == "分组":
+            return None
+        umo = message.unified_msg_origin
+        if len(args) == 1 and args[0] in self.mcs_groups.data.get(umo, {}):
+            return umo, args[0]
+        return tuple(arg.lower() for arg in args)
 
     @filter.command("mcs")
+    @guarded("mcs", coalesce=_mcs_coalesce_key)
+    @instrumented("mcs")
     async def mcs(self, message: AstrMessageEvent):
         """查mc服务器"""
         message_str = message.message_str
         if message_str == "mcs":
-            return CommandResult().error("查 Minecraft 服务器。格式: /mcs [服务器地址]")
-        ip = message_str.replace("mcs", "").strip()
-        url = f"https://api.mcsrvstat.us/2/{ip}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                if resp.status != 200:
-                    return CommandResult().error("请求失败")
-                data = await resp.json()
-                logger.info(f"获取到 {ip} 的服务器信息。")
+            return CommandResult().error(
+                "查 Minecraft 服务器。格式: /mcs [服务器地址] [更多地址...] 或 /mcs [服务器组名]\n"
+                "管理服务器组: /mcs 分组 添加|删除|列表 [组名] [服务器地址...]"
+            )
+        args = re.split(r"[\s,，]+", message_str.removeprefix("mcs").strip())
+        if args[0] == "分组":
+            return await self._mcs_group(message.unified_msg_origin, args[1:])
+
+        groups = self.mcs_groups.data.get(message.unified_msg_origin, {})
+        if len(args) == 1 and args[0] in groups:
+            addresses = groups[args[0]]
+        else:
+            addresses = list(dict.fromkeys(args))
+        if len(addresses) > self.MCS_MAX_BATCH:
+            return CommandResult().error(f"一次最多查询 {self.MCS_MAX_BATCH} 个服务器")
+        if len(addresses) == 1:
+            return await self._mcs_single(addresses[0])
+
+        results = await self.mc_status.query_many(addresses)
+        return CommandResult().message(self._format_mcs_table(results)).use_t2i(False)
+
+    def _format_mcs_table(self, results: list) -> str:
+        online = sum(1 for _, data, _ in results if data and data.get("online"))
+        lines = [f"【批量查询结果】在线 {online}/{len(results)}"]
+        for address, data, error in results:
+            if data is None or "error" in data:
+                error = error or data.get("error")
+                lines.append(f"⚪ {address} | 查询失败: {error}")
+                continue
+            if not data.get("online"):
+                lines.append(f"🔴 {address} | 离线")
+                continue
+            players = data.get("players") or {}
+            row = f"🟢 {address} | {data.get('version', '未知')} | {players.get('online', '?')}/{players.get('max', '?')}"
+            if data.get("latency") is not None:
+                row += f" | {data['latency']}ms"
+            lines.append(row)
+        return "\n".join(lines)
+
+    async def _mcs_group(self, umo: str, args: list):
+        """管理本群保存的服务器组"""
+        groups = self.mcs_groups.data.setdefault(umo, {})
+        action = args[0] if args else "列表"
+        if action == "列表":
+            if not groups:
+                return CommandResult().message("本群还没有保存服务器组")
+            return CommandResult().message(
+                "\n".join(f"{name}: {' '.join(addrs)}" for name, addrs in groups.items())
+            ).use_t2i(False)
+        if action == "添加" and len(args) >= 3:
+            addresses = list(dict.fromkeys(args[2:]))[: self.MCS_MAX_BATCH]
+            groups[args[1]] = addresses
+            self.mcs_groups.mark_dirty()
+            return CommandResult().message(f"已保存服务器组 {args[1]}，共 {len(addresses)} 个服务器")
+        if action == "删除" and len(args) >= 2:
+            if groups.pop(args[1], None) is None:
+                return CommandResult().error(f"没有名为 {args[1]} 的服务器组")
+            self.mcs_groups.mark_dirty()
+            return CommandResult().message(f"已删除服务器组 {args[1]}")
+        return CommandResult().error("格式: /mcs 分组 添加 [组名] [服务器地址...] | 删除 [组名] | 列表")
+
+    async def _mcs_single(self, ip: str):
+        try:
+            data = await self.mc_status.query(ip)
+        except MCPingError as e:
+            logger.error(f"查询 {ip} 失败: {e}")
+            return CommandResult().error("请求失败")
+        logger.info(f"获取到 {ip} 的服务器信息。")
 
-        # result = await context.image_renderer.render_custom_template(self.mc_html_tmpl, data, return_url=True)
         motd = "查询失败"
         if (
             "motd" in data
@@ -372,6 +706,16 @@ class Main(Star):
         if "error" in data:
             return CommandResult().error(f"查询失败: {data['error']}")
 
+        if self.mcs_render_card:
+            try:
+                card = await self.mcs_card.render(ip, data)
+                return CommandResult(chain=[Image.fromBytes(card)])
+            except FontUnavailableError:
+                # 没有中文字体时卡片上的文字无法阅读，已在加载字体时提示过
+                pass
+            except Exception:
+                logger.exception("渲染服务器卡片失败，使用文字结果")
+
         name_list = []
 
         if "players" in data:
@@ -391,12 +735,17 @@ class Main(Star):
         if not name_list_str:
             name_list_str = "无玩家在线"
 
+        latency = ""
+        if data.get("latency") is not None:
+            latency = f"延迟: {data['latency']}ms\n"
+
         result_text = (
             "【查询结果】\n"
             f"状态: {status}\n"
             f"服务器IP: {ip}\n"
             f"版本: {version}\n"
-            f"MOTD: {motd}"
+            f"{latency}"
+            f"MOTD: {motd}\n"
             f"玩家人数: {players}\n"
             f"在线玩家: \n{name_list_str}"
         )
@@ -404,193 +753,133 @@ class Main(Star):
         return CommandResult().message(result_text).use_t2i(False)
 
     @filter.command("一言")
+    @guarded("一言", coalesce=normalized_text)
+    @instrumented("一言")
     async def hitokoto(self, message: AstrMessageEvent):
-        """来一条一言"""
-        url = "https://v1.hitokoto.cn"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                if resp.status != 200:
-                    return CommandResult().error("请求失败")
-                data = await resp.json()
-        return CommandResult().message(data["hitokoto"] + " —— " + data["from"])
-
-    async def save_what_eat_data(self):
-        path = os.path.abspath(os.path.dirname(__file__))
-        with open(path + "/resources/food.json", "w", encoding="utf-8") as f:
-            f.write(
-                json.dumps(
-                    {"data": self.what_to_eat_data}, ensure_ascii=False, indent=2
-                )
+        """来一条一言，可以指定类型，如 `一言 动画 游戏`"""
+        args = message.message_str.removeprefix("一言").split()
+        try:
+            categories = parse_categories(args)
+        except ValueError as e:
+            return CommandResult().error(
+                f"未知的类型: {e}，可选: {'、'.join(HITOKOTO_CATEGORIES)}"
             )
+        try:
+            data = await self.hitokoto_pool.get(categories)
+        except HitokotoError as e:
+            return CommandResult().error(str(e))
+        return CommandResult().message(format_hitokoto(data))
 
     @filter.command("今天吃什么")
+    @guarded("今天吃什么")
+    @instrumented("今天吃什么")
     async def what_to_eat(self, message: AstrMessageEvent):
         """今天吃什么"""
-        if "添加" in message.message_str:
-            l = message.message_str.split(" ")
+        args = message.message_str.removeprefix("今天吃什么").split()
+        umo = message.unified_msg_origin
+        action = args[0] if args else ""
+        if action in ("添加", "删除", "本群添加", "本群删除"):
+            foods = args[1:]
             # 今天吃什么 添加 xxx xxx xxx
-            if len(l) < 3:
-                return CommandResult().error(
-                    "格式：今天吃什么 添加 [食物1] [食物2] ..."
-                )
-            self.what_to_eat_data += l[2:]  # 添加食物
-            await self.save_what_eat_data()
-            return CommandResult().message("添加成功")
-        elif "删除" in message.message_str:
-            l = message.message_str.split(" ")
-            # 今天吃什么 删除 xxx xxx xxx
-            if len(l) < 3:
-                return CommandResult().error(
-                    "格式：今天吃什么 删除 [食物1] [食物2] ..."
+            if not foods:
+                return CommandResult().error(f"格式：今天吃什么 {action} [食物1] [食物2] ...")
+            scope = umo if action.startswith("本群") else None
+            if action.endswith("添加"):
+                changed = await self.food_store.add(foods, scope)
+                return CommandResult().message(
+                    "添加成功" if changed else "这些食物已经在菜单里了"
                 )
-            for i in l[2:]:
-                if i in self.what_to_eat_data:
-                    self.what_to_eat_data.remove(i)
-            await self.save_what_eat_data()
-            return CommandResult().message("删除成功")
+            changed = await self.food_store.remove(foods, scope)
+            return CommandResult().message("删除成功" if changed else "菜单里没有这些食物")
 
-        ret = f"今天吃 {random.choice(self.what_to_eat_data)}！"
-        return CommandResult().message(ret)
+        await self.food_store.ensure_loaded()
+        food = self.food_store.choice(umo)
+        if food is None:
+            return CommandResult().message("菜单是空的，先用“今天吃什么 添加”加点吃的吧")
+        return CommandResult().message(f"今天吃 {food}！")
 
     @filter.command("喜加一")
+    @guarded("喜加一", coalesce=normalized_text)
+    @instrumented("喜加一")
     async def epic_free_game(self, message: AstrMessageEvent):
         """EPIC 喜加一"""
-        url = "https://store-site-backend-static-ipv4.ak.epicgames.com/freeGamesPromotions"
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                if resp.status != 200:
-                    return CommandResult().error("请求失败")
-                data = await resp.json()
-
-        games = []
-        upcoming = []
-
-        for game in data["data"]["Catalog"]["searchStore"]["elements"]:
-            title = game.get("title", "未知")
-            try:
-                if not game.get("promotions"):
-                    continue
-                original_price = game["price"]["totalPrice"]["fmtPrice"][
-                    "originalPrice"
-                ]
-                discount_price = game["price"]["totalPrice"]["fmtPrice"][
-                    "discountPrice"
-                ]
-                promotions = game["promotions"]["promotionalOffers"]
-                upcoming_promotions = game["promotions"]["upcomingPromotionalOffers"]
-
-                if promotions:
-                    promotion = promotions[0]["promotionalOffers"][0]
-                else:
-                    promotion = upcoming_promotions[0]["promotionalOffers"][0]
-                start = promotion["startDate"]
-                end = promotion["endDate"]
-                # 2024-09-19T15:00:00.000Z
-                start_utc8 = datetime.datetime.strptime(
-                    start, "%Y-%m-%dT%H:%M:%S.%fZ"
-                ) + datetime.timedelta(hours=8)
-                start_human = start_utc8.strftime("%Y-%m-%d %H:%M")
-                end_utc8 = datetime.datetime.strptime(
-                    end, "%Y-%m-%dT%H:%M:%S.%fZ"
-                ) + datetime.timedelta(hours=8)
-                end_human = end_utc8.strftime("%Y-%m-%d %H:%M")
-                discount = float(promotion["discountSetting"]["discountPercentage"])
-                if discount != 0:
-                    # 过滤掉不是免费的游戏
-                    continue
-
-                if promotions:
-                    games.append(
-                        f"【{title}】\n原价: {original_price} | 现价: {discount_price}\n活动时间: {start_human} - {end_human}"
-                    )
-                else:
-                    upcoming.append(
-                        f"【{title}】\n原价: {original_price} | 现价: {discount_price}\n活动时间: {start_human} - {end_human}"
-                    )
-
-            except BaseException as e:
-                raise e
-                games.append(f"处理 {title} 时出现错误")
+        try:
+            result = await self.epic.get()
+        except EpicFetchError as e:
+            logger.error(f"获取 EPIC 数据失败: {e}")
+            return CommandResult().error("请求失败")
 
-        if len(games) == 0:
+        if len(result["games"]) == 0:
             return CommandResult().message("暂无免费游戏")
-        return (
-            CommandResult()
-            .message(
-                "【EPIC 喜加一】\n"
-                + "\n\n".join(games)
-                + "\n\n"
-                + "【即将免费】\n"
-                + "\n\n".join(upcoming)
-            )
-            .use_t2i(False)
-        )
+        return CommandResult().message(format_epic_message(result)).use_t2i(False)
+
+    @filter.command("喜加一订阅")
+    @guarded("喜加一订阅")
+    @instrumented("喜加一订阅")
+    async def epic_subscribe(self, message: AstrMessageEvent):
+        """订阅 EPIC 喜加一推送"""
+        if self.epic_subscriptions.subscribe(message.unified_msg_origin):
+            return CommandResult().message("订阅成功，EPIC 免费游戏更新时会推送到这里")
+        return CommandResult().message("已经订阅过了")
+
+    @filter.command("喜加一退订")
+    @guarded("喜加一退订")
+    @instrumented("喜加一退订")
+    async def epic_unsubscribe(self, message: AstrMessageEvent):
+        """取消 EPIC 喜加一推送"""
+        if self.epic_subscriptions.unsubscribe(message.unified_msg_origin):
+            return CommandResult().message("已取消订阅")
+        return CommandResult().message("当前会话没有订阅")
+
+    async def _send_epic_push(self, umo: str, text: str):
+        await self.context.send_message(umo, MessageChain().message(text))
 
     @filter.regex(r"^(早安|晚安)")
+    @instrumented("早晚安")
     async def good_morning(self, message: AstrMessageEvent):
         """和Bot说早晚安，记录睡眠时间，培养良好作息"""
         # CREDIT: 灵感部分借鉴自：https://github.com/MinatoAquaCrews/nonebot_plugin_morning
         umo_id = message.unified_msg_origin
-        user_id = message.message_obj.sender.user_id
+        user_id = str(message.message_obj.sender.user_id)
         user_name = message.message_obj.sender.nickname
-        curr_utc8 = datetime.datetime.utcnow() + datetime.timedelta(hours=8)
-        curr_human = curr_utc8.strftime("%Y-%m-%d %H:%M:%S")
+        now = int(time.time())
+        curr_human = format_time(now)
 
         is_night = "晚安" in message.message_str
 
-        if umo_id in self.good_morning_data:
-            umo = self.good_morning_data[umo_id]
-        else:
-            umo = {}
-        if user_id in umo:
-            user = umo[user_id]
-        else:
-            user = {
-                "daily": {
-                    "morning_time": "",
-                    "night_time": "",
-                }
-            }
+        umo = await self.good_morning_store.load_group(umo_id)
+        user = umo.get(user_id)
+        if user is None:
+            user = umo[user_id] = SleepRecord()
+
+        # 根据 day 判断今天是本群第几个睡觉的，计数由索引增量维护
+        curr_day = day_of(now)
+        self.sleeping_index.ensure(umo_id, umo, curr_day)
+        was_sleeping = is_sleeping_on(user, curr_day)
 
         if is_night:
-            user["daily"]["night_time"] = curr_human
-            user["daily"]["morning_time"] = ""  # 晚安后清空早安时间
+            user.night = now
+            user.morning = 0  # 晚安后清空早安时间
         else:
-            user["daily"]["morning_time"] = curr_human
-
-        umo[user_id] = user
-        self.good_morning_data[umo_id] = umo
-
-        with open(f"data/{self.PLUGIN_NAME}_data.json", "w", encoding="utf-8") as f:
-            f.write(json.dumps(self.good_morning_data, ensure_ascii=False, indent=2))
-
-        # 根据 day 判断今天是本群第几个睡觉的
-        # TODO: 此处可以缓存
-        curr_day: int = curr_utc8.day
-        curr_day_sleeping = 0
-        for v in umo.values():
-            if v["daily"]["night_time"] and not v["daily"]["morning_time"]:
-                # he/she is sleeping
-                user_day = datetime.datetime.strptime(
-                    v["daily"]["night_time"], "%Y-%m-%d %H:%M:%S"
-                ).day
-                if user_day == curr_day:
-                    # 今天睡觉的人数
-                    curr_day_sleeping += 1
+            # 只有晚安后的第一次早安算一次睡眠，重复早安不再记录
+            asleep = bool(user.night) and not user.morning
+            user.morning = now
+            if asleep:
+                self.good_morning_store.record_sleep(
+                    umo_id, user_id, user_name, user.night, user.morning
+                )
+
+        self.good_morning_store.mark_dirty(umo_id, user_id)
+
+        self.sleeping_index.update(umo_id, was_sleeping, is_night)
+        curr_day_sleeping = self.sleeping_index.count(umo_id)
 
         if not is_night:
             # 计算睡眠时间: xx小时xx分
             # 此处可以联动 TODO
             sleep_duration_human = ""
-            if user["daily"]["night_time"]:
-                night_time = datetime.datetime.strptime(
-                    user["daily"]["night_time"], "%Y-%m-%d %H:%M:%S"
-                )
-                morning_time = datetime.datetime.strptime(
-                    user["daily"]["morning_time"], "%Y-%m-%d %H:%M:%S"
-                )
-                sleep_duration = (morning_time - night_time).total_seconds()
+            if user.night:
+                sleep_duration = user.morning - user.night
                 hrs = int(sleep_duration / 3600)
                 mins = int((sleep_duration % 3600) / 60)
                 sleep_duration_human = f"{hrs}小时{mins}分"
@@ -611,3 +900,53 @@ class Main(Star):
                 )
                 .use_t2i(False)
             )
+
+    def _parse_stats_days(self, message_str: str, command: str) -> int:
+        arg = message_str.replace(command, "").strip()
+        return 30 if arg in ("月", "month") else 7
+
+    @filter.command("睡眠统计")
+    @guarded("睡眠统计")
+    @instrumented("睡眠统计")
+    async def sleep_stats(self, message: AstrMessageEvent):
+        """查看自己最近一周/一月的平均睡眠时长。格式: 睡眠统计 [周|月]"""
+        if not self.good_morning_store.supports_history:
+            return CommandResult().error("睡眠统计需要在插件配置中启用 SQLite 存储")
+        days = self._parse_stats_days(message.message_str, "睡眠统计")
+        stats = await self.good_morning_store.user_stats(
+            message.unified_msg_origin,
+            str(message.message_obj.sender.user_id),
+            days,
+            int(time.time()),
+        )
+        if not stats["count"]:
+            return CommandResult().message(f"最近 {days} 天没有你的早晚安记录喵")
+        avg = stats["avg_duration"]
+        return (
+            CommandResult()
+            .message(
+                f"最近 {days} 天你记录了 {stats['count']} 次睡眠，"
+                f"平均每晚睡 {int(avg // 3600)}小时{int(avg % 3600 // 60)}分。"
+            )
+            .use_t2i(False)
+        )
+
+    @filter.command("睡眠排行")
+    @guarded("睡眠排行")
+    @instrumented("睡眠排行")
+    async def sleep_leaderboard(self, message: AstrMessageEvent):
+        """本群最近一周/一月的平均睡眠时长排行。格式: 睡眠排行 [周|月]"""
+        if not self.good_morning_store.supports_history:
+            return CommandResult().error("睡眠排行需要在插件配置中启用 SQLite 存储")
+        days = self._parse_stats_days(message.message_str, "睡眠排行")
+        rows = await self.good_morning_store.leaderboard(
+            message.unified_msg_origin, days, int(time.time())
+        )
+        if not rows:
+            return CommandResult().message(f"本群最近 {days} 天还没有睡眠记录喵")
+        lines = [f"【本群最近 {days} 天睡眠排行】"]
+        for i, (user_id, name, count, avg) in enumerate(rows, 1):
+            lines.append(
+                f"{i}. {name or user_id}: 平均 {int(avg // 3600)}小时{int(avg % 3600 // 60)}分（{count} 次）"
+            )
+        return CommandResult().message("\n".join(lines)).use_t2i(False)
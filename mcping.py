@@ -0,0 +1,349 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import socket
+import struct
+import time
+
+import aiohttp
+
+from .cache import LRUCache, SingleFlight
+
+try:
+    import aiodns
+except ImportError:  # 可选依赖，缺失时不解析 SRV 记录
+    aiodns = None
+
+logger = logging.getLogger("astrbot")
+
+JAVA_DEFAULT_PORT = 25565
+BEDROCK_DEFAULT_PORT = 19132
+# 指定这些端口时优先采用基岩版结果（19133 为 IPv6 默认端口）
+BEDROCK_PORTS = (19132, 19133)
+RAKNET_MAGIC = bytes.fromhex("00ffff00fefefefefdfdfdfd12345678")
+FORMATTING_CODE = re.compile("§.")
+
+
+class MCPingError(Exception):
+    pass
+
+
+def parse_address(address: str):
+    """解析 `host[:port]`，未指定端口时返回 None"""
+    address = address.strip()
+    if address.startswith("["):
+        # [IPv6]:port
+        host, _, rest = address[1:].partition("]")
+        port = rest.lstrip(":")
+        return host, int(port) if port else None
+    if address.count(":") == 1:
+        host, port = address.split(":")
+        return host, int(port) if port else None
+    return address, None
+
+
+def _pack_varint(value: int) -> bytes:
+    out = bytearray()
+    value &= 0xFFFFFFFF
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+async def _read_varint(reader: asyncio.StreamReader) -> int:
+    result = 0
+    for i in range(5):
+        byte = (await reader.readexactly(1))[0]
+        result |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return result
+    raise MCPingError("VarInt 过长")
+
+
+def _pack_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return _pack_varint(len(data)) + data
+
+
+def _packet(packet_id: int, payload: bytes = b"") -> bytes:
+    body = _pack_varint(packet_id) + payload
+    return _pack_varint(len(body)) + body
+
+
+def _flatten_chat(component) -> str:
+    """把聊天组件（字符串或 JSON 对象）展开为纯文本"""
+    if isinstance(component, str):
+        return component
+    if isinstance(component, list):
+        return "".join(_flatten_chat(c) for c in component)
+    if isinstance(component, dict):
+        text = component.get("text", "")
+        for extra in component.get("extra", []):
+            text += _flatten_chat(extra)
+        return text
+    return ""
+
+
+def _clean_motd(text: str) -> list:
+    return [line.strip() for line in FORMATTING_CODE.sub("", text).split("\n")]
+
+
+async def resolve_srv(host: str):
+    """查询 `_minecraft._tcp.<host>` SRV 记录，返回 (host, port) 或 None"""
+    if aiodns is None:
+        return None
+    try:
+        resolver = aiodns.DNSResolver()
+        records = await resolver.query(f"_minecraft._tcp.{host}", "SRV")
+    except Exception:
+        return None
+    if not records:
+        return None
+    record = sorted(records, key=lambda r: (r.priority, -r.weight))[0]
+    return record.host.rstrip("."), record.port
+
+
+async def java_status(host: str, port: int = None, timeout: float = 5) -> dict:
+    """Java 版 Server List Ping，返回与 mcsrvstat.us 相同结构的字典"""
+    if port is None:
+        srv = await resolve_srv(host)
+        host, port = srv if srv else (host, JAVA_DEFAULT_PORT)
+
+    async def ping():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            handshake = (
+                _pack_varint(47)
+                + _pack_string(host)
+                + struct.pack(">H", port)
+                + _pack_varint(1)
+            )
+            writer.write(_packet(0x00, handshake) + _packet(0x00))
+            await writer.drain()
+            await _read_varint(reader)  # 包长度
+            if await _read_varint(reader) != 0x00:
+                raise MCPingError("无效的状态响应")
+            length = await _read_varint(reader)
+            raw = json.loads((await reader.readexactly(length)).decode("utf-8"))
+
+            # Ping/Pong 测延迟
+            start = time.monotonic()
+            writer.write(_packet(0x01, struct.pack(">q", int(start * 1000))))
+            await writer.drain()
+            latency = None
+            try:
+                await _read_varint(reader)
+                if await _read_varint(reader) == 0x01:
+                    await reader.readexactly(8)
+                    latency = round((time.monotonic() - start) * 1000)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            return raw, latency
+        finally:
+            writer.close()
+
+    try:
+        raw, latency = await asyncio.wait_for(ping(), timeout)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+        raise MCPingError(f"Java 版查询失败: {e!r}") from e
+
+    players = raw.get("players") or {}
+    data = {
+        "online": True,
+        "source": "java",
+        "hostname": host,
+        "port": port,
+        "motd": {"clean": _clean_motd(_flatten_chat(raw.get("description", "")))},
+        "players": {
+            "online": players.get("online", 0),
+            "max": players.get("max", 0),
+        },
+        "version": FORMATTING_CODE.sub("", (raw.get("version") or {}).get("name", "")),
+        "latency": latency,
+    }
+    sample = [p.get("name") for p in players.get("sample") or [] if p.get("name")]
+    if sample:
+        data["players"]["list"] = sample
+    if raw.get("favicon"):
+        data["icon"] = raw["favicon"]
+    return data
+
+
+class _BedrockProtocol(asyncio.DatagramProtocol):
+    def __init__(self) -> None:
+        self.future = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr) -> None:
+        if not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc) -> None:
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+async def bedrock_status(host: str, port: int = None, timeout: float = 3) -> dict:
+    """基岩版 RakNet Unconnected Ping"""
+    port = port or BEDROCK_DEFAULT_PORT
+    loop = asyncio.get_running_loop()
+    try:
+        transport, protocol = await loop.create_datagram_endpoint(
+            _BedrockProtocol, remote_addr=(host, port), family=socket.AF_UNSPEC
+        )
+    except OSError as e:
+        raise MCPingError(f"基岩版查询失败: {e}") from e
+    try:
+        start = time.monotonic()
+        transport.sendto(
+            b"\x01"
+            + struct.pack(">q", int(start * 1000))
+            + RAKNET_MAGIC
+            + os.urandom(8)
+        )
+        try:
+            packet = await asyncio.wait_for(protocol.future, timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise MCPingError(f"基岩版查询失败: {e!r}") from e
+        latency = round((time.monotonic() - start) * 1000)
+    finally:
+        transport.close()
+
+    # 0x1c | time(8) | server guid(8) | magic(16) | len(2) | payload
+    if len(packet) < 35 or packet[0] != 0x1C:
+        raise MCPingError("无效的基岩版响应")
+    (length,) = struct.unpack(">H", packet[33:35])
+    fields = packet[35 : 35 + length].decode("utf-8", "replace").split(";")
+    if len(fields) < 6 or not fields[4].isdigit() or not fields[5].isdigit():
+        raise MCPingError("无效的基岩版响应")
+    motd = [fields[1]] + ([fields[7]] if len(fields) > 7 and fields[7] else [])
+    return {
+        "online": True,
+        "source": "bedrock",
+        "hostname": host,
+        "port": port,
+        "motd": {"clean": [FORMATTING_CODE.sub("", m).strip() for m in motd]},
+        "players": {"online": int(fields[4]), "max": int(fields[5])},
+        "version": f"{fields[3]} (基岩版)",
+        "latency": latency,
+    }
+
+
+class MCStatusClient:
+    """Minecraft 服务器状态查询。
+
+    同时发起 Java 版和基岩版直连查询，优先采用 Java 版结果（带图标和玩家列表），
+    Java 版失败或指定了基岩版端口时才使用基岩版结果；均失败时回退到 mcsrvstat.us。
+    结果按地址短时间缓存，同一地址的并发查询只会真正执行一次。
+    """
+
+    def __init__(
+        self,
+        http,
+        ttl: float = 30,
+        api_url: str = "https://api.mcsrvstat.us/2/",
+        java_timeout: float = 5,
+        bedrock_timeout: float = 3,
+    ) -> None:
+        self.http = http
+        self.api_url = api_url
+        self.java_timeout = java_timeout
+        self.bedrock_timeout = bedrock_timeout
+        self.cache = LRUCache(max_bytes=0, max_items=512, ttl=ttl, sizeof=lambda _: 1)
+        self._flight = SingleFlight()
+        self.fallbacks = 0
+
+    async def query(self, address: str) -> dict:
+        key = address.strip().lower()
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        return await self._flight.do(key, lambda: self._query(key))
+
+    async def _query(self, address: str) -> dict:
+        try:
+            data = await self._query_native(address)
+        except MCPingError as e:
+            logger.info(f"直连查询 {address} 失败（{e}），使用 mcsrvstat.us。")
+            self.fallbacks += 1
+            data = await self._query_api(address)
+        self.cache.set(address, data)
+        return data
+
+    async def _query_native(self, address: str) -> dict:
+        try:
+            host, port = parse_address(address)
+        except ValueError as e:
+            raise MCPingError(f"无效的地址: {address}") from e
+        java = asyncio.create_task(java_status(host, port, self.java_timeout))
+        bedrock = asyncio.create_task(bedrock_status(host, port, self.bedrock_timeout))
+        # 两者并发进行，但按优先级取结果：同时开着 Geyser 的 Java 服务器应当显示为 Java 版
+        tasks = [bedrock, java] if port in BEDROCK_PORTS else [java, bedrock]
+        errors = []
+        try:
+            for task in tasks:
+                try:
+                    return await task
+                except MCPingError as e:
+                    errors.append(str(e))
+                except Exception as e:
+                    errors.append(repr(e))
+        finally:
+            for task in tasks:
+                task.cancel()
+        raise MCPingError("; ".join(errors))
+
+    async def _query_api(self, address: str) -> dict:
+        try:
+            async with self.http.get(self.api_url + address, endpoint="mcs") as resp:
+                if resp.status != 200:
+                    raise MCPingError(f"请求失败: {resp.status}")
+                data = await resp.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            # ValueError: 返回的不是合法的 JSON
+            raise MCPingError(f"请求失败: {type(e).__name__}") from e
+        if not isinstance(data, dict):
+            raise MCPingError("无效的 mcsrvstat.us 响应")
+        data["source"] = "api"
+        return data
+
+    async def query_many(
+        self, addresses: list, concurrency: int = 16, deadline: float = 8
+    ) -> list:
+        """并发查询多个服务器，返回与输入顺序一致的 [(address, data, error)]。
+
+        同时进行的查询数不超过 `concurrency`。`deadline` 从整批开始计时（含排队时间），
+        届时仍未完成的服务器记为超时；单个服务器出错只影响它自己的结果。
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def query(address: str) -> dict:
+            async with semaphore:
+                return await self.query(address)
+
+        async def one(address: str):
+            try:
+                data = await asyncio.wait_for(query(address), deadline)
+            except asyncio.TimeoutError:
+                return address, None, "超时"
+            except MCPingError as e:
+                return address, None, str(e)
+            except Exception as e:
+                logger.exception(f"查询 {address} 出错")
+                return address, None, repr(e)
+            return address, data, None
+
+        return await asyncio.gather(*(one(a) for a in addresses))
+
+    def stats(self) -> dict:
+        return {
+            "cache": self.cache.stats(),
+            "shared": self._flight.shared,
+            "fallbacks": self.fallbacks,
+        }
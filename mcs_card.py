@@ -0,0 +1,229 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from .cache import LRUCache
+from .metrics import METRICS
+from .poster import (
+    DEFAULT_FONT_PATH,
+    FontUnavailableError,
+    font_available,
+    load_font,
+)
+from .text_layout import break_lines, glyph_table, truncate
+
+if TYPE_CHECKING:
+    from PIL import Image as PILImage
+
+logger = logging.getLogger("astrbot")
+
+# 布局参照 templates/mcs.html
+WIDTH, HEIGHT = 720, 700
+MARGIN = 36
+CARD_BOX = (MARGIN, MARGIN, WIDTH - MARGIN, HEIGHT - MARGIN)
+ICON_SIZE = 112
+ICON_TOP = 70
+TITLE_Y = 205
+MOTD_BOX = (MARGIN + 40, 255, WIDTH - MARGIN - 40, 325)
+ROW_Y = (355, 395)
+IP_Y = 440
+# 在线玩家列表，最多显示 PLAYER_LINES 行
+PLAYERS_Y = 480
+PLAYER_LINES = 4
+PLAYER_LINE_HEIGHT = 28
+STATUS_Y = 620
+LEFT_X = MARGIN + 60
+RIGHT_X = WIDTH - MARGIN - 60
+
+BACKGROUND = (244, 244, 244)
+CARD_COLOR = (255, 255, 255)
+MOTD_COLOR = (249, 249, 249)
+TEXT_COLOR = (34, 34, 34)
+ONLINE_COLOR = (0, 128, 0)
+OFFLINE_COLOR = (220, 0, 0)
+
+
+def _fit(text: str, font, max_width: int) -> str:
+    """超出宽度的文字截断并加省略号"""
+    return truncate(text, glyph_table(font), max_width)
+
+
+class MCSCardRenderer:
+    """mc 服务器状态卡片的本地渲染器。
+
+    卡片底板（背景、阴影、卡片、MOTD 框）只绘制一次，之后只在副本上填写服务器信息。
+    结果按 (地址, 状态哈希) 缓存，状态未变化时不会重新渲染；绘制在线程池中进行。
+    """
+
+    def __init__(
+        self,
+        font_path: str = None,
+        max_workers: int = 2,
+        cache_max_bytes: int = 8 * 1024 * 1024,
+        cache_ttl: float = 600,
+    ) -> None:
+        self.font_path = font_path or DEFAULT_FONT_PATH
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="essential-mcs-card"
+        )
+        self._base: "PILImage.Image" = None
+        self.cache = LRUCache(max_bytes=cache_max_bytes, ttl=cache_ttl)
+
+    def _get_base(self) -> "PILImage.Image":
+        # Pillow 在第一次渲染时才导入，加快插件加载
+        from PIL import Image as PILImage
+        from PIL import ImageDraw as PILImageDraw
+
+        if self._base is None:
+            img = PILImage.new("RGB", (WIDTH, HEIGHT), BACKGROUND)
+            draw = PILImageDraw.Draw(img)
+            shadow = tuple(c + 4 for c in CARD_BOX)
+            draw.rounded_rectangle(shadow, radius=12, fill=(226, 226, 226))
+            draw.rounded_rectangle(CARD_BOX, radius=12, fill=CARD_COLOR)
+            draw.rounded_rectangle(MOTD_BOX, radius=6, fill=MOTD_COLOR)
+            self._base = img
+        return self._base
+
+    @staticmethod
+    def status_hash(data: dict) -> str:
+        """只取卡片上会显示的字段"""
+        players = data.get("players") or {}
+        shown = {
+            "online": data.get("online"),
+            "motd": (data.get("motd") or {}).get("clean"),
+            "players": [players.get("online"), players.get("max"), players.get("list")],
+            "latency": data.get("latency"),
+            "version": data.get("version"),
+            "protocol": data.get("protocol_name") or data.get("source"),
+            "icon": hashlib.sha1(data.get("icon", "").encode()).hexdigest(),
+        }
+        raw = json.dumps(shown, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+    def _draw_icon(self, img: "PILImage.Image", icon: str) -> None:
+        from PIL import Image as PILImage
+        from PIL import ImageDraw as PILImageDraw
+
+        if not icon or "," not in icon:
+            return
+        try:
+            raw = base64.b64decode(icon.split(",", 1)[1])
+            with PILImage.open(io.BytesIO(raw)) as f:
+                favicon = f.convert("RGBA").resize(
+                    (ICON_SIZE, ICON_SIZE), PILImage.Resampling.NEAREST
+                )
+        except Exception as e:
+            logger.warning(f"解析服务器图标失败: {e}")
+            return
+        mask = PILImage.new("L", (ICON_SIZE, ICON_SIZE), 0)
+        PILImageDraw.Draw(mask).ellipse((0, 0, ICON_SIZE, ICON_SIZE), fill=255)
+        alpha = PILImage.composite(favicon.getchannel("A"), mask, mask)
+        img.paste(favicon, ((WIDTH - ICON_SIZE) // 2, ICON_TOP), alpha)
+
+    @staticmethod
+    def _player_lines(players: dict, font, max_width: int) -> list:
+        """在线玩家名按宽度换行，放不下时最后一行注明总人数"""
+        names = [str(n) for n in players.get("list") or [] if n]
+        if not names:
+            return ["无玩家在线"] if not players.get("online") else []
+        table = glyph_table(font)
+        lines = break_lines("玩家: " + "、".join(names), table, max_width)
+        if len(lines) > PLAYER_LINES:
+            lines = lines[:PLAYER_LINES]
+            suffix = f" 等 {len(names)} 人"
+            budget = max_width - table.width(suffix)
+            lines[-1] = truncate(lines[-1] + "…", table, budget) + suffix
+        return lines
+
+    def render_sync(self, address: str, data: dict) -> bytes:
+        from PIL import ImageDraw as PILImageDraw
+
+        img = self._get_base().copy()
+        draw = PILImageDraw.Draw(img)
+        title_font = load_font(self.font_path, 32)
+        motd_font = load_font(self.font_path, 22)
+        text_font = load_font(self.font_path, 20)
+        max_width = CARD_BOX[2] - CARD_BOX[0] - 80
+
+        self._draw_icon(img, data.get("icon", ""))
+
+        motd = [m for m in (data.get("motd") or {}).get("clean", []) if m] or [address]
+        title = _fit(motd[0], title_font, max_width)
+        draw.text((WIDTH // 2, TITLE_Y), title, font=title_font, fill=TEXT_COLOR, anchor="mm")
+        if len(motd) > 1:
+            line = _fit(motd[1], motd_font, MOTD_BOX[2] - MOTD_BOX[0] - 40)
+            center = ((MOTD_BOX[0] + MOTD_BOX[2]) // 2, (MOTD_BOX[1] + MOTD_BOX[3]) // 2)
+            draw.text(center, line, font=motd_font, fill=TEXT_COLOR, anchor="mm")
+
+        players = data.get("players") or {}
+        protocol = data.get("protocol_name") or {
+            "java": "Java 版", "bedrock": "基岩版"
+        }.get(data.get("source"), "未知")
+        version = _fit(str(data.get("version", "未知")), text_font, max_width // 2)
+        rows = (
+            (f"在线玩家: {players.get('online', '?')}", f"最大玩家: {players.get('max', '?')}"),
+            (f"版本: {version}", f"协议: {protocol}"),
+        )
+        for y, (left, right) in zip(ROW_Y, rows):
+            draw.text((LEFT_X, y), left, font=text_font, fill=TEXT_COLOR, anchor="lm")
+            draw.text((RIGHT_X, y), right, font=text_font, fill=TEXT_COLOR, anchor="rm")
+
+        draw.text(
+            (WIDTH // 2, IP_Y),
+            _fit(f"IP: {address}", text_font, max_width),
+            font=text_font,
+            fill=TEXT_COLOR,
+            anchor="mm",
+        )
+        for i, line in enumerate(self._player_lines(players, text_font, RIGHT_X - LEFT_X)):
+            draw.text(
+                (WIDTH // 2, PLAYERS_Y + i * PLAYER_LINE_HEIGHT),
+                line,
+                font=text_font,
+                fill=TEXT_COLOR,
+                anchor="ma",
+            )
+        online = data.get("online")
+        status = "在线" if online else "离线"
+        if online and data.get("latency") is not None:
+            status += f"  延迟 {data['latency']}ms"
+        draw.text(
+            (WIDTH // 2, STATUS_Y),
+            status,
+            font=motd_font,
+            fill=ONLINE_COLOR if online else OFFLINE_COLOR,
+            anchor="mm",
+            stroke_width=1,
+            stroke_fill=ONLINE_COLOR if online else OFFLINE_COLOR,
+        )
+
+        buf = io.BytesIO()
+        img.save(buf, format="PNG", optimize=False)
+        return buf.getvalue()
+
+    def _render(self, address: str, data: dict) -> bytes:
+        if not font_available(self.font_path):
+            raise FontUnavailableError(self.font_path)
+        return self.render_sync(address, data)
+
+    async def render(self, address: str, data: dict) -> bytes:
+        """字体不可用时抛出 `FontUnavailableError`，调用方改用文字结果"""
+        key = (address.lower(), self.status_hash(data))
+        card = self.cache.get(key)
+        if card is not None:
+            return card
+        loop = asyncio.get_running_loop()
+        with METRICS.timer("render_seconds", kind="mcs_card"):
+            card = await loop.run_in_executor(
+                self._executor, self._render, address, data
+            )
+        self.cache.set(key, card)
+        return card
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,258 @@
+import functools
+import inspect
+import math
+import time
+
+# 直方图精度：每个 2 的幂区间分为 SUB_BUCKETS 个桶，相对误差约 1/SUB_BUCKETS
+SUB_BUCKETS = 32
+# 最小可区分约 1 微秒（2^-20 秒），更小的值记入第一个桶
+MIN_EXPONENT = -19
+QUANTILES = (50, 90, 95, 99)
+
+
+class Histogram:
+    """HDR 风格的对数线性直方图：按指数分段、段内线性分桶，记录和查询都是 O(1)/O(桶数)。
+
+    桶稀疏存储，只占用实际出现过的量级。
+    """
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts: dict = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if value <= 0:
+            index = 0
+        else:
+            mantissa, exponent = math.frexp(value)
+            index = max(
+                0,
+                (exponent - MIN_EXPONENT) * SUB_BUCKETS
+                + int((mantissa - 0.5) * 2 * SUB_BUCKETS),
+            )
+        self.counts[index] = self.counts.get(index, 0) + 1
+
+    @staticmethod
+    def upper_bound(index: int) -> float:
+        exponent, sub = divmod(index, SUB_BUCKETS)
+        return math.ldexp(0.5 + (sub + 1) / (2 * SUB_BUCKETS), exponent + MIN_EXPONENT)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: dict) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            self.metrics.inc(
+                self.name.removesuffix("_seconds") + "_errors",
+                type=exc_type.__name__,
+                **self.labels,
+            )
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+def _number(value) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class Metrics:
+    """插件内的指标：延迟直方图、计数器（错误、字节数等）和按需采集的组件状态（队列长度、缓存命中等）。
+
+    未启用时 `observe`/`inc` 直接返回，`timer` 返回共享的空计时器，几乎没有开销。
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.histograms: dict = {}
+        self.counters: dict = {}
+        # name -> 返回 {指标: 数值} 的函数，查看统计时才调用
+        self.collectors: dict = {}
+        self.started_at = time.time()
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram()
+        hist.record(value)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def timer(self, name: str, **labels):
+        """`with metrics.timer("xxx_seconds", stage="..."):` 记录耗时，异常按类型计数"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def register(self, name: str, collector) -> None:
+        self.collectors[name] = collector
+
+    def reset(self) -> None:
+        self.histograms.clear()
+        self.counters.clear()
+        self.started_at = time.time()
+
+    def collect(self) -> dict:
+        """调用所有采集函数，只保留数值，嵌套的字典展开为 `a.b`"""
+        result = {}
+
+        def flatten(prefix: str, value) -> None:
+            if isinstance(value, bool):
+                result[prefix] = int(value)
+            elif isinstance(value, (int, float)):
+                result[prefix] = value
+            elif isinstance(value, dict):
+                for k, v in value.items():
+                    flatten(f"{prefix}.{k}", v)
+
+        for name, collector in self.collectors.items():
+            try:
+                flatten(name, collector())
+            except Exception as e:
+                result[f"{name}.collect_error"] = 1
+                result[f"{name}.{type(e).__name__}"] = 1
+        return result
+
+    def format_text(self) -> str:
+        """供聊天指令展示的文字摘要"""
+        lines = []
+        if self.enabled:
+            lines.append(f"统计时长: {int(time.time() - self.started_at)} 秒")
+            for (name, labels), hist in sorted(self.histograms.items()):
+                label = ",".join(f"{k}={v}" for k, v in labels)
+                lines.append(
+                    f"{name}[{label}] n={hist.count} "
+                    f"p50={hist.percentile(50) * 1000:.1f}ms "
+                    f"p95={hist.percentile(95) * 1000:.1f}ms "
+                    f"p99={hist.percentile(99) * 1000:.1f}ms "
+                    f"max={hist.max * 1000:.1f}ms"
+                )
+            for (name, labels), value in sorted(self.counters.items()):
+                label = ",".join(f"{k}={v}" for k, v in labels)
+                lines.append(f"{name}[{label}] {_number(value)}")
+        else:
+            lines.append("延迟统计未启用（配置项 METRICS_ENABLED）")
+        for name, value in self.collect().items():
+            lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines)
+
+    def prometheus(self, prefix: str = "essential_") -> str:
+        """Prometheus 文本格式。直方图以 summary 形式输出分位数"""
+        lines = []
+        typed = set()
+
+        def declare(name: str, kind: str) -> None:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), hist in sorted(self.histograms.items()):
+            metric = prefix + name
+            declare(metric, "summary")
+            for q in QUANTILES:
+                quantile = (("quantile", f"{q / 100:g}"),)
+                lines.append(
+                    f"{metric}{_format_labels(labels, quantile)} {hist.percentile(q):.6g}"
+                )
+            lines.append(f"{metric}_sum{_format_labels(labels)} {hist.total:.6g}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {hist.count}")
+        for (name, labels), value in sorted(self.counters.items()):
+            metric = prefix + name + "_total"
+            declare(metric, "counter")
+            lines.append(f"{metric}{_format_labels(labels)} {_number(value)}")
+        for name, value in self.collect().items():
+            component, _, field = name.partition(".")
+            metric = prefix + component
+            declare(metric, "gauge")
+            lines.append(f"{metric}{_format_labels((('field', field),))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# 插件全局共享的指标，由 Main 根据配置启用
+METRICS = Metrics()
+
+
+def instrumented(command: str):
+    """记录指令处理函数的耗时和异常。放在 `@filter.command` 之下，同时支持协程和异步生成器"""
+
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def gen_wrapper(*args, **kwargs):
+                with METRICS.timer("command_seconds", command=command):
+                    async for item in func(*args, **kwargs):
+                        yield item
+
+            return gen_wrapper
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with METRICS.timer("command_seconds", command=command):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+logger = logging.getLogger("astrbot")
+
+
+class _MirrorState:
+    __slots__ = ("url", "latency", "error_rate", "samples", "failures", "open_until")
+
+    def __init__(self, url: str, initial_latency: float) -> None:
+        self.url = url
+        self.latency = initial_latency
+        self.error_rate = 0.0
+        self.samples: deque = deque(maxlen=50)
+        self.failures = 0
+        self.open_until = 0.0
+
+
+class MirrorSelector:
+    """按健康度选择镜像，并对慢请求发起对冲请求。
+
+    每个镜像记录延迟和错误率的 EWMA，得分越低越优先；连续失败达到阈值后熔断一段时间，
+    到期后放行一次探测请求。首个请求在 p90 延迟内没有返回时，向下一个镜像发出第二个请求，先成功者胜出。
+    """
+
+    def __init__(
+        self,
+        urls: list,
+        alpha: float = 0.3,
+        failure_threshold: int = 3,
+        open_seconds: float = 60,
+        initial_latency: float = 1.0,
+        min_hedge_delay: float = 0.3,
+        max_hedge_delay: float = 5.0,
+    ) -> None:
+        self.mirrors = {url: _MirrorState(url, initial_latency) for url in urls}
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.hedged = 0
+
+    def record(self, url: str, latency: float, ok: bool) -> None:
+        state = self.mirrors[url]
+        a = self.alpha
+        state.error_rate = (1 - a) * state.error_rate + a * (0.0 if ok else 1.0)
+        if ok:
+            state.latency = (1 - a) * state.latency + a * latency
+            state.samples.append(latency)
+            state.failures = 0
+            state.open_until = 0.0
+        else:
+            state.failures += 1
+            if state.failures >= self.failure_threshold:
+                state.open_until = time.monotonic() + self.open_seconds
+                logger.warning(f"镜像 {url} 连续失败 {state.failures} 次，熔断 {self.open_seconds} 秒")
+
+    def order(self) -> list:
+        """按得分排序的可用镜像；全部熔断时返回全部镜像"""
+        now = time.monotonic()
+        available = [s for s in self.mirrors.values() if s.open_until <= now]
+        if not available:
+            available = list(self.mirrors.values())
+        # 少量随机扰动，让较差的镜像也有机会被重新评估
+        available.sort(
+            key=lambda s: s.latency * (1 + 4 * s.error_rate) * random.uniform(0.9, 1.1)
+        )
+        return [s.url for s in available]
+
+    def hedge_delay(self, url: str) -> float:
+        samples = sorted(self.mirrors[url].samples)
+        if len(samples) < 5:
+            delay = self.mirrors[url].latency * 2
+        else:
+            delay = samples[int(len(samples) * 0.9) - 1]
+        return min(max(delay, self.min_hedge_delay), self.max_hedge_delay)
+
+    async def _attempt(self, fetch_one, url: str):
+        start = time.monotonic()
+        try:
+            result = await fetch_one(url)
+        except asyncio.CancelledError:
+            # 对冲中落败被取消，已耗时是延迟的下界，计入 EWMA 以免慢镜像一直排在前面
+            state = self.mirrors[url]
+            elapsed = time.monotonic() - start
+            if elapsed > state.latency:
+                state.latency = (1 - self.alpha) * state.latency + self.alpha * elapsed
+            raise
+        except Exception:
+            self.record(url, time.monotonic() - start, False)
+            raise
+        self.record(url, time.monotonic() - start, True)
+        return result
+
+    async def fetch(self, fetch_one):
+        """依次尝试镜像，`fetch_one(url)` 失败时抛出异常，返回第一个成功的结果"""
+        loop = asyncio.get_running_loop()
+        candidates = deque(self.order())
+        running: dict = {}
+        last_error = None
+
+        def launch():
+            url = candidates.popleft()
+            running[loop.create_task(self._attempt(fetch_one, url))] = url
+
+        launch()
+        try:
+            while running:
+                timeout = None
+                if candidates and len(running) == 1:
+                    timeout = self.hedge_delay(next(iter(running.values())))
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 首个请求过慢，发出对冲请求
+                    self.hedged += 1
+                    launch()
+                    continue
+                for task in done:
+                    url = running.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    logger.error(f"从 {url} 获取失败: {last_error}。正在尝试下一个镜像。")
+                    if candidates:
+                        launch()
+        finally:
+            for task in running:
+                task.cancel()
+        raise RuntimeError(f"所有镜像均不可用: {last_error}")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "hedged": self.hedged,
+            "mirrors": {
+                s.url: {
+                    "latency": round(s.latency, 3),
+                    "error_rate": round(s.error_rate, 3),
+                    "open": s.open_until > now,
+                }
+                for s in self.mirrors.values()
+            },
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger("astrbot")
+
+
+class MoePrefetcher:
+    """随机图片预取池。
+
+    后台任务预先下载最多 `size` 张图片（总大小不超过 `max_bytes`），指令直接从池中取图返回，
+    取走后再由后台任务补充。池为空时才会现场下载。
+    """
+
+    def __init__(self, fetch, size: int = 4, max_bytes: int = 16 * 1024 * 1024) -> None:
+        # async def fetch() -> bytes
+        self.fetch = fetch
+        self.size = size
+        self.max_bytes = max_bytes
+        self._buffer: deque = deque()
+        self._bytes = 0
+        self._wakeup: asyncio.Event = None
+        self._task: asyncio.Task = None
+
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def _full(self) -> bool:
+        return len(self._buffer) >= self.size or self._bytes >= self.max_bytes
+
+    def _ensure_task(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._refill())
+
+    async def _refill(self) -> None:
+        backoff = 1
+        while True:
+            if self._full():
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            try:
+                data = await self.fetch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"预取随机图片失败: {e}，{backoff} 秒后重试")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1
+            if len(data) > self.max_bytes:
+                continue
+            self._buffer.append(data)
+            self._bytes += len(data)
+
+    async def get(self) -> bytes:
+        self._ensure_task()
+        if self._buffer:
+            data = self._buffer.popleft()
+            self._bytes -= len(data)
+            self.hits += 1
+        else:
+            self.misses += 1
+            data = await self.fetch()
+        # 回复之后再由后台任务补充
+        self._wakeup.set()
+        return data
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+        }
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._buffer.clear()
+        self._bytes = 0
@@ -0,0 +1,110 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger("astrbot")
+
+
+class PendingRequests:
+    """等待用户后续消息的请求表（例如搜番等待发图）。
+
+    请求以 (platform, session, sender) 为键存放在字典中，监听所有消息的处理器只需一次字典查询即可判断是否需要处理。
+    超时由一个按截止时间排序的最小堆和单个清理任务负责，不再为每个请求挂起一个 `asyncio.sleep`。
+    """
+
+    def __init__(self, on_expire=None) -> None:
+        # 超时回调：async def on_expire(key, payload)
+        self.on_expire = on_expire
+        # key -> [deadline, seq, key, payload]
+        self._pending: dict = {}
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._wakeup: asyncio.Event = None
+        self._reaper: asyncio.Task = None
+
+        self.filtered = 0
+        self.matched = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, key) -> bool:
+        """快速路径：只做一次字典查询并计数"""
+        if key in self._pending:
+            self.matched += 1
+            return True
+        self.filtered += 1
+        return False
+
+    def add(self, key, payload=None, timeout: float = 30) -> bool:
+        """登记一个请求，已存在时返回 False"""
+        if key in self._pending:
+            return False
+        entry = [time.monotonic() + timeout, next(self._seq), key, payload]
+        self._pending[key] = entry
+        heapq.heappush(self._heap, entry)
+        self._ensure_reaper()
+        if self._heap[0] is entry:
+            # 新的最早截止时间，唤醒清理任务重新计时
+            self._wakeup.set()
+        return True
+
+    def pop(self, key):
+        """移除请求，返回登记时的 payload；不存在时返回 None"""
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return None
+        # 堆中的条目惰性删除
+        entry[2] = None
+        return entry[3]
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._wakeup = asyncio.Event()
+            self._reaper = asyncio.get_running_loop().create_task(self._reap())
+
+    async def _reap(self) -> None:
+        while True:
+            now = time.monotonic()
+            while self._heap and (
+                self._heap[0][2] is None or self._heap[0][0] <= now
+            ):
+                _, _, key, payload = heapq.heappop(self._heap)
+                if key is None:
+                    continue
+                del self._pending[key]
+                self.expired += 1
+                if self.on_expire is not None:
+                    try:
+                        await self.on_expire(key, payload)
+                    except Exception:
+                        logger.exception("处理超时请求失败")
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "heap_size": len(self._heap),
+            "filtered": self.filtered,
+            "matched": self.matched,
+            "expired": self.expired,
+        }
+
+    async def close(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        self._pending.clear()
+        self._heap.clear()
@@ -0,0 +1,191 @@
+import asyncio
+import functools
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from .cache import LRUCache
+from .metrics import METRICS
+from .text_layout import TextLayout, fit_text
+
+if TYPE_CHECKING:
+    from PIL import Image as PILImage
+    from PIL import ImageFont as PILImageFont
+
+logger = logging.getLogger("astrbot")
+
+PLUGIN_PATH = os.path.abspath(os.path.dirname(__file__))
+
+DEFAULT_FONT_PATH = os.path.join(PLUGIN_PATH, "simhei.ttf")
+
+# 喜报/悲报模板：背景图、文字颜色、描边颜色，
+# safe_area 为文字可用区域（左、上、右、下，占图片宽高的比例），避开标题横幅和底部花丛
+POSTER_TEMPLATES = {
+    "congrats": {
+        "background": "congrats.jpg",
+        "fill": (255, 0, 0),
+        "stroke_fill": (255, 255, 0),
+        "safe_area": (0.1, 0.22, 0.9, 0.86),
+    },
+    "uncongrats": {
+        "background": "uncongrats.jpg",
+        "fill": (0, 0, 0),
+        "stroke_fill": (255, 255, 255),
+        "safe_area": (0.1, 0.22, 0.9, 0.86),
+    },
+}
+
+
+class FontUnavailableError(Exception):
+    """字体文件缺失或无法加载"""
+
+
+@functools.lru_cache(maxsize=None)
+def font_available(path: str) -> bool:
+    """字体文件能否加载，结果缓存。Pillow 默认字体不含中文，缺字体时渲染出的中文都是方框"""
+    from PIL import ImageFont as PILImageFont
+
+    try:
+        PILImageFont.truetype(path, 12)
+    except OSError:
+        logger.warning(f"字体 {path} 加载失败，中文无法显示。")
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=32)
+def load_font(path: str, size: int) -> "PILImageFont.FreeTypeFont":
+    """加载并缓存字体，字体文件缺失时使用 Pillow 默认字体"""
+    # Pillow 在第一次渲染时才导入，加快插件加载
+    from PIL import ImageFont as PILImageFont
+
+    if font_available(path):
+        return PILImageFont.truetype(path, size)
+    return PILImageFont.load_default(size=size)
+
+
+class PosterRenderer:
+    """喜报/悲报渲染器。
+
+    背景图和字体只解码一次，之后每次渲染都从缓存的底图复制，结果直接编码到内存中。
+    文字按像素宽度换行，字号在 `min_font_size` 到 `font_size` 之间自动选择最大的能放进模板的一档。
+    绘制在线程池中进行，不会阻塞事件循环。
+    """
+
+    STROKE_WIDTH = 3
+
+    def __init__(
+        self,
+        font_path: str = None,
+        font_size: int = 65,
+        min_font_size: int = 24,
+        max_workers: int = 2,
+        jpeg_quality: int = 90,
+        cache_max_bytes: int = 16 * 1024 * 1024,
+        cache_ttl: float = 600,
+    ) -> None:
+        self.font_path = font_path or DEFAULT_FONT_PATH
+        self.font_size = font_size
+        self.min_font_size = min_font_size
+        self.jpeg_quality = jpeg_quality
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="essential-poster"
+        )
+        self._lock = threading.Lock()
+        self._backgrounds: dict = {}
+        # 渲染结果缓存，相同模板+文字+字号直接返回已编码的图片
+        self.cache = LRUCache(max_bytes=cache_max_bytes, ttl=cache_ttl)
+
+    def _get_background(self, template: str) -> "PILImage.Image":
+        from PIL import Image as PILImage
+
+        bg = self._backgrounds.get(template)
+        if bg is None:
+            with self._lock:
+                bg = self._backgrounds.get(template)
+                if bg is None:
+                    file = os.path.join(PLUGIN_PATH, POSTER_TEMPLATES[template]["background"])
+                    with PILImage.open(file) as f:
+                        bg = f.convert("RGB")
+                    self._backgrounds[template] = bg
+        return bg
+
+    def _safe_area(self, template: str, size: tuple) -> tuple:
+        left, top, right, bottom = POSTER_TEMPLATES[template]["safe_area"]
+        width, height = size
+        return left * width, top * height, right * width, bottom * height
+
+    def layout(self, template: str, text: str) -> TextLayout:
+        """在模板的可用区域内排版，返回字号和各行文字"""
+        left, top, right, bottom = self._safe_area(
+            template, self._get_background(template).size
+        )
+        stroke = 2 * self.STROKE_WIDTH
+        return fit_text(
+            text,
+            lambda size: load_font(self.font_path, size),
+            right - left - stroke,
+            bottom - top - stroke,
+            self.font_size,
+            self.min_font_size,
+        )
+
+    def render_sync(self, template: str, text: str) -> bytes:
+        """同步渲染，返回 JPEG 字节"""
+        from PIL import ImageDraw as PILImageDraw
+
+        tmpl = POSTER_TEMPLATES[template]
+        img = self._get_background(template).copy()
+        draw = PILImageDraw.Draw(img)
+        layout = self.layout(template, text)
+
+        # 文字整体在可用区域内居中，各行左对齐
+        left, top, right, bottom = self._safe_area(template, img.size)
+        x = (left + right - layout.width) / 2
+        y = (top + bottom - layout.height) / 2
+        for line in layout.lines:
+            draw.text(
+                (x, y),
+                line,
+                font=layout.font,
+                fill=tmpl["fill"],
+                stroke_width=self.STROKE_WIDTH,
+                stroke_fill=tmpl["stroke_fill"],
+            )
+            y += layout.line_height
+
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=self.jpeg_quality)
+        return buf.getvalue()
+
+    def _render(self, template: str, text: str) -> bytes:
+        if not font_available(self.font_path):
+            raise FontUnavailableError(self.font_path)
+        return self.render_sync(template, text)
+
+    def cache_key(self, template: str, text: str) -> str:
+        raw = f"{template}\0{self.font_size}\0{text}".encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+    async def render(self, template: str, text: str) -> bytes:
+        """在线程池中渲染海报，命中缓存时不再渲染。字体不可用时抛出 `FontUnavailableError`"""
+        if template not in POSTER_TEMPLATES:
+            raise ValueError(f"未知的海报模板: {template}")
+        key = self.cache_key(template, text)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        loop = asyncio.get_running_loop()
+        with METRICS.timer("render_seconds", kind="poster"):
+            data = await loop.run_in_executor(
+                self._executor, self._render, template, text
+            )
+        self.cache.set(key, data)
+        return data
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from .image_hash import BKTree, dhash
+from .metrics import METRICS
+from .storage import BackgroundLoader, DebouncedStore, atomic_write
+
+logger = logging.getLogger("astrbot")
+
+
+class SauceNAOCache(DebouncedStore):
+    """以图片感知哈希为键的 SauceNAO 结果缓存。
+
+    相同或相近（汉明距离不超过 `max_distance`）的图片直接返回缓存的结果，不再消耗 API 配额。
+    条目按 LRU 淘汰并有 TTL，数据在修改后延迟写盘，重启后仍然有效。
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 2000,
+        ttl: float = 7 * 24 * 3600,
+        max_distance: int = 5,
+        flush_interval: float = 30,
+    ) -> None:
+        super().__init__("saucenao_cache", flush_interval)
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        # hash -> (created_at, data)，按最近使用排序
+        self._entries: OrderedDict = OrderedDict()
+        self._tree = BKTree()
+        self._dirty = False
+        self._loader = BackgroundLoader(self.load, "saucenao_cache")
+
+        self.hits = 0
+        self.misses = 0
+
+    def start_loading(self) -> None:
+        self._loader.start()
+
+    async def ensure_loaded(self) -> None:
+        await self._loader.wait()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            now = time.time()
+            for h, created_at, data in raw.get("entries", []):
+                if now - created_at < self.ttl:
+                    self._entries[int(h, 16)] = (created_at, data)
+        except Exception:
+            logger.exception("读取搜番缓存失败，已忽略")
+            self._entries.clear()
+        self._tree.rebuild(self._entries.keys())
+
+    async def hash_image(self, data) -> int:
+        """在线程池中计算感知哈希，`data` 为图片字节或文件对象"""
+        loop = asyncio.get_running_loop()
+        with METRICS.timer("image_hash_seconds"):
+            return await loop.run_in_executor(None, dhash, data)
+
+    def get(self, image_hash: int):
+        now = time.time()
+        for dist, h in self._tree.search(image_hash, self.max_distance):
+            entry = self._entries.get(h)
+            if entry is None:
+                continue
+            if now - entry[0] >= self.ttl:
+                self._evict(h)
+                continue
+            self._entries.move_to_end(h)
+            self.hits += 1
+            logger.info(f"搜番缓存命中，汉明距离 {dist}")
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, image_hash: int, data) -> None:
+        if image_hash not in self._entries:
+            self._tree.add(image_hash)
+        self._entries[image_hash] = (time.time(), data)
+        self._entries.move_to_end(image_hash)
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+        self._mark_dirty()
+
+    def _evict(self, image_hash: int) -> None:
+        self._entries.pop(image_hash, None)
+        # BK 树不支持删除，失效节点过多时重建
+        if self._tree.size > 2 * len(self._entries) + 64:
+            self._tree.rebuild(self._entries.keys())
+        self._mark_dirty()
+
+    def _mark_dirty(self) -> None:
+        self._dirty = True
+        self._schedule_flush()
+
+    def _take_dirty(self):
+        if not self._dirty:
+            return None
+        self._dirty = False
+        entries = [
+            [format(h, "016x"), created_at, data]
+            for h, (created_at, data) in self._entries.items()
+        ]
+        return json.dumps(
+            {"version": self.FORMAT_VERSION, "entries": entries}, ensure_ascii=False
+        )
+
+    def _write(self, content: str) -> None:
+        atomic_write(self.path, content)
+
+    def _restore_dirty(self, content: str) -> None:
+        self._dirty = True
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    async def close(self) -> None:
+        await self._loader.close()
+        await super().close()
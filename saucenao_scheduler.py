@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+from .metrics import METRICS
+
+logger = logging.getLogger("astrbot")
+
+
+class SauceNAORateLimited(Exception):
+    """SauceNAO 返回 429，`daily` 表示当日配额耗尽"""
+
+    def __init__(self, daily: bool = False) -> None:
+        super().__init__("SauceNAO 日配额已用完" if daily else "SauceNAO 请求过于频繁")
+        self.daily = daily
+
+
+class SauceNAOQueueFull(Exception):
+    pass
+
+
+class SauceNAONotConfigured(Exception):
+    """没有可用的 API key"""
+
+
+class _KeyState:
+    """单个 API key 的令牌桶，容量和剩余次数以 SauceNAO 返回的 header 为准"""
+
+    __slots__ = (
+        "key",
+        "capacity",
+        "window",
+        "tokens",
+        "updated",
+        "cooldown_until",
+        "long_remaining",
+    )
+
+    def __init__(self, key: str, capacity: int = 4, window: float = 30) -> None:
+        self.key = key
+        self.capacity = capacity
+        self.window = window
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.cooldown_until = 0.0
+        self.long_remaining = None
+
+    def refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        self.updated = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity / self.window)
+
+    def wait_time(self, now: float) -> float:
+        """距离可用还需等待的秒数，0 表示现在可用"""
+        if self.cooldown_until > now:
+            return self.cooldown_until - now
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) * self.window / self.capacity
+
+
+class _Job:
+    __slots__ = ("user", "func", "future", "attempts", "queued_at")
+
+    def __init__(self, user, func, future) -> None:
+        self.user = user
+        self.func = func
+        self.future = future
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+
+class SauceNAOScheduler:
+    """SauceNAO 请求调度器。
+
+    - 每个 API key 一个令牌桶，根据返回的 `short_remaining`/`long_remaining` 校准，遇到 429 进入冷却；
+    - 多个 key 组成池子，总吞吐随 key 数量线性增加；
+    - 等待队列有总长度上限，按用户轮转出队，单个用户无法占满队列。
+    """
+
+    def __init__(
+        self,
+        api_keys: list,
+        max_queue: int = 20,
+        max_per_user: int = 2,
+        max_attempts: int = 3,
+        short_cooldown: float = 30,
+        daily_cooldown: float = 3600,
+    ) -> None:
+        self.keys = [_KeyState(k) for k in dict.fromkeys(k for k in api_keys if k)]
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.max_attempts = max_attempts
+        self.short_cooldown = short_cooldown
+        self.daily_cooldown = daily_cooldown
+        # user -> deque[_Job]，按轮转顺序排列
+        self._queues: OrderedDict = OrderedDict()
+        self._size = 0
+        self._wakeup: asyncio.Event = None
+        self._dispatcher: asyncio.Task = None
+        self._running: set = set()
+
+        self.completed = 0
+        self.rate_limited = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.keys)
+
+    def position(self, user) -> int:
+        """用户最早一个请求前面还有多少个请求"""
+        # 轮转出队：排在该用户之前的每个用户各先出一个
+        for pos, u in enumerate(self._queues):
+            if u == user:
+                return pos
+        return 0
+
+    def _ensure_dispatcher(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    def _acquire_key(self):
+        """取一个可用的 key，没有时返回 (None, 最短等待时间)"""
+        now = time.monotonic()
+        best_wait = None
+        # 优先使用日配额剩余多的 key
+        for state in sorted(
+            self.keys,
+            key=lambda s: -(1 << 30 if s.long_remaining is None else s.long_remaining),
+        ):
+            wait = state.wait_time(now)
+            if wait == 0:
+                state.tokens -= 1
+                return state, 0
+            best_wait = wait if best_wait is None else min(best_wait, wait)
+        return None, best_wait
+
+    def _push(self, job: _Job, front: bool = False) -> None:
+        queue = self._queues.get(job.user)
+        if queue is None:
+            queue = self._queues[job.user] = deque()
+            if front:
+                self._queues.move_to_end(job.user, last=False)
+        if front:
+            queue.appendleft(job)
+        else:
+            queue.append(job)
+        self._size += 1
+        self._wakeup.set()
+
+    def _pop(self) -> _Job:
+        user, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        if queue:
+            self._queues.move_to_end(user)
+        else:
+            del self._queues[user]
+        self._size -= 1
+        return job
+
+    async def submit(self, user, func, on_queued=None):
+        """提交一次搜索。`func(api_key)` 执行实际请求；排队时调用 `on_queued(position)`。
+
+        返回 `func` 的结果，队列已满时抛出 `SauceNAOQueueFull`，没有 key 时抛出 `SauceNAONotConfigured`。
+        """
+        if not self.configured:
+            raise SauceNAONotConfigured("未配置 SauceNAO API key")
+        queue = self._queues.get(user)
+        if self._size >= self.max_queue or (queue and len(queue) >= self.max_per_user):
+            self.rejected += 1
+            raise SauceNAOQueueFull("搜番队列已满")
+        self._ensure_dispatcher()
+        job = _Job(user, func, asyncio.get_running_loop().create_future())
+        self._push(job)
+        if on_queued is not None:
+            pos = self.position(user)
+            if pos > 0 or self._min_wait() > 0:
+                await on_queued(pos + 1)
+        return await job.future
+
+    def _min_wait(self) -> float:
+        now = time.monotonic()
+        return min(s.wait_time(now) for s in self.keys)
+
+    async def _dispatch(self) -> None:
+        while True:
+            if not self._size:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            state, wait = self._acquire_key()
+            if state is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job = self._pop()
+            if job.future.done():
+                # 调用方已取消，归还令牌
+                state.tokens += 1
+                continue
+            task = asyncio.get_running_loop().create_task(self._run(job, state))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def update_from_header(self, state: _KeyState, header: dict) -> None:
+        try:
+            short_remaining = int(header["short_remaining"])
+            state.capacity = max(1, int(header.get("short_limit", state.capacity)))
+            state.tokens = min(state.tokens, short_remaining)
+            state.long_remaining = int(header["long_remaining"])
+        except (KeyError, TypeError, ValueError):
+            return
+        if state.long_remaining <= 0:
+            state.cooldown_until = time.monotonic() + self.daily_cooldown
+
+    async def _run(self, job: _Job, state: _KeyState) -> None:
+        METRICS.observe("saucenao_queue_wait_seconds", time.monotonic() - job.queued_at)
+        try:
+            with METRICS.timer("saucenao_request_seconds"):
+                result = await job.func(state.key)
+        except SauceNAORateLimited as e:
+            self.rate_limited += 1
+            cooldown = self.daily_cooldown if e.daily else self.short_cooldown
+            state.cooldown_until = time.monotonic() + cooldown
+            state.tokens = 0
+            job.attempts += 1
+            logger.warning(f"SauceNAO key ...{state.key[-4:]} 被限流，冷却 {cooldown} 秒")
+            if job.attempts < self.max_attempts and not job.future.done():
+                self._push(job, front=True)
+            elif not job.future.done():
+                job.future.set_exception(e)
+            return
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        if isinstance(result, dict) and isinstance(result.get("header"), dict):
+            self.update_from_header(state, result["header"])
+        self.completed += 1
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "queued": self._size,
+            "running": len(self._running),
+            "completed": self.completed,
+            "rate_limited": self.rate_limited,
+            "rejected": self.rejected,
+            "keys": [
+                {
+                    "key": f"...{s.key[-4:]}",
+                    "tokens": round(s.tokens, 2),
+                    "long_remaining": s.long_remaining,
+                    "cooldown": max(0.0, round(s.cooldown_until - now, 1)),
+                }
+                for s in self.keys
+            ],
+        }
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for task in list(self._running):
+            task.cancel()
+        for queue in self._queues.values():
+            for job in queue:
+                if not job.future.done():
+                    job.future.cancel()
+        self._queues.clear()
+        self._size = 0
@@ -0,0 +1,196 @@
+import abc
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+from .metrics import METRICS
+
+logger = logging.getLogger("astrbot")
+
+
+def atomic_write(path: str, content: str) -> None:
+    """先写入同目录下的临时文件再重命名，避免写入中途崩溃导致文件损坏"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class BackgroundLoader:
+    """在线程池中执行一次同步的 `load`，插件加载时启动，使用数据前 `await wait()`。
+
+    不在事件循环中时 `start` 什么也不做，由第一次 `wait` 启动；载入失败后下次 `wait` 会重试。
+    """
+
+    def __init__(self, load, name: str, executor=None) -> None:
+        self._load = load
+        self.name = name
+        self._executor = executor
+        self._task: asyncio.Task = None
+        self.loaded = False
+
+    def start(self) -> None:
+        if self.loaded or (self._task is not None and not self._task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._run())
+        self._task.add_done_callback(self._on_done)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        await loop.run_in_executor(self._executor, self._load)
+        self.loaded = True
+        METRICS.observe("startup_seconds", time.perf_counter() - start, stage=self.name)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"载入 {self.name} 失败: {task.exception()!r}")
+
+    async def wait(self) -> None:
+        if self.loaded:
+            return
+        if self._task is None or self._task.done():
+            self._task = None
+            self.start()
+        # 其它调用方被取消时不影响载入本身
+        await asyncio.shield(self._task)
+
+    async def close(self) -> None:
+        """等待正在进行的载入结束，之后才能安全地写盘或关闭连接"""
+        if self._task is not None and not self._task.done():
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class DebouncedStore(abc.ABC):
+    """防抖写盘的公共部分：修改后调用 `_schedule_flush`，`flush_interval` 秒内的修改合并为一次写入。
+
+    子类实现：
+    - `_take_dirty()`：在事件循环中取出并清空待写入的修改，返回写入所需的快照，没有修改时返回 None；
+    - `_write(snapshot)`：在线程池（`executor`，默认为公共线程池）中写入；
+    - `_restore_dirty(snapshot)`：写入失败时把修改放回，下次重试。
+    """
+
+    def __init__(self, name: str, flush_interval: float, executor=None) -> None:
+        self.store_name = name
+        self.flush_interval = flush_interval
+        self._write_executor = executor
+        self._flush_task: asyncio.Task = None
+        # 定时写盘任务还在防抖等待中，尚未开始写入
+        self._debouncing = False
+        self._lock = asyncio.Lock()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._debouncing = True
+        self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        try:
+            await asyncio.sleep(self.flush_interval)
+        finally:
+            self._debouncing = False
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception(f"写入 {self.store_name} 失败")
+
+    @abc.abstractmethod
+    def _take_dirty(self):
+        ...
+
+    @abc.abstractmethod
+    def _write(self, snapshot) -> None:
+        ...
+
+    @abc.abstractmethod
+    def _restore_dirty(self, snapshot) -> None:
+        ...
+
+    async def flush(self) -> None:
+        async with self._lock:
+            snapshot = self._take_dirty()
+            if snapshot is None:
+                return
+            loop = asyncio.get_running_loop()
+            try:
+                with METRICS.timer("persist_seconds", store=self.store_name):
+                    await loop.run_in_executor(self._write_executor, self._write, snapshot)
+            except BaseException:
+                self._restore_dirty(snapshot)
+                raise
+
+    async def close(self) -> None:
+        task = self._flush_task
+        if task is not None and not task.done():
+            # 只能取消防抖等待；已经在线程池中写入的任务取消不了线程，
+            # 取消后修改会被放回，下面又写一次，所以要等它写完
+            if self._debouncing:
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+
+
+class JsonStore(DebouncedStore):
+    """小型 JSON 数据文件：修改后标记为脏，防抖后在线程池中原子写盘。
+
+    `dump` 返回要写入的对象，默认为 `self.data`。
+    """
+
+    def __init__(
+        self, path: str, default=None, flush_interval: float = 2.0, dump=None
+    ) -> None:
+        super().__init__(os.path.basename(path), flush_interval)
+        self.path = path
+        self.data = {} if default is None else default
+        self.dump = dump or (lambda: self.data)
+        self._dirty = False
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except Exception:
+            logger.exception(f"读取 {self.path} 失败，已忽略")
+
+    def mark_dirty(self) -> None:
+        self._dirty = True
+        self._schedule_flush()
+
+    def _take_dirty(self):
+        if not self._dirty:
+            return None
+        self._dirty = False
+        return json.dumps(self.dump(), ensure_ascii=False, indent=2)
+
+    def _write(self, content: str) -> None:
+        atomic_write(self.path, content)
+
+    def _restore_dirty(self, content: str) -> None:
+        self._dirty = True
@@ -0,0 +1,12 @@
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+# 插件内部使用相对导入，把插件目录注册为包 `essential` 供测试导入
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if "essential" not in sys.modules:
+    spec = importlib.machinery.ModuleSpec("essential", None, is_package=True)
+    spec.submodule_search_locations = [PLUGIN_DIR]
+    sys.modules["essential"] = importlib.util.module_from_spec(spec)
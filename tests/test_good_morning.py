@@ -0,0 +1,199 @@
+import asyncio
+import json
+import sqlite3
+import time
+
+import pytest
+
+from essential.good_morning import (
+    GoodMorningStore,
+    SleepingIndex,
+    SleepRecord,
+    day_of,
+    format_time,
+    parse_time,
+)
+from essential.good_morning_sqlite import SqliteGoodMorningStore
+
+NIGHT = "2024-05-01 23:30:00"
+MORNING = "2024-05-02 07:15:00"
+
+LEGACY_GROUP = {
+    "alice": {"daily": {"night_time": NIGHT, "morning_time": MORNING}},
+    # 只说过晚安
+    "bob": {"daily": {"night_time": NIGHT, "morning_time": ""}},
+    "carol": {"daily": {}},
+}
+EXPECTED_GROUP = {
+    "alice": [parse_time(NIGHT), parse_time(MORNING)],
+    "bob": [parse_time(NIGHT), 0],
+    "carol": [0, 0],
+}
+
+
+def write_json(path, data) -> None:
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+
+def group_lists(store, umo: str) -> dict:
+    return {uid: r.to_list() for uid, r in store.groups[umo].items()}
+
+
+def round_trip(path) -> tuple:
+    """载入旧文件并写回，返回 (写回前的 store, 写回后的文件内容, 重新载入的 store)"""
+    store = GoodMorningStore(str(path))
+    store.load()
+    asyncio.run(store.flush())
+    saved = json.loads(path.read_text(encoding="utf-8"))
+    reloaded = GoodMorningStore(str(path))
+    reloaded.load()
+    return store, saved, reloaded
+
+
+def test_time_conversion():
+    ts = parse_time(NIGHT)
+    assert format_time(ts) == NIGHT
+    assert parse_time("") == 0
+    assert format_time(0) == ""
+    # UTC+8 的 23:30 和次日 07:15 属于不同的日期
+    assert day_of(parse_time(MORNING)) == day_of(ts) + 1
+
+
+@pytest.mark.parametrize(
+    "legacy, extra",
+    [
+        # 最早的版本把群数据直接写在顶层
+        ({"group1": LEGACY_GROUP}, {}),
+        # {"good_morning": {...}}，其它顶层字段原样保留
+        ({"good_morning": {"group1": LEGACY_GROUP}, "other": [1, 2]}, {"other": [1, 2]}),
+        # version 1：daily 字符串格式
+        ({"version": 1, "good_morning": {"group1": LEGACY_GROUP}}, {}),
+    ],
+)
+def test_legacy_migration(tmp_path, legacy, extra):
+    path = tmp_path / "good_morning.json"
+    write_json(path, legacy)
+    store, saved, reloaded = round_trip(path)
+
+    assert group_lists(store, "group1") == EXPECTED_GROUP
+    assert saved == {"version": 2, **extra, "good_morning": {"group1": EXPECTED_GROUP}}
+    assert group_lists(reloaded, "group1") == EXPECTED_GROUP
+    assert reloaded.extra == extra
+    # 新格式的文件不会再被重写
+    assert not reloaded._dirty
+
+
+def test_changes_written_on_close(tmp_path):
+    path = tmp_path / "good_morning.json"
+    write_json(
+        path,
+        {
+            "version": 2,
+            "good_morning": {"g1": {"u": [1, 2]}, "g2": {"u": [3, 4]}},
+        },
+    )
+
+    async def run():
+        store = GoodMorningStore(str(path), flush_interval=60)
+        store.load()
+        (await store.load_group("g2"))["v"] = SleepRecord(5, 0)
+        store.mark_dirty("g2", "v")
+        await store.close()
+
+    asyncio.run(run())
+    saved = json.loads(path.read_text(encoding="utf-8"))
+    assert saved["good_morning"] == {"g1": {"u": [1, 2]}, "g2": {"u": [3, 4], "v": [5, 0]}}
+
+
+def test_flush_failure_keeps_changes(tmp_path, monkeypatch):
+    path = tmp_path / "good_morning.json"
+
+    async def run():
+        store = GoodMorningStore(str(path), flush_interval=60)
+        store.get_group("g")["u"] = SleepRecord(1, 0)
+        store.mark_dirty("g", "u")
+
+        def fail(snapshot):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(store, "_write", fail)
+        with pytest.raises(OSError):
+            await store.flush()
+        monkeypatch.undo()
+        await store.close()
+
+    asyncio.run(run())
+    assert json.loads(path.read_text(encoding="utf-8"))["good_morning"] == {"g": {"u": [1, 0]}}
+
+
+def test_sqlite_migrates_legacy_json(tmp_path):
+    json_path = tmp_path / "good_morning.json"
+    write_json(json_path, {"group1": LEGACY_GROUP})
+
+    async def run(db):
+        store = SqliteGoodMorningStore(str(db), json_path=str(json_path))
+        try:
+            group = await store.load_group("group1")
+            return {uid: r.to_list() for uid, r in group.items()}
+        finally:
+            await store.close()
+
+    db = tmp_path / "good_morning.db"
+    assert asyncio.run(run(db)) == EXPECTED_GROUP
+    # 只迁移一次，之后 JSON 文件的变化不再影响数据库
+    write_json(json_path, {"group1": {}})
+    assert asyncio.run(run(db)) == EXPECTED_GROUP
+
+
+def test_close_waits_for_running_write(tmp_path):
+    db = tmp_path / "good_morning.db"
+
+    async def run():
+        store = SqliteGoodMorningStore(str(db), flush_interval=0.01)
+        await store.ensure_loaded()
+        write = store._write
+
+        def slow_write(snapshot):
+            time.sleep(0.2)
+            write(snapshot)
+
+        store._write = slow_write
+        store.record_sleep("g", "u", "name", 1000, 1000 + 3600)
+        # 关闭时定时写盘正在线程池中执行
+        await asyncio.sleep(0.05)
+        await store.close()
+
+    asyncio.run(run())
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sleep_log").fetchone() == (1,)
+
+
+def test_sleeping_index_counts():
+    night = parse_time(NIGHT)
+    day = day_of(night)
+    group = {
+        "alice": SleepRecord(night, 0),
+        "bob": SleepRecord(night, parse_time(MORNING)),
+        # 前一天的晚安不算
+        "carol": SleepRecord(night - 86400, 0),
+    }
+    index = SleepingIndex()
+    assert index.count("g") == 0
+    index.ensure("g", group, day)
+    assert index.count("g") == 1
+
+    # 再次 ensure 不会重新扫描
+    group["dave"] = SleepRecord(night, 0)
+    index.ensure("g", group, day)
+    assert index.count("g") == 1
+    index.update("g", False, True)
+    assert index.count("g") == 2
+    # 状态没变时不计数
+    index.update("g", True, True)
+    assert index.count("g") == 2
+    index.update("g", True, False)
+    assert index.count("g") == 1
+
+    # 跨天清零
+    index.ensure("g", group, day + 1)
+    assert index.count("g") == 0
@@ -0,0 +1,336 @@
+import asyncio
+import json
+import struct
+
+import pytest
+
+from essential import mcping
+from essential.mcping import (
+    RAKNET_MAGIC,
+    MCPingError,
+    MCStatusClient,
+    _pack_varint,
+    _read_varint,
+    bedrock_status,
+    java_status,
+)
+
+JAVA_STATUS = {
+    "version": {"name": "§aPaper 1.20.4", "protocol": 765},
+    "players": {
+        "online": 2,
+        "max": 20,
+        "sample": [{"name": "Steve", "id": "0"}, {"name": "Alex", "id": "1"}],
+    },
+    "description": {"text": "§6Hello ", "extra": [{"text": "World"}, "\n§7second"]},
+    "favicon": "data:image/png;base64,AAAA",
+}
+
+BEDROCK_PONG_FIELDS = [
+    "MCPE",
+    "§bBedrock MOTD",
+    "594",
+    "1.20.10",
+    "3",
+    "10",
+    "1234567890",
+    "Sub MOTD",
+    "Survival",
+    "1",
+    "19132",
+    "19133",
+]
+
+
+async def read_packet(reader) -> bytes:
+    return await reader.readexactly(await _read_varint(reader))
+
+
+def read_varint(data: bytes, offset: int) -> tuple:
+    result = 0
+    for i in range(5):
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return result, offset
+    raise ValueError("VarInt 过长")
+
+
+class FakeJavaServer:
+    """Server List Ping 的 TCP 替身，记录并校验客户端发来的握手"""
+
+    def __init__(self, status: dict = None) -> None:
+        self.status = json.dumps(status or JAVA_STATUS).encode("utf-8")
+        self.handshakes = []
+        self.server = None
+        self.port = None
+
+    async def handle(self, reader, writer) -> None:
+        try:
+            handshake = await read_packet(reader)
+            packet_id, offset = read_varint(handshake, 0)
+            protocol, offset = read_varint(handshake, offset)
+            length, offset = read_varint(handshake, offset)
+            host = handshake[offset : offset + length].decode("utf-8")
+            offset += length
+            (port,) = struct.unpack(">H", handshake[offset : offset + 2])
+            next_state, offset = read_varint(handshake, offset + 2)
+            self.handshakes.append((packet_id, protocol, host, port, next_state))
+            assert offset == len(handshake)
+            assert await read_packet(reader) == b"\x00"
+
+            body = _pack_varint(0x00) + _pack_varint(len(self.status)) + self.status
+            writer.write(_pack_varint(len(body)) + body)
+            await writer.drain()
+
+            ping = await read_packet(reader)
+            assert ping[0] == 0x01 and len(ping) == 9
+            writer.write(_pack_varint(len(ping)) + ping)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self, port: int = 0) -> None:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class FakeBedrockServer(asyncio.DatagramProtocol):
+    """RakNet Unconnected Ping 的 UDP 替身"""
+
+    def __init__(self, fields: list = None, reply: bytes = None) -> None:
+        self.fields = fields or BEDROCK_PONG_FIELDS
+        self.reply = reply
+        self.pings = []
+        self.transport = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data, addr) -> None:
+        self.pings.append(data)
+        if self.reply is not None:
+            self.transport.sendto(self.reply, addr)
+            return
+        payload = ";".join(self.fields).encode("utf-8")
+        pong = (
+            b"\x1c"
+            + data[1:9]
+            + struct.pack(">q", 42)
+            + RAKNET_MAGIC
+            + struct.pack(">H", len(payload))
+            + payload
+        )
+        self.transport.sendto(pong, addr)
+
+    async def start(self, port: int = 0) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, local_addr=("127.0.0.1", port))
+        self.port = self.transport.get_extra_info("sockname")[1]
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+def test_pack_varint():
+    assert _pack_varint(0) == b"\x00"
+    assert _pack_varint(300) == b"\xac\x02"
+    assert _pack_varint(-1) == b"\xff\xff\xff\xff\x0f"
+
+
+def test_read_varint_rejects_overlong():
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"\xff" * 6)
+        with pytest.raises(MCPingError):
+            await _read_varint(reader)
+
+    asyncio.run(run())
+
+
+def test_java_status():
+    async def run():
+        server = FakeJavaServer()
+        await server.start()
+        try:
+            data = await java_status("127.0.0.1", server.port, timeout=2)
+        finally:
+            await server.close()
+        return server, data
+
+    server, data = asyncio.run(run())
+    assert server.handshakes == [(0x00, 47, "127.0.0.1", server.port, 1)]
+    assert data["source"] == "java"
+    assert data["motd"]["clean"] == ["Hello World", "second"]
+    assert data["version"] == "Paper 1.20.4"
+    assert data["players"] == {"online": 2, "max": 20, "list": ["Steve", "Alex"]}
+    assert data["icon"] == JAVA_STATUS["favicon"]
+    assert isinstance(data["latency"], int)
+
+
+def test_java_status_connection_refused():
+    async def run():
+        server = FakeJavaServer()
+        await server.start()
+        await server.close()
+        with pytest.raises(MCPingError):
+            await java_status("127.0.0.1", server.port, timeout=2)
+
+    asyncio.run(run())
+
+
+def test_bedrock_status():
+    async def run():
+        server = FakeBedrockServer()
+        await server.start()
+        try:
+            data = await bedrock_status("127.0.0.1", server.port, timeout=2)
+        finally:
+            server.close()
+        return server, data
+
+    server, data = asyncio.run(run())
+    (ping,) = server.pings
+    assert len(ping) == 33
+    assert ping[0] == 0x01
+    assert ping[9:25] == RAKNET_MAGIC
+    assert data["source"] == "bedrock"
+    assert data["motd"]["clean"] == ["Bedrock MOTD", "Sub MOTD"]
+    assert data["version"] == "1.20.10 (基岩版)"
+    assert data["players"] == {"online": 3, "max": 10}
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [b"\x00" * 40, b"\x1c" + b"\x00" * 10, b"\x1c" + b"\x00" * 32 + b"\x00\x03a;b"],
+)
+def test_bedrock_status_invalid_reply(reply):
+    async def run():
+        server = FakeBedrockServer(reply=reply)
+        await server.start()
+        try:
+            with pytest.raises(MCPingError):
+                await bedrock_status("127.0.0.1", server.port, timeout=2)
+        finally:
+            server.close()
+
+    asyncio.run(run())
+
+
+async def start_both() -> tuple:
+    """在同一个端口上同时启动 Java 版（TCP）和基岩版（UDP）替身"""
+    java = FakeJavaServer()
+    await java.start()
+    bedrock = FakeBedrockServer()
+    await bedrock.start(java.port)
+    return java, bedrock
+
+
+def test_query_prefers_java():
+    async def run():
+        java, bedrock = await start_both()
+        try:
+            client = MCStatusClient(http=None, java_timeout=2, bedrock_timeout=2)
+            return await client.query(f"127.0.0.1:{java.port}")
+        finally:
+            await java.close()
+            bedrock.close()
+
+    data = asyncio.run(run())
+    assert data["source"] == "java"
+    assert data["players"]["list"] == ["Steve", "Alex"]
+
+
+def test_query_falls_back_to_bedrock():
+    async def run():
+        bedrock = FakeBedrockServer()
+        await bedrock.start()
+        try:
+            client = MCStatusClient(http=None, java_timeout=2, bedrock_timeout=2)
+            return await client.query(f"127.0.0.1:{bedrock.port}")
+        finally:
+            bedrock.close()
+
+    assert asyncio.run(run())["source"] == "bedrock"
+
+
+def test_query_prefers_bedrock_on_bedrock_port(monkeypatch):
+    async def run():
+        java, bedrock = await start_both()
+        monkeypatch.setattr(mcping, "BEDROCK_PORTS", (java.port,))
+        try:
+            client = MCStatusClient(http=None, java_timeout=2, bedrock_timeout=2)
+            return await client.query(f"127.0.0.1:{java.port}")
+        finally:
+            await java.close()
+            bedrock.close()
+
+    assert asyncio.run(run())["source"] == "bedrock"
+
+
+class FakeResponse:
+    def __init__(self, body: bytes) -> None:
+        self.status = 200
+        self.body = body
+
+    async def json(self):
+        return json.loads(self.body)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+
+class FakeHttp:
+    """mcsrvstat.us 的替身，按地址返回固定的响应体"""
+
+    def __init__(self, bodies: dict) -> None:
+        self.bodies = bodies
+
+    def get(self, url: str, endpoint: str = None) -> FakeResponse:
+        return FakeResponse(self.bodies[url.rsplit("/", 1)[-1]])
+
+
+def test_query_api_invalid_body():
+    async def run():
+        client = MCStatusClient(FakeHttp({"a": b"<html>", "b": b"[]"}), api_url="/")
+        for address in ("a", "b"):
+            with pytest.raises(MCPingError):
+                await client._query_api(address)
+
+    asyncio.run(run())
+
+
+def test_query_many_partial_results(monkeypatch):
+    async def native(address):
+        if address.startswith("slow"):
+            await asyncio.sleep(10)
+        if address == "ok":
+            return {"online": True, "source": "java"}
+        raise MCPingError("直连失败")
+
+    async def run():
+        client = MCStatusClient(
+            FakeHttp({"bad": b"not json", "gone": b'{"online": false}'}), api_url="/"
+        )
+        monkeypatch.setattr(client, "_query_native", native)
+        slow = [f"slow{i}" for i in range(12)]
+        start = asyncio.get_running_loop().time()
+        results = await client.query_many(["ok", "bad", "gone"] + slow, deadline=0.3)
+        return results, asyncio.get_running_loop().time() - start
+
+    results, elapsed = asyncio.run(run())
+    # 整批共用一个截止时间，不会因为排队而成倍增加
+    assert elapsed < 2
+    assert [r[0] for r in results[:3]] == ["ok", "bad", "gone"]
+    assert results[0][1]["source"] == "java"
+    assert results[1][1] is None and "JSONDecodeError" in results[1][2]
+    assert results[2][1] == {"online": False, "source": "api"}
+    assert all(r[1] is None and r[2] == "超时" for r in results[3:])
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from essential.saucenao_scheduler import (
+    SauceNAONotConfigured,
+    SauceNAOQueueFull,
+    SauceNAORateLimited,
+    SauceNAOScheduler,
+)
+
+
+def ok(key: str, long_remaining: int = 100) -> dict:
+    return {
+        "header": {"short_remaining": 3, "short_limit": 4, "long_remaining": long_remaining},
+        "results": [key],
+    }
+
+
+class FakeSauceNAO:
+    """按 key 返回结果或抛出 429，记录每次请求使用的 key"""
+
+    def __init__(self, limited: dict) -> None:
+        # key -> None（正常）/ False（短时限流）/ True（日配额用完）
+        self.limited = limited
+        self.calls = []
+
+    async def request(self, key: str) -> dict:
+        self.calls.append(key)
+        daily = self.limited.get(key)
+        if daily is not None:
+            raise SauceNAORateLimited(daily=daily)
+        return ok(key)
+
+
+def run_with(scheduler, coro_factory):
+    async def run():
+        try:
+            return await coro_factory()
+        finally:
+            await scheduler.close()
+
+    return asyncio.run(run())
+
+
+def test_429_fails_over_to_next_key():
+    scheduler = SauceNAOScheduler(["k1", "k2"], short_cooldown=60)
+    api = FakeSauceNAO({"k1": False})
+    result = run_with(scheduler, lambda: scheduler.submit("u", api.request))
+
+    assert result["results"] == ["k2"]
+    assert api.calls == ["k1", "k2"]
+    assert scheduler.rate_limited == 1
+    cooldowns = {k["key"]: k["cooldown"] for k in scheduler.stats()["keys"]}
+    assert cooldowns["...k1"] > 50 and cooldowns["...k2"] == 0
+
+
+def test_daily_429_uses_daily_cooldown():
+    scheduler = SauceNAOScheduler(["k1", "k2"], short_cooldown=1, daily_cooldown=3600)
+    api = FakeSauceNAO({"k1": True})
+    run_with(scheduler, lambda: scheduler.submit("u", api.request))
+    cooldowns = {k["key"]: k["cooldown"] for k in scheduler.stats()["keys"]}
+    assert cooldowns["...k1"] > 3000
+
+
+def test_gives_up_after_max_attempts():
+    scheduler = SauceNAOScheduler(["k1", "k2"], max_attempts=3, short_cooldown=0.05)
+    # 冷却结束后令牌桶还要补充，缩短窗口让测试不必等待
+    for state in scheduler.keys:
+        state.window = 0.1
+    api = FakeSauceNAO({"k1": False, "k2": False})
+    with pytest.raises(SauceNAORateLimited):
+        run_with(scheduler, lambda: scheduler.submit("u", api.request))
+    # 两个 key 各试一次后等冷却结束再试，共 3 次
+    assert len(api.calls) == 3
+    assert api.calls[:2] == ["k1", "k2"]
+
+
+def test_prefers_key_with_more_daily_quota():
+    scheduler = SauceNAOScheduler(["k1", "k2"])
+
+    async def run():
+        k1, k2 = scheduler.keys
+        scheduler.update_from_header(k1, ok("k1", long_remaining=5)["header"])
+        scheduler.update_from_header(k2, ok("k2", long_remaining=50)["header"])
+        return await scheduler.submit("u", FakeSauceNAO({}).request)
+
+    assert run_with(scheduler, run)["results"] == ["k2"]
+
+
+def test_not_configured_and_queue_full():
+    scheduler = SauceNAOScheduler(["", None])
+    assert not scheduler.configured
+    with pytest.raises(SauceNAONotConfigured):
+        run_with(scheduler, lambda: scheduler.submit("u", FakeSauceNAO({}).request))
+
+    scheduler = SauceNAOScheduler(["k1"], max_per_user=1)
+
+    async def run():
+        blocker = asyncio.Event()
+
+        async def slow(key):
+            await blocker.wait()
+
+        # 第一个请求正在执行，第二个排队，第三个超出单用户上限
+        first = asyncio.ensure_future(scheduler.submit("u", slow))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(scheduler.submit("u", slow))
+        await asyncio.sleep(0)
+        with pytest.raises(SauceNAOQueueFull):
+            await scheduler.submit("u", slow)
+        blocker.set()
+        for task in (first, second):
+            task.cancel()
+        return scheduler.rejected
+
+    assert run_with(scheduler, run) == 1
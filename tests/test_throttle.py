@@ -0,0 +1,89 @@
+import pytest
+
+from essential import throttle
+from essential.throttle import CommandGuard, parse_command_limits, parse_limit
+
+
+class FakeMessage:
+    def __init__(self, sender: str = "u1", origin: str = "qq:group:1") -> None:
+        self.sender = sender
+        self.unified_msg_origin = origin
+        self.message_str = ""
+
+    def get_platform_name(self) -> str:
+        return "qq"
+
+    def get_sender_id(self) -> str:
+        return self.sender
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(throttle.time, "monotonic", lambda: now[0])
+    return now
+
+
+def reject(scope: str, seconds: float) -> str:
+    return f"{scope} {throttle.retry_after_text(seconds)}"
+
+
+def test_parse_limit():
+    assert parse_limit("5/60") == (5, 60.0)
+    assert parse_limit("5") == (5, 60.0)
+    assert parse_limit("") is None
+    assert parse_limit("0") is None
+    with pytest.raises(ValueError):
+        parse_limit("-1/60")
+
+
+def test_parse_command_limits():
+    assert parse_command_limits(["mcs 3/30 10/30", "一言 - 5/10", "bad", "x 1/0"]) == {
+        "mcs": ((3, 30.0), (10, 30.0)),
+        "一言": (None, (5, 10.0)),
+    }
+
+
+def test_user_limit_replies_once(clock):
+    guard = CommandGuard(user_limit=(2, 60), on_reject=reject)
+    message = FakeMessage()
+    assert guard.admit("一言", message) == (True, None)
+    assert guard.admit("一言", message) == (True, None)
+    assert guard.admit("一言", message) == (False, "user 30 秒")
+    # 恢复前只提示一次
+    assert guard.admit("一言", message) == (False, None)
+    # 其他用户不受影响
+    assert guard.admit("一言", FakeMessage("u2")) == (True, None)
+    assert guard.rejected == 2
+
+    clock[0] += 30
+    assert guard.admit("一言", message) == (True, None)
+    assert guard.admit("一言", message) == (False, "user 30 秒")
+
+
+def test_group_limit_shared_by_users(clock):
+    guard = CommandGuard(user_limit=(5, 60), group_limit=(2, 60), on_reject=reject)
+    assert guard.admit("mcs", FakeMessage("u1"))[0]
+    assert guard.admit("mcs", FakeMessage("u2"))[0]
+    assert guard.admit("mcs", FakeMessage("u3")) == (False, "group 30 秒")
+    assert guard.admit("mcs", FakeMessage("u1", "qq:group:2"))[0]
+
+
+def test_command_limit_and_rejection_does_not_consume(clock):
+    guard = CommandGuard(
+        user_limit=(3, 60), command_limits={"mcs": ((1, 60), None)}, on_reject=reject
+    )
+    message = FakeMessage()
+    assert guard.admit("mcs", message)[0]
+    assert guard.admit("mcs", message) == (False, "user 60 秒")
+    # 被 mcs 的限额拒绝的请求没有扣减全局限额
+    assert guard.admit("一言", message)[0]
+    assert guard.admit("一言", message)[0]
+    assert not guard.admit("一言", message)[0]
+
+
+def test_disabled_or_unlimited_admits_everything(clock):
+    message = FakeMessage()
+    for guard in (CommandGuard(user_limit=(1, 60), enabled=False), CommandGuard()):
+        assert all(guard.admit("一言", message) == (True, None) for _ in range(10))
+    assert guard.stats()["buckets"] == 0
@@ -0,0 +1,159 @@
+"""按像素宽度排版文字。
+
+每个字体的字形宽度只测量一次并缓存，之后行宽由查表求和得到，不再对整段文字反复调用 `textbbox`。
+"""
+
+import functools
+import re
+from typing import NamedTuple
+
+# 不能出现在行首的标点，放不下时连同上一个字一起换到下一行
+NO_LINE_START = frozenset("，。、；：！？）》」』】〕〉”’…～,.;:!?)]}%")
+# 不能出现在行尾的标点
+NO_LINE_END = frozenset("（《「『【〔〈“‘([{")
+ELLIPSIS = "…"
+
+# 连续的拉丁字母、数字组成一个单词，整体换行；其它字符（中日韩文字、标点、空格）各自可以断开
+_TOKEN_RE = re.compile(r"[0-9A-Za-zÀ-ɏ'’_\-]+|.", re.S)
+
+
+class GlyphTable:
+    """一个字体的字形宽度表"""
+
+    def __init__(self, font) -> None:
+        self.font = font
+        self._advances: dict = {}
+        ascent, descent = font.getmetrics()
+        self.ascent = ascent
+        self.line_height = ascent + descent
+
+    def advance(self, char: str) -> float:
+        width = self._advances.get(char)
+        if width is None:
+            width = self._advances[char] = self.font.getlength(char)
+        return width
+
+    def width(self, text: str) -> float:
+        return sum(self.advance(c) for c in text)
+
+
+@functools.lru_cache(maxsize=64)
+def glyph_table(font) -> GlyphTable:
+    """按字体对象缓存宽度表，字体本身由 `poster.load_font` 缓存"""
+    return GlyphTable(font)
+
+
+class TextLayout(NamedTuple):
+    font: object
+    lines: list
+    widths: list
+    # 行距，含行间空隙
+    line_height: float
+    spacing: float
+
+    @property
+    def width(self) -> float:
+        return max(self.widths, default=0)
+
+    @property
+    def height(self) -> float:
+        return len(self.lines) * self.line_height - self.spacing if self.lines else 0
+
+
+def _tokens(paragraph: str, table: GlyphTable, max_width: float) -> list:
+    tokens = []
+    for token in _TOKEN_RE.findall(paragraph):
+        if len(token) > 1 and table.width(token) > max_width:
+            # 比整行还长的单词只能逐字断开
+            tokens.extend(token)
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def break_lines(text: str, table: GlyphTable, max_width: float) -> list:
+    """贪心断行：每行尽量放满，保留原有的换行符，并避免标点出现在行首或行尾"""
+    lines = []
+    for paragraph in text.split("\n"):
+        line, width = [], 0.0
+        for token in _tokens(paragraph, table, max_width):
+            w = table.width(token)
+            if line and width + w > max_width:
+                if token.isspace():
+                    # 换行处的空格直接丢弃
+                    lines.append("".join(line).rstrip())
+                    line, width = [], 0.0
+                    continue
+                carry = []
+                if token in NO_LINE_START and len(line) > 1:
+                    carry.append(line.pop())
+                while len(line) > 1 and line[-1] in NO_LINE_END:
+                    carry.insert(0, line.pop())
+                lines.append("".join(line).rstrip())
+                line = carry
+                width = table.width("".join(carry))
+            line.append(token)
+            width += w
+        lines.append("".join(line).rstrip())
+    return lines
+
+
+def truncate(text: str, table: GlyphTable, max_width: float) -> str:
+    """超出宽度的单行文字截断并加省略号"""
+    if table.width(text) <= max_width:
+        return text
+    budget = max_width - table.advance(ELLIPSIS)
+    width = 0.0
+    for i, char in enumerate(text):
+        width += table.advance(char)
+        if width > budget:
+            return text[:i] + ELLIPSIS
+    return text
+
+
+def layout_text(
+    text: str, font, max_width: float, spacing_ratio: float = 0.15
+) -> TextLayout:
+    table = glyph_table(font)
+    lines = break_lines(text, table, max_width)
+    spacing = round(table.line_height * spacing_ratio)
+    return TextLayout(
+        font,
+        lines,
+        [table.width(line) for line in lines],
+        table.line_height + spacing,
+        spacing,
+    )
+
+
+def fit_text(
+    text: str,
+    get_font,
+    max_width: float,
+    max_height: float,
+    max_size: int,
+    min_size: int,
+    spacing_ratio: float = 0.15,
+) -> TextLayout:
+    """二分查找能放进 `max_width` × `max_height` 的最大字号，`get_font(size)` 返回对应字号的字体。
+
+    最小字号仍然放不下时，只保留能放下的行，最后一行截断并加省略号。
+    """
+    best = None
+    lo, hi = min_size, max(min_size, max_size)
+    while lo <= hi:
+        size = (lo + hi) // 2
+        layout = layout_text(text, get_font(size), max_width, spacing_ratio)
+        if layout.height <= max_height:
+            best, lo = layout, size + 1
+        else:
+            hi = size - 1
+    if best is not None:
+        return best
+
+    layout = layout_text(text, get_font(min_size), max_width, spacing_ratio)
+    max_lines = max(1, int((max_height + layout.spacing) // layout.line_height))
+    table = glyph_table(layout.font)
+    lines = layout.lines[:max_lines]
+    lines[-1] = truncate(lines[-1] + ELLIPSIS, table, max_width)
+    return layout._replace(lines=lines, widths=[table.width(line) for line in lines])
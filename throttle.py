@@ -0,0 +1,226 @@
+import copy
+import functools
+import inspect
+import logging
+import math
+import time
+from collections import OrderedDict
+
+from .cache import SingleFlight
+from .metrics import METRICS
+
+logger = logging.getLogger("astrbot")
+
+
+def parse_limit(text) -> tuple:
+    """`"5/60"` 表示 60 秒内最多 5 次，返回 (5, 60.0)；空字符串或 0 表示不限制，返回 None"""
+    text = str(text or "").strip()
+    if not text or text == "0":
+        return None
+    count, _, window = text.partition("/")
+    count, window = int(count), float(window or 60)
+    if count <= 0 or window <= 0:
+        raise ValueError(text)
+    return count, window
+
+
+def parse_command_limits(items: list) -> dict:
+    """每项为 `指令 用户限额 [群限额]`，如 `mcs 3/30 10/30`，限额写 - 表示不限制。格式错误的项忽略"""
+    policies = {}
+    for item in items or []:
+        parts = str(item).split()
+        try:
+            if len(parts) not in (2, 3):
+                raise ValueError(item)
+            user, group = (parts[1:] + ["-"])[:2]
+            policies[parts[0]] = (
+                None if user == "-" else parse_limit(user),
+                None if group == "-" else parse_limit(group),
+            )
+        except ValueError:
+            logger.warning(f"忽略格式错误的限流规则: {item}")
+    return policies
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "notified")
+
+    def __init__(self, tokens: float, now: float) -> None:
+        self.tokens = tokens
+        self.updated = now
+        # 本次被限流后是否已经提示过，避免刷屏时每条都回复
+        self.notified = False
+
+
+class RateLimiter:
+    """按键（用户、群）分别计数的令牌桶：容量 `capacity`，每 `window` 秒补满。
+
+    桶的数量有上限，按最近使用淘汰；被淘汰的桶相当于已经补满。
+    """
+
+    def __init__(self, capacity: int, window: float, max_keys: int = 10000) -> None:
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def bucket(self, key, now: float) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(float(self.capacity), now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(
+                self.capacity, bucket.tokens + (now - bucket.updated) * self.rate
+            )
+            bucket.updated = now
+        return bucket
+
+    def wait_time(self, bucket: _Bucket) -> float:
+        return (1 - bucket.tokens) / self.rate
+
+
+class CommandGuard:
+    """指令的限流和请求合并。
+
+    - 每个用户、每个群各有一个令牌桶，所有指令共用；`command_limits` 可以为单个指令另设更严格的桶；
+    - 被限流的请求在任何 I/O 之前直接拒绝，同一个桶在恢复前只提示一次；
+    - 合并键相同的并发请求只执行一次处理函数，共享同一个结果。
+    """
+
+    def __init__(
+        self,
+        user_limit: tuple = None,
+        group_limit: tuple = None,
+        command_limits: dict = None,
+        on_reject=None,
+        enabled: bool = True,
+        max_keys: int = 10000,
+    ) -> None:
+        self.enabled = enabled
+        # (scope, 指令或 None, limiter)
+        self._limiters = []
+        if user_limit:
+            self._limiters.append(("user", None, RateLimiter(*user_limit, max_keys)))
+        if group_limit:
+            self._limiters.append(("group", None, RateLimiter(*group_limit, max_keys)))
+        self._command_limiters: dict = {}
+        for command, (user, group) in (command_limits or {}).items():
+            limiters = []
+            if user:
+                limiters.append(("user", command, RateLimiter(*user, max_keys)))
+            if group:
+                limiters.append(("group", command, RateLimiter(*group, max_keys)))
+            self._command_limiters[command] = limiters
+        # on_reject(scope, 需要等待的秒数) 返回拒绝时回复的内容
+        self.on_reject = on_reject
+        self.flight = SingleFlight()
+        self.rejected = 0
+
+    def admit(self, command: str, message) -> tuple:
+        """返回 (是否放行, 拒绝时的回复)。回复为 None 时不回复"""
+        if not self.enabled:
+            return True, None
+        limiters = self._limiters + self._command_limiters.get(command, [])
+        if not limiters:
+            return True, None
+        now = time.monotonic()
+        user = (message.get_platform_name(), message.get_sender_id())
+        group = message.unified_msg_origin
+        buckets = []
+        for scope, _, limiter in limiters:
+            bucket = limiter.bucket(user if scope == "user" else group, now)
+            if bucket.tokens < 1:
+                self.rejected += 1
+                METRICS.inc("command_throttled", command=command, scope=scope)
+                if bucket.notified or self.on_reject is None:
+                    return False, None
+                bucket.notified = True
+                return False, self.on_reject(scope, limiter.wait_time(bucket))
+            buckets.append(bucket)
+        # 所有桶都有余量才扣减，被拒绝的请求不消耗其它桶
+        for bucket in buckets:
+            bucket.tokens -= 1
+            bucket.notified = False
+        return True, None
+
+    def stats(self) -> dict:
+        return {
+            "rejected": self.rejected,
+            "coalesced": self.flight.shared,
+            "inflight": len(self.flight),
+            "buckets": sum(
+                len(limiter)
+                for _, _, limiter in self._limiters
+                + [x for limiters in self._command_limiters.values() for x in limiters]
+            ),
+        }
+
+
+def retry_after_text(seconds: float) -> str:
+    return f"{max(1, math.ceil(seconds))} 秒"
+
+
+def _copy_result(result):
+    # 事件管线会往结果的消息链里添加 @、回复等，共享的结果每个请求各自复制一份
+    chain = getattr(result, "chain", None)
+    if not isinstance(chain, list):
+        return result
+    clone = copy.copy(result)
+    clone.chain = list(chain)
+    return clone
+
+
+def normalized_text(plugin, message) -> str:
+    """按空白规范化后的消息合并"""
+    return " ".join(message.message_str.split())
+
+
+def message_text(plugin, message) -> str:
+    """按原始消息合并，用于结果与空白有关的指令"""
+    return message.message_str
+
+
+def guarded(command: str, coalesce=None):
+    """指令限流和请求合并。放在 `@filter.command` 之下、`@instrumented` 之上，插件需有 `command_guard` 属性。
+
+    `coalesce(plugin, message)` 返回合并键，返回 None 时不合并；异步生成器形式的处理函数只限流。
+    """
+
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def gen_wrapper(plugin, message, *args, **kwargs):
+                admitted, reply = plugin.command_guard.admit(command, message)
+                if not admitted:
+                    if reply is not None:
+                        yield reply
+                    return
+                async for item in func(plugin, message, *args, **kwargs):
+                    yield item
+
+            return gen_wrapper
+
+        @functools.wraps(func)
+        async def wrapper(plugin, message, *args, **kwargs):
+            guard = plugin.command_guard
+            admitted, reply = guard.admit(command, message)
+            if not admitted:
+                return reply
+            key = coalesce(plugin, message) if coalesce is not None and guard.enabled else None
+            if key is None:
+                return await func(plugin, message, *args, **kwargs)
+            result = await guard.flight.do(
+                (command, key), lambda: func(plugin, message, *args, **kwargs)
+            )
+            return _copy_result(result)
+
+        return wrapper
+
+    return decorator